@@ -0,0 +1,275 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Any, Dict, Optional, Protocol, Tuple, Type
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.util.concurrency import await_only, in_greenlet
+from sqlmodel import Session, SQLModel
+
+from app.config import env_int, env_str
+
+try:
+    import redis
+except ImportError:  # redis es opcional: sólo hace falta con CACHE_BACKEND=redis
+    redis = None
+
+# Marca que deja `invalidate` en lugar de la entrada borrada (ver EntityCache).
+INVALIDADO = "_invalidado"
+
+
+def _min_version(current: dict) -> int:
+    """Versión mínima que puede reemplazar a `current`: la de la marca de invalidación o la de la entidad."""
+    return current.get(INVALIDADO, current.get("version", 0))
+
+
+class CacheBackend(Protocol):
+    """Almacenamiento clave/valor usado por EntityCache (en proceso, Redis, etc.)."""
+
+    def get(self, key: str) -> Optional[dict]: ...
+
+    def set(self, key: str, value: dict) -> None: ...
+
+    def set_if_newer(self, key: str, value: dict, version: int) -> bool: ...
+
+    def delete(self, *keys: str) -> None: ...
+
+    def clear(self) -> None: ...
+
+
+class MemoryCache:
+    """Caché LRU en memoria con vencimiento por TTL, segura entre threads."""
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: dict) -> None:
+        with self._lock:
+            self._store(key, value)
+
+    def set_if_newer(self, key: str, value: dict, version: int) -> bool:
+        """Guarda `value` salvo que la entrada vigente exija una versión mayor; lee y escribe bajo el mismo lock."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] >= time.monotonic() and version < _min_version(entry[1]):
+                return False
+            self._store(key, value)
+            return True
+
+    def _store(self, key: str, value: dict) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, *keys: str) -> None:
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class NullCache:
+    """Backend que no guarda nada (caché deshabilitada)."""
+
+    def get(self, key: str) -> Optional[dict]:
+        return None
+
+    def set(self, key: str, value: dict) -> None:
+        pass
+
+    def set_if_newer(self, key: str, value: dict, version: int) -> bool:
+        return False
+
+    def delete(self, *keys: str) -> None:
+        pass
+
+    def clear(self) -> None:
+        pass
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+
+# Lua de `RedisCache.set_if_newer`: compara con la entrada vigente y guarda en un solo paso atómico.
+SET_IF_NEWER_LUA = """
+local actual = redis.call('GET', KEYS[1])
+if actual then
+    local datos = cjson.decode(actual)
+    local minima = tonumber(datos['%s'] or datos['version'] or 0)
+    if tonumber(ARGV[2]) < minima then
+        return 0
+    end
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+return 1
+""" % INVALIDADO
+
+
+class RedisCache:
+    """Adaptador para un cliente compatible con Redis (get/set con `ex`/delete/scan_iter/register_script).
+
+    El cliente es bloqueante. Con DB_ASYNC los handlers sync corren en un greenlet sobre el event
+    loop (ver routers_async): ahí cada llamada se hace en el threadpool y el greenlet cede el loop
+    con `await_only` mientras espera, para no frenar a los demás requests del worker. Fuera de ese
+    greenlet (modo sync, trabajos en segundo plano) se llama directo.
+    """
+
+    def __init__(self, client, prefix: str = "autos-api:", ttl: float = 300.0):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self._set_if_newer = None
+
+    @staticmethod
+    def _run(func, *args, **kwargs):
+        if in_greenlet():
+            return await_only(run_in_threadpool(func, *args, **kwargs))
+        return func(*args, **kwargs)
+
+    def get(self, key: str) -> Optional[dict]:
+        raw = self._run(self.client.get, self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: dict) -> None:
+        self._run(self.client.set, self.prefix + key, json.dumps(value, default=_json_default), ex=int(self.ttl))
+
+    def set_if_newer(self, key: str, value: dict, version: int) -> bool:
+        if self._set_if_newer is None:
+            self._set_if_newer = self.client.register_script(SET_IF_NEWER_LUA)
+        raw = json.dumps(value, default=_json_default)
+        return bool(self._run(self._set_if_newer, keys=[self.prefix + key], args=[raw, version, int(self.ttl)]))
+
+    def delete(self, *keys: str) -> None:
+        if keys:
+            self._run(self.client.delete, *(self.prefix + key for key in keys))
+
+    def clear(self) -> None:
+        self._run(self._clear)
+
+    def _clear(self) -> None:
+        for key in self.client.scan_iter(match=self.prefix + "*"):
+            self.client.delete(key)
+
+
+class EntityCache:
+    """Caché read-through de entidades por clave, con contadores de aciertos y fallos.
+
+    `invalidate` no borra la entrada: deja una marca con la versión mínima que puede volver a
+    guardarse. Así un lector que leyó la fila antes del commit de una escritura no puede volver
+    a guardar la versión vieja después de la invalidación.
+    """
+
+    def __init__(self, backend: CacheBackend, namespace: str):
+        self.backend = backend
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def get(self, key: str) -> Optional[dict]:
+        value = self.backend.get(self._key(key))
+        if value is not None and INVALIDADO in value:
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key: str, value: dict) -> None:
+        """Guarda `value` salvo que haya una marca de invalidación o una entidad de versión mayor.
+
+        La comparación y la escritura son un solo paso atómico del backend: entre ambas no puede
+        colarse un `invalidate` concurrente.
+        """
+        self.backend.set_if_newer(self._key(key), value, value.get("version", 0))
+
+    def invalidate(self, *keys: str, version: int = 0) -> None:
+        """Descarta las entradas; hasta que venzan por TTL sólo se aceptan versiones >= `version`."""
+        for key in keys:
+            self.backend.set(self._key(key), {INVALIDADO: version})
+
+    def clear(self) -> None:
+        self.backend.clear()
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / total, 4) if total else 0.0,
+        }
+
+
+def entity_data(instance: SQLModel) -> dict:
+    """Columnas de una entidad como dict, listo para guardar en la caché."""
+    return {attr.key: getattr(instance, attr.key) for attr in sa_inspect(type(instance)).column_attrs}
+
+
+def attach(session: Session, model: Type[SQLModel], data: dict) -> SQLModel:
+    """Reconstruye una entidad desde la caché y la asocia a la sesión sin consultar la BD."""
+    instance = model.model_validate(data)
+    make_transient_to_detached(instance)
+    return session.merge(instance, load=False)
+
+
+def build_backend(namespace: str) -> CacheBackend:
+    backend = env_str("CACHE_BACKEND", "memory")
+    ttl = env_int("CACHE_TTL", 300)
+    if backend == "none":
+        return NullCache()
+    if backend == "redis":
+        if redis is None:
+            raise ValueError("CACHE_BACKEND=redis requiere el paquete redis")
+        client = redis.Redis.from_url(env_str("CACHE_REDIS_URL", "redis://localhost:6379/0"))
+        return RedisCache(client, prefix=f"autos-api:{namespace}:", ttl=ttl)
+    if backend != "memory":
+        raise ValueError(f"CACHE_BACKEND desconocido: {backend}")
+    return MemoryCache(maxsize=env_int("CACHE_MAXSIZE", 10000), ttl=ttl)
+
+
+auto_cache = EntityCache(build_backend("auto"), "auto")
+venta_cache = EntityCache(build_backend("venta"), "venta")
+
+
+def clear_all() -> None:
+    auto_cache.clear()
+    venta_cache.clear()
@@ -0,0 +1,343 @@
+import asyncio
+import json
+import logging
+import select as io_select
+import threading
+from collections import deque
+from datetime import timedelta
+from typing import AsyncIterator, Callable, Iterable, List, Optional, Sequence, Set, Tuple
+
+import orjson
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, event, func, insert
+from sqlalchemy.engine import Engine, Row
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session, select
+
+from app.config import env_int
+from app.database import engine
+from app.models import Venta, VentaCambio, VentaRead
+from app.utils import chunked, utcnow
+
+logger = logging.getLogger(__name__)
+
+# Eventos en espera por suscriptor. Un cliente lento que la llena no frena a los demás:
+# se descartan sus eventos en memoria y se pone al día leyendo venta_cambio.
+STREAM_BUFFER = env_int("VENTAS_STREAM_BUFFER", 1000)
+# Comentario SSE para que proxies y balanceadores no corten una conexión sin eventos.
+STREAM_KEEPALIVE_SECONDS = env_int("VENTAS_STREAM_KEEPALIVE", 15)
+RETENCION_HORAS = env_int("VENTAS_CAMBIOS_RETENCION_HORAS", 72)
+CATCHUP_PAGE = 500
+# Canal de LISTEN/NOTIFY; el payload de NOTIFY admite hasta 8000 bytes.
+CANAL = "venta_cambios"
+NOTIFY_CHUNK = 200
+
+CREADA, MODIFICADA, ELIMINADA = "creada", "modificada", "eliminada"
+
+# (id del evento, id de la venta, tipo)
+Cambio = Tuple[int, int, str]
+
+PENDING_KEY = "cambios_pendientes"
+VENTA_FIELDS = list(VentaRead.model_fields)
+# Posición del id de la venta en las filas de ChangeFeed._select (None si ya no existe).
+_VENTA_ID = 3 + VENTA_FIELDS.index("id")
+
+
+def record(session: Session, tipo: str, venta_ids: Iterable[int]) -> None:
+    """Anota los cambios en venta_cambio, en la transacción de la sesión; se publican al confirmarla.
+
+    En PostgreSQL se publican con NOTIFY, que también es transaccional y llega a todos los
+    procesos; en el resto, al broker del proceso en el after_commit de la sesión.
+    """
+    venta_ids = list(venta_ids)
+    if not venta_ids:
+        return
+    # Como en VentaRepository.create_multiple: los ids siguen el orden de los VALUES.
+    ids = sorted(session.scalars(
+        insert(VentaCambio).returning(VentaCambio.id),
+        [{"venta_id": venta_id, "tipo": tipo} for venta_id in venta_ids],
+    ).all())
+    cambios = [(id_, venta_id, tipo) for id_, venta_id in zip(ids, venta_ids)]
+    if session.get_bind().dialect.name == "postgresql":
+        for lote in chunked(cambios, NOTIFY_CHUNK):
+            session.execute(select(func.pg_notify(CANAL, json.dumps(lote))))
+    else:
+        session.info.setdefault(PENDING_KEY, []).extend(cambios)
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _publish_pending(session: OrmSession) -> None:
+    cambios = session.info.pop(PENDING_KEY, None)
+    if cambios:
+        broker.publish(cambios)
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def _discard_pending(session: OrmSession) -> None:
+    session.info.pop(PENDING_KEY, None)
+
+
+class Subscription:
+    """Eventos pendientes de un cliente del stream, atendidos en su event loop.
+
+    Si se acumulan más de `maxsize` (cliente lento) se descartan y queda marcada como
+    desbordada: el stream se pone al día desde venta_cambio, sin frenar a los demás.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxsize: int):
+        self.loop = loop
+        self.maxsize = maxsize
+        self.pending: deque = deque()
+        self.ready = asyncio.Event()
+        self.overflowed = False
+
+    def deliver(self, cambios: Sequence[Cambio]) -> None:
+        if self.overflowed or len(self.pending) + len(cambios) > self.maxsize:
+            self.pending.clear()
+            self.overflowed = True
+        else:
+            self.pending.extend(cambios)
+        self.ready.set()
+
+    def resync(self) -> None:
+        self.pending.clear()
+        self.overflowed = True
+        self.ready.set()
+
+    async def wait(self, timeout: float) -> List[Cambio]:
+        """Los eventos pendientes; TimeoutError si no llega ninguno en `timeout` segundos."""
+        await asyncio.wait_for(self.ready.wait(), timeout)
+        self.ready.clear()
+        cambios = list(self.pending)
+        self.pending.clear()
+        return cambios
+
+    def reset(self) -> None:
+        self.pending.clear()
+        self.overflowed = False
+        self.ready.clear()
+
+
+class ChangeBroker:
+    """Reparte los cambios confirmados entre los suscriptores del proceso.
+
+    `publish` puede llamarse desde cualquier thread (commits en el threadpool, el listener de
+    PostgreSQL); cada entrega se agenda en el event loop del suscriptor.
+    """
+
+    def __init__(self, maxsize: int = STREAM_BUFFER):
+        self.maxsize = maxsize
+        self._subscriptions: Set[Subscription] = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self) -> Subscription:
+        subscription = Subscription(asyncio.get_running_loop(), self.maxsize)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def _notify_all(self, method: Callable[[Subscription], Callable], *args) -> None:
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(method(subscription), *args)
+            except RuntimeError:
+                # El loop ya se cerró; el stream se desuscribe al terminar.
+                pass
+
+    def publish(self, cambios: Sequence[Cambio]) -> None:
+        if cambios:
+            self._notify_all(lambda subscription: subscription.deliver, list(cambios))
+
+    def resync(self) -> None:
+        """Fuerza a todos los suscriptores a releer venta_cambio (p. ej. tras perder notificaciones)."""
+        self._notify_all(lambda subscription: subscription.resync)
+
+
+broker = ChangeBroker()
+
+
+class PostgresListener:
+    """Thread con una conexión propia (fuera del pool) que hace LISTEN y pasa las notificaciones al broker."""
+
+    def __init__(self, engine: Engine, broker: ChangeBroker):
+        self.engine = engine
+        self.broker = broker
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _connect(self):
+        cargs, cparams = self.engine.dialect.create_connect_args(self.engine.url)
+        connection = self.engine.dialect.connect(*cargs, **cparams)
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {CANAL}")
+        return connection
+
+    def _listen(self) -> None:
+        connection = self._connect()
+        try:
+            # Lo publicado mientras no había conexión se recupera desde venta_cambio.
+            self.broker.resync()
+            while not self._stopping.is_set():
+                if io_select.select([connection], [], [], 1.0) == ([], [], []):
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    notify = connection.notifies.pop(0)
+                    self.broker.publish([tuple(cambio) for cambio in json.loads(notify.payload)])
+        finally:
+            connection.close()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                self._listen()
+            except Exception:
+                logger.exception("Se perdió la conexión de LISTEN %s; reintentando", CANAL)
+                self._stopping.wait(5)
+
+    def start(self) -> None:
+        if self.engine.dialect.name != "postgresql":
+            return
+        if self.engine.dialect.driver != "psycopg2":
+            logger.warning("LISTEN/NOTIFY requiere psycopg2: /ventas/stream sólo verá cambios de este proceso "
+                           "al reconectarse")
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="venta-cambios", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+listener = PostgresListener(engine, broker)
+
+
+class RecentIds:
+    """Ids de los últimos eventos enviados, para no repetirlos al ponerse al día."""
+
+    def __init__(self, size: int):
+        self._order: deque = deque(maxlen=size)
+        self._ids: Set[int] = set()
+
+    def __contains__(self, event_id: int) -> bool:
+        return event_id in self._ids
+
+    def add(self, event_id: int) -> None:
+        if len(self._order) == self._order.maxlen:
+            self._ids.discard(self._order[0])
+        self._order.append(event_id)
+        self._ids.add(event_id)
+
+    def oldest(self) -> Optional[int]:
+        return min(self._order) if self._order else None
+
+
+def format_event(row: Row) -> str:
+    """Evento SSE: id y tipo del cambio, y la venta (sólo su id si se eliminó)."""
+    if row.tipo != ELIMINADA and row[_VENTA_ID] is not None:
+        data = dict(zip(VENTA_FIELDS, row[3:]))
+    else:
+        data = {"id": row.venta_id}
+    return f"id: {row.id}\nevent: {row.tipo}\ndata: {orjson.dumps(data).decode()}\n\n"
+
+
+class ChangeFeed:
+    """Stream de cambios de un cliente: replay desde venta_cambio y luego los eventos del broker."""
+
+    def __init__(self, session_factory: Callable[[], Session], broker: ChangeBroker = broker,
+                 keepalive: float = STREAM_KEEPALIVE_SECONDS, page_size: int = CATCHUP_PAGE):
+        self.session_factory = session_factory
+        self.broker = broker
+        self.keepalive = keepalive
+        self.page_size = page_size
+
+    def _select(self):
+        # Se lee la venta en su estado actual: el registro sólo guarda qué cambió.
+        return (
+            select(VentaCambio.id, VentaCambio.tipo, VentaCambio.venta_id,
+                   *(getattr(Venta, name) for name in VENTA_FIELDS))
+            .outerjoin(Venta, Venta.id == VentaCambio.venta_id)
+            .order_by(VentaCambio.id)
+        )
+
+    def _rows_after(self, after: int) -> Sequence[Row]:
+        with self.session_factory() as session:
+            return session.execute(self._select().where(VentaCambio.id > after).limit(self.page_size)).all()
+
+    def _rows_for(self, ids: List[int]) -> Sequence[Row]:
+        with self.session_factory() as session:
+            return session.execute(self._select().where(VentaCambio.id.in_(ids))).all()
+
+    def _bounds(self) -> Tuple[Optional[int], Optional[int]]:
+        with self.session_factory() as session:
+            return tuple(session.execute(select(func.min(VentaCambio.id), func.max(VentaCambio.id))).one())
+
+    async def events(self, last_event_id: Optional[int] = None) -> AsyncIterator[str]:
+        subscription = self.broker.subscribe()
+        enviados = RecentIds(self.broker.maxsize)
+        try:
+            yield f"retry: {int(self.keepalive * 1000)}\n\n"
+            minimo, maximo = await run_in_threadpool(self._bounds)
+            if last_event_id is None:
+                last_id, catchup = maximo or 0, False
+            else:
+                last_id, catchup = last_event_id, True
+                if minimo is not None and last_event_id < minimo - 1:
+                    # Los eventos siguientes a Last-Event-ID ya se podaron: el cliente debe releer el listado.
+                    yield "event: reinicio\ndata: {}\n\n"
+            while True:
+                if catchup or subscription.overflowed:
+                    subscription.reset()
+                    # Desde el más viejo de los recientes: un commit más lento puede haber
+                    # confirmado un id menor que el último enviado.
+                    after = min(last_id, enviados.oldest() or last_id)
+                    while True:
+                        rows = await run_in_threadpool(self._rows_after, after)
+                        for row in rows:
+                            if row.id not in enviados:
+                                enviados.add(row.id)
+                                last_id = max(last_id, row.id)
+                                yield format_event(row)
+                        if len(rows) < self.page_size:
+                            break
+                        after = rows[-1].id
+                    catchup = False
+                    continue
+                try:
+                    cambios = await subscription.wait(self.keepalive)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                ids = [cambio[0] for cambio in cambios if cambio[0] not in enviados]
+                if not ids:
+                    continue
+                for row in await run_in_threadpool(self._rows_for, ids):
+                    enviados.add(row.id)
+                    last_id = max(last_id, row.id)
+                    yield format_event(row)
+        finally:
+            self.broker.unsubscribe(subscription)
+
+
+change_feed = ChangeFeed(lambda: Session(engine))
+
+
+def get_change_feed() -> ChangeFeed:
+    return change_feed
+
+
+def prune(session: Session, horas: int = RETENCION_HORAS) -> int:
+    """Borra los cambios más viejos que `horas`; un Last-Event-ID anterior recibe el evento `reinicio`."""
+    result = session.execute(delete(VentaCambio).where(VentaCambio.created_at < utcnow() - timedelta(hours=horas)))
+    return result.rowcount
@@ -0,0 +1,109 @@
+import threading
+from typing import List, Sequence
+
+from sqlalchemy import Sequence as DBSequence, update
+from sqlmodel import Session, SQLModel
+
+from app.config import env_int, env_str
+from app.models import ChasisSecuencia
+from app.utils import VIN_CHARS, vin_check_digit, vin_year_code
+
+# Números de serie que cada proceso reserva de una vez: una consulta cada BLOCK_SIZE altas.
+BLOCK_SIZE = 1000
+# Fila de chasis_secuencia (la crea la migración 0002 o el after_create del modelo).
+SERIE = "auto"
+# Identificador de fabricante (posiciones 1-3 del VIN).
+WMI = env_str("CHASIS_WMI", "8AT")
+MAX_INTENTOS = env_int("CHASIS_MAX_INTENTOS", 3)
+
+# En PostgreSQL la reserva usa una SEQUENCE (no transaccional, sin bloqueos); en el resto,
+# una fila de chasis_secuencia que se incrementa con UPDATE ... RETURNING.
+CHASIS_SEQUENCE = DBSequence("chasis_serie_seq", start=1, increment=BLOCK_SIZE, metadata=SQLModel.metadata)
+
+
+def encode_serial(numero: int, largo: int = 12) -> str:
+    """Codifica `numero` en base 33 con los caracteres válidos de un VIN."""
+    digitos = []
+    for _ in range(largo):
+        numero, resto = divmod(numero, len(VIN_CHARS))
+        digitos.append(VIN_CHARS[resto])
+    if numero:
+        raise ValueError("Número de serie fuera de rango.")
+    return "".join(reversed(digitos))
+
+
+def build_vin(numero: int, año: int, wmi: str = WMI) -> str:
+    """VIN de 17 caracteres: WMI, serie (posiciones 4-8, 11-17), verificador y código de año."""
+    serie = encode_serial(numero)
+    vin = f"{wmi}{serie[:5]}0{vin_year_code(año)}{serie[5:]}"
+    return vin[:8] + vin_check_digit(vin) + vin[9:]
+
+
+class ChasisAllocator:
+    """Asigna números de chasis únicos a partir de bloques de una secuencia reservados en la BD.
+
+    Cada proceso toma bloques de BLOCK_SIZE números, así que dos workers nunca generan el
+    mismo chasis y no hace falta consultar si un número está libre. El índice único sobre
+    `numero_chasis` cubre los casos restantes (chasis cargados a mano o una secuencia
+    reiniciada): el repositorio reintenta el INSERT con otro bloque.
+    """
+
+    def __init__(self, block_size: int = BLOCK_SIZE):
+        self.block_size = block_size
+        self._ranges: List[range] = []
+        # El lock nunca se mantiene durante una consulta: en modo async varios requests
+        # comparten el thread del event loop.
+        self._lock = threading.Lock()
+
+    def _reserve_block(self, session: Session) -> range:
+        bind = session.get_bind()
+        if bind.dialect.name == "postgresql":
+            inicio = session.execute(CHASIS_SEQUENCE.next_value()).scalar_one()
+        else:
+            # Se confirma en una sesión aparte, como nextval: un rollback del INSERT no devuelve el
+            # bloque, así que dos procesos nunca reciben los mismos números.
+            table = ChasisSecuencia.__table__
+            with Session(bind) as reserva:
+                siguiente = reserva.execute(
+                    update(table)
+                    .where(table.c.nombre == SERIE)
+                    .values(siguiente=table.c.siguiente + self.block_size)
+                    .returning(table.c.siguiente)
+                ).scalar()
+                reserva.commit()
+            if siguiente is None:
+                raise RuntimeError("Falta la fila de chasis_secuencia: ejecutar `python -m app.cli migrar`.")
+            inicio = siguiente - self.block_size
+        return range(inicio, inicio + self.block_size)
+
+    def _take(self, cantidad: int) -> List[int]:
+        numeros: List[int] = []
+        with self._lock:
+            while self._ranges and len(numeros) < cantidad:
+                bloque = self._ranges[0]
+                tomados = bloque[:cantidad - len(numeros)]
+                numeros.extend(tomados)
+                resto = bloque[len(tomados):]
+                if resto:
+                    self._ranges[0] = resto
+                else:
+                    self._ranges.pop(0)
+        return numeros
+
+    def allocate(self, session: Session, años: Sequence[int]) -> List[str]:
+        """Un número de chasis por cada año modelo de `años`."""
+        numeros = self._take(len(años))
+        while len(numeros) < len(años):
+            bloque = self._reserve_block(session)
+            with self._lock:
+                self._ranges.append(bloque)
+            numeros.extend(self._take(len(años) - len(numeros)))
+        return [build_vin(numero, año) for numero, año in zip(numeros, años)]
+
+    def discard(self) -> None:
+        """Descarta los bloques en memoria, p. ej. tras una colisión (la secuencia quedó atrás de los datos)."""
+        with self._lock:
+            self._ranges.clear()
+
+
+chasis_allocator = ChasisAllocator()
@@ -0,0 +1,124 @@
+import argparse
+from datetime import date
+from pathlib import Path
+from typing import Optional, Sequence
+
+from alembic import command
+from alembic.config import Config
+from sqlmodel import Session
+
+from app import cambios, particiones, stats
+from app.database import engine
+from app.search import rebuild_search_indexes
+
+
+ALEMBIC_INI = Path(__file__).resolve().parent.parent / "alembic.ini"
+
+
+def alembic_config(url: Optional[str] = None) -> Config:
+    config = Config(str(ALEMBIC_INI))
+    if url:
+        config.set_main_option("sqlalchemy.url", url)
+    return config
+
+
+def migrate(args: argparse.Namespace) -> None:
+    command.upgrade(alembic_config(args.url), args.revision)
+    print(f"Base de datos migrada a {args.revision}.")
+
+
+def reindex_search(args: argparse.Namespace) -> None:
+    with engine.begin() as connection:
+        rebuild_search_indexes(connection)
+    print("Índices de búsqueda reconstruidos.")
+
+
+def rebuild_stats(args: argparse.Namespace) -> None:
+    with Session(engine) as session:
+        grupos = stats.rebuild(session)
+        session.commit()
+    print(f"Resumen de ventas reconstruido: {grupos} grupos de modelo y mes.")
+
+
+def prune_changes(args: argparse.Namespace) -> None:
+    with Session(engine) as session:
+        borrados = cambios.prune(session, args.horas)
+        session.commit()
+    print(f"Cambios de ventas borrados: {borrados}.")
+
+
+def _month(value: str) -> date:
+    try:
+        return date.fromisoformat(f"{value}-01")
+    except ValueError:
+        raise argparse.ArgumentTypeError("usar el formato AAAA-MM")
+
+
+def _partitions(action):
+    try:
+        with engine.begin() as connection:
+            return action(connection)
+    except particiones.PartitioningNotSupported as e:
+        raise SystemExit(str(e))
+
+
+def partition_ventas(args: argparse.Namespace) -> None:
+    creadas = _partitions(lambda connection: particiones.convert(connection, args.meses))
+    print(f"Tabla venta particionada por mes: {len(creadas)} particiones." if creadas
+          else "La tabla venta ya estaba particionada.")
+
+
+def create_partitions(args: argparse.Namespace) -> None:
+    creadas = _partitions(lambda connection: particiones.ensure_partitions(connection, args.meses))
+    print(f"Particiones al día hasta {creadas[-1]}.")
+
+
+def archive_partitions(args: argparse.Namespace) -> None:
+    archivadas = _partitions(lambda connection: particiones.archive(connection, args.antes))
+    if archivadas and not args.sin_estadisticas:
+        # Las ventas archivadas dejan de consultarse: el resumen se regenera sin ellas.
+        rebuild_stats(args)
+    print(f"Particiones archivadas: {', '.join(archivadas) or 'ninguna'}.")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Tareas de mantenimiento de la base de datos.")
+    commands = parser.add_subparsers(dest="comando", required=True)
+
+    migrar = commands.add_parser("migrar", help="Aplica las migraciones pendientes del esquema.")
+    migrar.add_argument("revision", nargs="?", default="head", help="revisión destino (por defecto head)")
+    migrar.add_argument("--url", help="URL de la base (por defecto DATABASE_URL)")
+    migrar.set_defaults(func=migrate)
+
+    reindex = commands.add_parser("reindexar-busqueda", help="Reconstruye los índices de búsqueda (backfill).")
+    reindex.set_defaults(func=reindex_search)
+
+    rebuild = commands.add_parser("reconstruir-estadisticas", help="Regenera el resumen de ventas (backfill).")
+    rebuild.set_defaults(func=rebuild_stats)
+
+    podar = commands.add_parser("podar-cambios", help="Borra los cambios de ventas viejos de /ventas/stream.")
+    podar.add_argument("--horas", type=int, default=cambios.RETENCION_HORAS, help="antigüedad a conservar")
+    podar.set_defaults(func=prune_changes)
+
+    particionar = commands.add_parser("particionar-ventas",
+                                      help="Convierte venta en una tabla particionada por mes (PostgreSQL).")
+    particionar.add_argument("--meses", type=int, default=particiones.PARTICIONES_ADELANTE,
+                             help="meses siguientes al actual a crear")
+    particionar.set_defaults(func=partition_ventas)
+
+    crear = commands.add_parser("crear-particiones", help="Crea las particiones del mes actual y los siguientes.")
+    crear.add_argument("--meses", type=int, default=particiones.PARTICIONES_ADELANTE,
+                       help="meses siguientes al actual a crear")
+    crear.set_defaults(func=create_partitions)
+
+    archivar = commands.add_parser("archivar-particiones", help="Separa las particiones de meses anteriores a --antes.")
+    archivar.add_argument("--antes", type=_month, required=True, help="primer mes que se conserva (AAAA-MM)")
+    archivar.add_argument("--sin-estadisticas", action="store_true", help="no regenerar el resumen de ventas")
+    archivar.set_defaults(func=archive_partitions)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipResponder, IdentityResponder
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.config import env_int
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él sólo se negocia gzip
+    brotli = None
+
+# Las respuestas más chicas se envían sin comprimir: el ahorro no compensa el CPU.
+COMPRESSION_MIN_SIZE = env_int("COMPRESSION_MIN_SIZE", 1024)
+GZIP_LEVEL = env_int("COMPRESSION_GZIP_LEVEL", 6)
+# Calidad 4 comprime más que gzip -6 con un costo de CPU parecido; 11 es demasiado lenta para respuestas dinámicas.
+BROTLI_QUALITY = env_int("COMPRESSION_BROTLI_QUALITY", 4)
+
+
+class BrotliResponder(IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app: ASGIApp, minimum_size: int, quality: int = BROTLI_QUALITY) -> None:
+        super().__init__(app, minimum_size)
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        if more_body:
+            # flush para que cada bloque de un export en streaming llegue al cliente sin esperar al siguiente.
+            return self.compressor.process(body) + self.compressor.flush()
+        return self.compressor.process(body) + self.compressor.finish()
+
+
+def accepted_encodings(header: str) -> Dict[str, float]:
+    """Codificaciones de Accept-Encoding con su peso q (`gzip;q=0.5` -> {"gzip": 0.5})."""
+    encodings = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name:
+            encodings[name.strip().lower()] = q
+    return encodings
+
+
+def negotiate(header: str, brotli_available: bool = brotli is not None) -> Optional[str]:
+    """Codificación a usar: br si el cliente la acepta (y está instalado brotli), si no gzip, si no ninguna."""
+    encodings = accepted_encodings(header)
+    candidates = ("br", "gzip") if brotli_available else ("gzip",)
+    weights = {name: encodings.get(name, encodings.get("*", 0.0)) for name in candidates}
+    best = max(candidates, key=lambda name: weights[name])
+    return best if weights[best] > 0 else None
+
+
+class CompressionMiddleware:
+    """Comprime con brotli o gzip, según Accept-Encoding, las respuestas de al menos `minimum_size` bytes.
+
+    Como el GZipMiddleware de Starlette (del que reusa los responders): agrega `Vary: Accept-Encoding`,
+    respeta las respuestas que ya traen Content-Encoding y no comprime `text/event-stream`.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION_MIN_SIZE, gzip_level: int = GZIP_LEVEL,
+                 brotli_quality: int = BROTLI_QUALITY) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("Accept-Encoding", ""))
+        if encoding == "br":
+            responder = BrotliResponder(self.app, self.minimum_size, self.brotli_quality)
+        elif encoding == "gzip":
+            responder = GZipResponder(self.app, self.minimum_size, compresslevel=self.gzip_level)
+        else:
+            responder = IdentityResponder(self.app, self.minimum_size)
+        await responder(scope, receive, send)
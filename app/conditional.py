@@ -0,0 +1,88 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException, Request, Response, status
+
+
+def make_etag(*parts: Any) -> str:
+    """ETag fuerte derivado de las partes que identifican la versión de un recurso."""
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()[:20]
+    return f'"{digest}"'
+
+
+def version_etag(kind: str, entity_id: int, *versions: Optional[int]) -> str:
+    """ETag de una entidad que lleva sus versiones (`"auto-12-3"`), para validar If-Match en el UPDATE."""
+    return '"' + "-".join(str(part) for part in (kind, entity_id, *versions)) + '"'
+
+
+def latest(values: Iterable[Optional[datetime]]) -> Optional[datetime]:
+    return max((value for value in values if value is not None), default=None)
+
+
+def http_date(value: datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def _etag_in(header: str, etag: str) -> bool:
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    opaque = etag.removeprefix("W/")
+    return "*" in candidates or any(candidate.removeprefix("W/") == opaque for candidate in candidates)
+
+
+def _modified_since(header: str, last_modified: datetime) -> bool:
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return True
+    if last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    return last_modified.replace(microsecond=0) > since
+
+
+def check(request: Request, response: Response, etag: str,
+          last_modified: Optional[datetime] = None) -> Optional[Response]:
+    """Agrega ETag/Last-Modified a la respuesta; devuelve un 304 si el cliente ya tiene esta versión."""
+    headers = {"ETag": etag}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    response.headers.update(headers)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        fresh = _etag_in(if_none_match, etag)
+    else:
+        if_modified_since = request.headers.get("if-modified-since")
+        fresh = bool(if_modified_since and last_modified) and not _modified_since(if_modified_since, last_modified)
+    if fresh:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return None
+
+
+def expected_versions(request: Request, kind: str, entity_id: int, size: int = 1) -> Optional[List[Tuple[int, ...]]]:
+    """Versiones aceptadas por If-Match (tuplas de `size` números, ver version_etag), a verificar en el UPDATE.
+
+    None si no hay precondición (o es `*`); 412 si ningún ETag corresponde a la entidad.
+    """
+    if_match = request.headers.get("if-match")
+    if if_match is None:
+        return None
+    versions = []
+    for candidate in if_match.split(","):
+        candidate = candidate.strip().removeprefix("W/")
+        if candidate == "*":
+            return None
+        parts = candidate.strip('"').split("-")
+        if parts[:2] == [kind, str(entity_id)] and len(parts) == size + 2 and all(p.isdigit() for p in parts[2:]):
+            versions.append(tuple(int(p) for p in parts[2:]))
+    if not versions:
+        raise precondition_failed()
+    return versions
+
+
+def precondition_failed() -> HTTPException:
+    return HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED,
+                         detail="El recurso fue modificado por otro cliente.")
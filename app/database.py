@@ -1,7 +1,17 @@
 import os
+from typing import Dict, Optional
+
+from fastapi import Request
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 from sqlmodel import SQLModel, create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 from dotenv import load_dotenv
 
+from app.config import env_bool, env_int, env_str
+from app.pool import InstrumentedAsyncQueuePool, InstrumentedQueuePool, instrument
+from app.replica import REPLICA_INFO_KEY, read_from_primary
+
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
@@ -9,11 +19,106 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable is not set")
 
-engine = create_engine(DATABASE_URL, echo=True)
+# El esquema se administra con migraciones (python -m app.cli migrar); create_all sólo si se pide.
+DB_CREATE_ALL = env_bool("DB_CREATE_ALL", False)
+
+# Réplica de lectura opcional para los GET; sin ella las lecturas van a la primaria.
+DATABASE_READ_URL = env_str("DATABASE_READ_URL")
+
+# Modo async: las rutas usan AsyncSession sobre un driver asíncrono (asyncpg/aiosqlite).
+DB_ASYNC = env_bool("DB_ASYNC", False)
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "postgresql+psycopg": "postgresql+psycopg_async",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+# Pool de conexiones (ignorado en SQLite, que usa el pool por defecto de SQLAlchemy).
+DB_ECHO = env_bool("DB_ECHO", False)
+DB_POOL_SIZE = env_int("DB_POOL_SIZE", 10)
+DB_MAX_OVERFLOW = env_int("DB_MAX_OVERFLOW", 10)
+DB_POOL_TIMEOUT = env_int("DB_POOL_TIMEOUT", 30)
+DB_POOL_RECYCLE = env_int("DB_POOL_RECYCLE", 1800)
+DB_POOL_PRE_PING = env_bool("DB_POOL_PRE_PING", True)
+
+def engine_options(url: str, poolclass=InstrumentedQueuePool) -> dict:
+    options = {"echo": DB_ECHO}
+    if not url.startswith("sqlite"):
+        options.update(
+            poolclass=poolclass,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+        )
+    return options
+
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+instrument(engine)
+
+read_engine: Optional[Engine] = None
+if DATABASE_READ_URL:
+    read_engine = create_engine(DATABASE_READ_URL, **engine_options(DATABASE_READ_URL))
+    instrument(read_engine)
+
+def async_url(url: str) -> str:
+    """Traduce una URL de driver sync a su equivalente async (postgresql → asyncpg, sqlite → aiosqlite)."""
+    scheme, sep, rest = url.partition("://")
+    return ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+ASYNC_DATABASE_URL = env_str("ASYNC_DATABASE_URL") or async_url(DATABASE_URL)
+ASYNC_DATABASE_READ_URL = env_str("ASYNC_DATABASE_READ_URL") or (
+    async_url(DATABASE_READ_URL) if DATABASE_READ_URL else None
+)
+
+_async_engines: Dict[str, AsyncEngine] = {}
+
+def _get_async_engine(name: str, url: str) -> AsyncEngine:
+    # Se crean la primera vez que se usan para no exigir el driver async en modo sync.
+    if name not in _async_engines:
+        _async_engines[name] = create_async_engine(url, **engine_options(url, InstrumentedAsyncQueuePool))
+        instrument(_async_engines[name].sync_engine)
+    return _async_engines[name]
+
+def get_async_engine() -> AsyncEngine:
+    return _get_async_engine("async", ASYNC_DATABASE_URL)
+
+def get_async_read_engine() -> Optional[AsyncEngine]:
+    if not ASYNC_DATABASE_READ_URL:
+        return None
+    return _get_async_engine("async_read", ASYNC_DATABASE_READ_URL)
 
 def get_session():
     with Session(engine) as session:
         yield session
 
+def get_read_session(request: Request):
+    """Sesión para lecturas: la réplica, salvo que no haya o que el cliente haya escrito recién."""
+    target = engine if read_engine is None or read_from_primary(request) else read_engine
+    with Session(target) as session:
+        session.info[REPLICA_INFO_KEY] = target is not engine
+        yield session
+
+async def get_async_session():
+    async with AsyncSession(get_async_engine(), expire_on_commit=False) as session:
+        yield session
+
+async def get_async_read_session(request: Request):
+    replica = get_async_read_engine()
+    target = get_async_engine() if replica is None or read_from_primary(request) else replica
+    async with AsyncSession(target, expire_on_commit=False) as session:
+        session.sync_session.info[REPLICA_INFO_KEY] = target is replica
+        yield session
+
 def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
\ No newline at end of file
+    SQLModel.metadata.create_all(engine)
+
+def current_async_engines() -> Dict[str, AsyncEngine]:
+    return dict(_async_engines)
+
+async def dispose_async_engines():
+    for async_engine in _async_engines.values():
+        await async_engine.dispose()
@@ -0,0 +1,65 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from itertools import islice
+from typing import Iterable, Iterator, Literal, Sequence
+
+from fastapi.responses import StreamingResponse
+
+ExportFormat = Literal["ndjson", "csv"]
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+ROWS_PER_CHUNK = 500
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+
+def _batches(rows: Iterable[Sequence], size: int) -> Iterator[list]:
+    iterator = iter(rows)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def iter_ndjson(rows: Iterable[Sequence], columns: Sequence[str]) -> Iterator[bytes]:
+    """Serializa filas como JSON delimitado por saltos de línea, de a un bloque por vez."""
+    for batch in _batches(rows, ROWS_PER_CHUNK):
+        yield "".join(
+            json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=_json_default) + "\n"
+            for row in batch
+        ).encode()
+
+
+def iter_csv(rows: Iterable[Sequence], columns: Sequence[str]) -> Iterator[bytes]:
+    """Serializa filas como CSV con encabezado, de a un bloque por vez."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for batch in _batches(rows, ROWS_PER_CHUNK):
+        writer.writerows(
+            [value.isoformat() if isinstance(value, (datetime, date)) else value for value in row]
+            for row in batch
+        )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def export_response(rows: Iterable[Sequence], columns: Sequence[str], formato: ExportFormat, nombre: str) -> StreamingResponse:
+    """Arma la respuesta en streaming para un export en el formato pedido."""
+    body = iter_csv(rows, columns) if formato == "csv" else iter_ndjson(rows, columns)
+    return StreamingResponse(
+        body,
+        media_type=MEDIA_TYPES[formato],
+        headers={"Content-Disposition": f'attachment; filename="{nombre}.{formato}"'},
+    )
@@ -0,0 +1,113 @@
+import codecs
+import csv
+import json
+import time
+from typing import AsyncIterator, Callable, List, Optional, Tuple, Type
+
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import SQLModel
+
+from app.exporters import ExportFormat
+from app.models import ImportLineError, ImportResult
+from app.validation import format_errors, validate_batch, validation_context
+
+LINES_PER_CHUNK = 5000
+MAX_REPORTED_ERRORS = 1000
+
+# Recibe los ítems válidos de un bloque junto a su número de línea, los persiste
+# y devuelve los errores de las líneas que no pudo escribir.
+ChunkWriter = Callable[[List[Tuple[int, SQLModel]]], List[ImportLineError]]
+
+
+async def iter_line_chunks(stream: AsyncIterator[bytes], size: int = LINES_PER_CHUNK) -> AsyncIterator[List[Tuple[int, str]]]:
+    """Agrupa las líneas no vacías de un cuerpo en streaming en bloques de `size`, con su número de línea."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    numero = 0
+    chunk: List[Tuple[int, str]] = []
+    async for data in stream:
+        pending += decoder.decode(data)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            numero += 1
+            if line.strip():
+                chunk.append((numero, line.rstrip("\r")))
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    pending += decoder.decode(b"", final=True)
+    if pending.strip():
+        chunk.append((numero + 1, pending.rstrip("\r")))
+    if chunk:
+        yield chunk
+
+
+class StreamingImporter:
+    """Importa un archivo NDJSON o CSV por bloques, validando cada fila con el modelo de alta."""
+
+    def __init__(self, model: Type[SQLModel], writer: ChunkWriter, formato: ExportFormat = "ndjson"):
+        self.model = model
+        self.writer = writer
+        self.formato = formato
+        self.header: Optional[List[str]] = None
+        self.insertadas = 0
+        self.con_error = 0
+        self.errores: List[ImportLineError] = []
+        # Un mismo "ahora" para todas las filas del archivo, aunque la carga dure varios segundos.
+        self.context = validation_context()
+
+    def _add_errors(self, errores: List[ImportLineError]) -> None:
+        self.con_error += len(errores)
+        self.errores.extend(errores[:MAX_REPORTED_ERRORS - len(self.errores)])
+
+    def _parse(self, lines: List[Tuple[int, str]]) -> List[Tuple[int, dict]]:
+        if self.formato == "ndjson":
+            parsed = []
+            for numero, line in lines:
+                try:
+                    data = json.loads(line)
+                except ValueError as e:
+                    self._add_errors([ImportLineError(linea=numero, detalle=f"JSON inválido: {e}")])
+                    continue
+                if not isinstance(data, dict):
+                    self._add_errors([ImportLineError(linea=numero, detalle="Se esperaba un objeto JSON.")])
+                    continue
+                parsed.append((numero, data))
+            return parsed
+
+        if self.header is None:
+            self.header = next(csv.reader([lines[0][1]]))
+            lines = lines[1:]
+        parsed = []
+        for (numero, _), values in zip(lines, csv.reader(line for _, line in lines)):
+            if len(values) != len(self.header):
+                self._add_errors([ImportLineError(linea=numero, detalle="Cantidad de columnas inválida.")])
+                continue
+            parsed.append((numero, dict(zip(self.header, values))))
+        return parsed
+
+    def _process_chunk(self, lines: List[Tuple[int, str]]) -> None:
+        parsed = self._parse(lines)
+        items, errores = validate_batch(self.model, [data for _, data in parsed], self.context)
+        self._add_errors([
+            ImportLineError(linea=parsed[indice][0], detalle=format_errors([{**e, "loc": e["loc"][1:]} for e in errors]))
+            for indice, errors in sorted(errores.items())
+        ])
+        validos = [(parsed[indice][0], item) for indice, item in items]
+        if validos:
+            errores = self.writer(validos)
+            self._add_errors(errores)
+            self.insertadas += len(validos) - len(errores)
+
+    async def run(self, stream: AsyncIterator[bytes]) -> ImportResult:
+        inicio = time.perf_counter()
+        async for lines in iter_line_chunks(stream):
+            await run_in_threadpool(self._process_chunk, lines)
+        segundos = time.perf_counter() - inicio
+        return ImportResult(
+            filas_insertadas=self.insertadas,
+            filas_con_error=self.con_error,
+            segundos=round(segundos, 3),
+            filas_por_segundo=round(self.insertadas / segundos, 1) if segundos > 0 else 0.0,
+            errores=self.errores,
+        )
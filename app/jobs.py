@@ -0,0 +1,242 @@
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import event
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel import Session, SQLModel
+
+from app.config import env_int
+from app.database import engine
+from app.models import AutoCreate, BatchItemError, Job, JobRead, VentaCreate
+from app.repositories import AutoRepository, JobRepository, VentaRepository
+from app.utils import utcnow
+from app.validation import item_errors, validate_batch
+
+logger = logging.getLogger(__name__)
+
+# Pocos workers y bloques cortos: cada bloque es una transacción, así que un import
+# no retiene conexiones ni locks que necesiten los requests interactivos.
+JOBS_MAX_WORKERS = env_int("JOBS_MAX_WORKERS", 2)
+JOBS_CHUNK_SIZE = env_int("JOBS_CHUNK_SIZE", 1000)
+JOBS_MAX_PENDING = env_int("JOBS_MAX_PENDING", 100)
+# Un trabajo en curso sin avances en este lapso se considera abandonado y se retoma.
+JOBS_STALE_SECONDS = env_int("JOBS_STALE_SECONDS", 300)
+# Cada cuánto se marcan como vivos los trabajos propios y se buscan los abandonados por otros
+# procesos (debe ser bastante menor que JOBS_STALE_SECONDS).
+JOBS_HEARTBEAT_SECONDS = env_int("JOBS_HEARTBEAT_SECONDS", 60)
+
+# Valida un bloque (índice del primer ítem, ítems) y devuelve los válidos y los errores.
+ChunkValidator = Callable[[Session, int, List[dict]], Tuple[List[SQLModel], List[BatchItemError]]]
+# Persiste los ítems válidos de un bloque y confirma la transacción.
+ChunkWriter = Callable[[Session, List[SQLModel]], None]
+
+
+def _validate(model, inicio: int, items: List[dict]):
+    validos, errores = validate_batch(model, items)
+    errores = [BatchItemError(indice=inicio + error.indice, detalle=error.detalle) for error in item_errors(errores)]
+    return validos, errores
+
+
+def _validate_autos(session: Session, inicio: int, items: List[dict]):
+    validos, errores = _validate(AutoCreate, inicio, items)
+    return [auto for _, auto in validos], errores
+
+
+def _validate_ventas(session: Session, inicio: int, items: List[dict]):
+    validos, errores = _validate(VentaCreate, inicio, items)
+    existentes = AutoRepository(session).get_existing_ids(venta.auto_id for _, venta in validos)
+    errores += [
+        BatchItemError(indice=inicio + indice, detalle=f"Auto con ID {venta.auto_id} no encontrado.")
+        for indice, venta in validos
+        if venta.auto_id not in existentes
+    ]
+    return [venta for _, venta in validos if venta.auto_id in existentes], errores
+
+
+HANDLERS: Dict[str, Tuple[ChunkValidator, ChunkWriter]] = {
+    "autos_batch": (_validate_autos, lambda session, autos: AutoRepository(session).bulk_load(autos)),
+    "ventas_batch": (_validate_ventas, lambda session, ventas: VentaRepository(session).bulk_load(ventas)),
+}
+
+
+class JobQueue:
+    """Cola de trabajos persistida en la tabla `job` y ejecutada por un pool acotado de threads.
+
+    Cada trabajo avanza por bloques de `chunk_size` ítems; el avance se guarda en la misma
+    transacción que el bloque, así que al reiniciar se retoma desde el último bloque
+    confirmado sin duplicar filas.
+
+    Un apagado ordenado devuelve a `pendiente` los trabajos a medias. Si el proceso muere sin
+    apagarse, sus trabajos quedan en curso: un monitor (ver `start`) renueva cada
+    `heartbeat_seconds` los trabajos propios y retoma los que nadie renovó en `stale_seconds`.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], max_workers: int = JOBS_MAX_WORKERS,
+                 chunk_size: int = JOBS_CHUNK_SIZE, max_pending: int = JOBS_MAX_PENDING,
+                 stale_seconds: int = JOBS_STALE_SECONDS, heartbeat_seconds: float = JOBS_HEARTBEAT_SECONDS):
+        self.session_factory = session_factory
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.max_pending = max_pending
+        self.stale_seconds = stale_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._futures: List[Future] = []
+        self._active: Set[int] = set()
+        self._monitor: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def _stale_before(self):
+        return utcnow() - timedelta(seconds=self.stale_seconds)
+
+    def submit(self, job_id: int) -> bool:
+        """Encola el trabajo; False si ya está encolado o en curso en este proceso."""
+        with self._lock:
+            if job_id in self._active:
+                return False
+            if self._executor is None:
+                self._stopping.clear()
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="jobs")
+            self._futures = [future for future in self._futures if not future.done()]
+            self._active.add(job_id)
+            self._futures.append(self._executor.submit(self._run_active, job_id))
+            return True
+
+    def _run_active(self, job_id: int) -> None:
+        try:
+            self.run(job_id)
+        finally:
+            with self._lock:
+                self._active.discard(job_id)
+
+    def enqueue(self, session: Session, tipo: str, items: Sequence[SQLModel]) -> Job:
+        """Guarda el trabajo y lo encola; 503 si ya hay demasiados sin terminar."""
+        repo = JobRepository(session)
+        if repo.count_unfinished() >= self.max_pending:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="Hay demasiados trabajos en curso; reintentar más tarde.",
+                                headers={"Retry-After": "30"})
+        job = repo.create(tipo, [item.model_dump(mode="json") for item in items])
+        self.submit(job.id)
+        return job
+
+    def resume(self) -> int:
+        """Encola los trabajos pendientes o abandonados que no estén ya en este proceso."""
+        with self.session_factory() as session:
+            ids = JobRepository(session).get_claimable_ids(self._stale_before())
+        return sum(self.submit(job_id) for job_id in ids)
+
+    def run(self, job_id: int) -> None:
+        with self.session_factory() as session:
+            repo = JobRepository(session)
+            job = repo.claim(job_id, self._stale_before())
+            if job is None:
+                return
+            validate, write = HANDLERS[job.tipo]
+            job.errores = list(job.errores)
+            try:
+                for inicio in range(job.procesados, job.total, self.chunk_size):
+                    if self._stopping.is_set():
+                        # Vuelve a pendiente: otro proceso (o éste al reiniciar) lo retoma enseguida,
+                        # desde el último bloque confirmado, sin esperar a que parezca abandonado.
+                        repo.release(job)
+                        return
+                    validos, errores = validate(session, inicio, job.payload[inicio:inicio + self.chunk_size])
+                    job.procesados = min(inicio + self.chunk_size, job.total)
+                    job.creados += len(validos)
+                    job.errores.extend(error.model_dump() for error in errores)
+                    if validos:
+                        self._write_with_progress(session, repo, job, write, validos)
+                    else:
+                        repo.save_progress(job)
+                        session.commit()
+            except Exception as e:
+                session.rollback()
+                logger.exception("Falló el trabajo %s", job_id)
+                repo.finish(job, "error", detalle=str(e))
+                return
+            repo.finish(job, "completado")
+
+    @staticmethod
+    def _write_with_progress(session: Session, repo: JobRepository, job: Job, write: ChunkWriter,
+                             items: List[SQLModel]) -> None:
+        # El writer confirma por su cuenta (y puede reintentar, como el alta de autos):
+        # el avance se agrega justo antes de su commit para que ambos sean atómicos.
+        def record_progress(_session):
+            repo.save_progress(job)
+
+        event.listen(session, "before_commit", record_progress)
+        try:
+            write(session, items)
+        finally:
+            event.remove(session, "before_commit", record_progress)
+
+    def join(self) -> None:
+        """Espera a que terminen los trabajos encolados (para tests y el apagado)."""
+        while True:
+            with self._lock:
+                pendientes = [future for future in self._futures if not future.done()]
+            if not pendientes:
+                return
+            for future in pendientes:
+                future.result()
+
+    def start(self) -> None:
+        """Retoma los trabajos pendientes o abandonados y arranca el monitor."""
+        try:
+            self.resume()
+        except SQLAlchemyError:
+            logger.warning("No se pudieron retomar los trabajos pendientes (¿falta migrar la tabla job?)")
+        with self._lock:
+            if self._monitor is None:
+                self._stopping.clear()
+                self._monitor = threading.Thread(target=self._watch, name="jobs-monitor", daemon=True)
+                self._monitor.start()
+
+    def _watch(self) -> None:
+        while not self._stopping.wait(self.heartbeat_seconds):
+            try:
+                with self._lock:
+                    activos = list(self._active)
+                with self.session_factory() as session:
+                    JobRepository(session).heartbeat(activos)
+                self.resume()
+            except SQLAlchemyError:
+                logger.exception("Falló el monitor de trabajos")
+
+    def shutdown(self) -> None:
+        """Termina el bloque en curso de cada trabajo, lo deja pendiente y detiene los workers y el monitor."""
+        self._stopping.set()
+        with self._lock:
+            executor, self._executor = self._executor, None
+            monitor, self._monitor = self._monitor, None
+        if monitor is not None:
+            monitor.join()
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+        with self._lock:
+            # Los cancelados antes de empezar no pasaron por _run_active.
+            self._active.clear()
+
+
+job_queue = JobQueue(lambda: Session(engine))
+
+
+def get_job_queue() -> JobQueue:
+    return job_queue
+
+
+def accepted(job: Job) -> JSONResponse:
+    """Respuesta 202 de un alta masiva encolada, con la URL para consultar su estado."""
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content=jsonable_encoder(JobRead.model_validate(job, from_attributes=True)),
+        headers={"Location": f"/jobs/{job.id}"},
+    )
@@ -0,0 +1,201 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            return self.header() + [
+                f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+                for labels, value in sorted(self._values.items())
+            ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # Por cada combinación de labels: conteo por bucket (no acumulado), suma y cantidad.
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._values.items()):
+                acumulado = 0
+                for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                    acumulado += bucket_count
+                    le = f'le="{bound if bound == "+Inf" else _number(bound)}"'
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {acumulado}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+REQUESTS = Counter("http_requests_total", "Requests atendidos.", ("method", "route", "status"))
+IN_FLIGHT = Gauge("http_requests_in_flight", "Requests en curso.")
+LATENCY = Histogram("http_request_duration_seconds", "Latencia de los requests.", ("method", "route"))
+RESPONSE_SIZE = Histogram("http_response_size_bytes", "Tamaño del cuerpo de las respuestas.",
+                          ("method", "route"), SIZE_BUCKETS)
+DB_QUERIES = Histogram("http_request_db_queries", "Sentencias SQL ejecutadas por request.",
+                       ("method", "route"), QUERY_BUCKETS)
+DB_TIME = Histogram("http_request_db_seconds", "Tiempo en la base de datos por request.", ("method", "route"))
+
+REGISTRY: List[_Metric] = [REQUESTS, IN_FLIGHT, LATENCY, RESPONSE_SIZE, DB_QUERIES, DB_TIME]
+
+
+def render() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+class RequestDB:
+    """Consultas y tiempo de BD acumulados durante un request."""
+
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+# El objeto se comparte (no se reasigna) para que lo vean el threadpool y los greenlets del request.
+_request_db: ContextVar[Optional[RequestDB]] = ContextVar("request_db", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _request_db.get() is not None:
+        conn.info.setdefault("metrics_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    db = _request_db.get()
+    starts = conn.info.get("metrics_start")
+    if db is not None and starts:
+        db.queries += 1
+        db.seconds += time.perf_counter() - starts.pop()
+
+
+def route_template(scope) -> str:
+    """Plantilla de la ruta resuelta (`/autos/{auto_id}`), para no crear una serie por URL."""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """Middleware ASGI que mide latencia, tamaño de respuesta y uso de la BD por ruta."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        inicio = time.perf_counter()
+        db = RequestDB()
+        token = _request_db.set(db)
+        estado = {"status": 500, "size": 0}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                estado["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                estado["size"] += len(message.get("body", b""))
+            await send(message)
+
+        IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            IN_FLIGHT.dec()
+            _request_db.reset(token)
+            labels = (scope["method"], route_template(scope))
+            REQUESTS.inc(*labels, str(estado["status"]))
+            LATENCY.observe(time.perf_counter() - inicio, *labels)
+            RESPONSE_SIZE.observe(estado["size"], *labels)
+            DB_QUERIES.observe(db.queries, *labels)
+            DB_TIME.observe(db.seconds, *labels)
+
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+def metrics():
+    return PlainTextResponse(render(), media_type=CONTENT_TYPE)
@@ -1,18 +1,22 @@
-from typing import Optional, List
-from datetime import datetime
+from typing import Any, Optional, List, Union
+from datetime import date, datetime
 from sqlmodel import SQLModel, Field, Relationship
-from pydantic import field_validator
-from app.utils import is_valid_year, is_valid_price, is_valid_future_date, is_valid_comprador_name
+from pydantic import ValidationInfo, field_validator, model_validator
+from sqlalchemy import DDL, JSON, Index, event
+from app.utils import (context_now, is_valid_comprador_name, is_valid_future_date, is_valid_price, is_valid_year,
+                       utcnow)
 
 
 class AutoBase(SQLModel):
-    marca: str
-    modelo: str
+    marca: str = Field(index=True)
+    modelo: str = Field(index=True)
     año: int
-    numero_chasis: str
+    numero_chasis: str = Field(index=True, unique=True)
 
 class Auto(AutoBase, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
+    version: int = Field(default=1)
+    updated_at: datetime = Field(default_factory=utcnow)
     ventas: List["Venta"] = Relationship(back_populates="auto")
 
 class AutoCreate(SQLModel):
@@ -22,8 +26,8 @@ class AutoCreate(SQLModel):
 
     @field_validator("año")
     @classmethod
-    def validate_year(cls, v):
-        if not is_valid_year(v):
+    def validate_year(cls, v, info: ValidationInfo):
+        if not is_valid_year(v, context_now(info)):
             raise ValueError("El año debe estar entre 1900 y el año actual.")
         return v
 
@@ -37,8 +41,8 @@ class AutoUpdate(SQLModel):
 
     @field_validator("año")
     @classmethod
-    def validate_year(cls, v):
-        if v is not None and not is_valid_year(v):
+    def validate_year(cls, v, info: ValidationInfo):
+        if v is not None and not is_valid_year(v, context_now(info)):
             raise ValueError("El año debe estar entre 1900 y el año actual.")
         return v
 
@@ -49,11 +53,15 @@ class AutoReadWithVentas(AutoRead):
 class VentaBase(SQLModel):
     nombre_comprador: str
     precio: float
-    fecha_venta: datetime
+    fecha_venta: datetime = Field(index=True)
 
 class Venta(VentaBase, table=True):
+    # Ventas de un auto por rango de fechas, ya ordenadas (GET /ventas/auto/{id}?desde=...).
+    __table_args__ = (Index("ix_venta_auto_id_fecha_venta", "auto_id", "fecha_venta"),)
     id: Optional[int] = Field(default=None, primary_key=True)
-    auto_id: int = Field(foreign_key="auto.id")
+    auto_id: int = Field(foreign_key="auto.id", index=True)
+    version: int = Field(default=1)
+    updated_at: datetime = Field(default_factory=utcnow)
     auto: Optional[Auto] = Relationship(back_populates="ventas")
 
 class VentaCreate(VentaBase):
@@ -75,8 +83,8 @@ class VentaCreate(VentaBase):
 
     @field_validator("fecha_venta")
     @classmethod
-    def validate_fecha_venta(cls, v):
-        if not is_valid_future_date(v):
+    def validate_fecha_venta(cls, v, info: ValidationInfo):
+        if not is_valid_future_date(v, context_now(info)):
             raise ValueError("La fecha de venta no puede ser en el futuro.")
         return v
 
@@ -105,10 +113,144 @@ class VentaUpdate(SQLModel):
 
     @field_validator("fecha_venta")
     @classmethod
-    def validate_fecha_venta(cls, v):
-        if v is not None and not is_valid_future_date(v):
+    def validate_fecha_venta(cls, v, info: ValidationInfo):
+        if v is not None and not is_valid_future_date(v, context_now(info)):
             raise ValueError("La fecha de venta no puede ser en el futuro.")
         return v
 
+class VentaBulkUpdate(VentaUpdate):
+    """Cambios de PATCH /ventas/bulk: valores fijos y/o un factor sobre el precio de cada venta."""
+    precio_factor: Optional[float] = None
+
+    @field_validator("precio_factor")
+    @classmethod
+    def validate_precio_factor(cls, v):
+        if v is not None and not is_valid_price(v):
+            raise ValueError("El factor de precio debe ser mayor a 0.")
+        return v
+
+    @model_validator(mode="after")
+    def validate_precio(self):
+        if self.precio is not None and self.precio_factor is not None:
+            raise ValueError("Indicar precio o precio_factor, no ambos.")
+        return self
+
 class VentaReadWithAuto(VentaRead):
-    auto: Optional[AutoRead] = None
\ No newline at end of file
+    auto: Optional[AutoRead] = None
+
+class VentaResumen(SQLModel, table=True):
+    """Agregado de ventas por marca, modelo y mes, mantenido en la misma transacción que las ventas."""
+    __tablename__ = "venta_resumen"
+    marca: str = Field(primary_key=True)
+    modelo: str = Field(primary_key=True)
+    mes: str = Field(primary_key=True, index=True)
+    cantidad: int = 0
+    total: float = 0
+    minimo: float
+    maximo: float
+
+class VentaResumenAuto(SQLModel, table=True):
+    """Agregado de ventas por auto y mes (para `agrupar=auto`), mantenido igual que VentaResumen."""
+    __tablename__ = "venta_resumen_auto"
+    auto_id: int = Field(foreign_key="auto.id", primary_key=True)
+    mes: str = Field(primary_key=True, index=True)
+    cantidad: int = 0
+    total: float = 0
+    minimo: float
+    maximo: float
+
+class VentaCambio(SQLModel, table=True):
+    """Registro compacto de altas, cambios y bajas de ventas: el id es el del evento de GET /ventas/stream."""
+    __tablename__ = "venta_cambio"
+    # AUTOINCREMENT en SQLite: sin él, al podar el registro se reusarían ids de eventos ya enviados.
+    __table_args__ = {"sqlite_autoincrement": True}
+    id: Optional[int] = Field(default=None, primary_key=True)
+    venta_id: int
+    tipo: str
+    created_at: datetime = Field(default_factory=utcnow, index=True)
+
+
+class ChasisSecuencia(SQLModel, table=True):
+    """Próximo número de serie libre para los chasis (en PostgreSQL se usa una SEQUENCE)."""
+    __tablename__ = "chasis_secuencia"
+    nombre: str = Field(primary_key=True)
+    siguiente: int = 1
+
+event.listen(
+    ChasisSecuencia.__table__,
+    "after_create",
+    DDL("INSERT INTO chasis_secuencia (nombre, siguiente) VALUES ('auto', 1)"),
+)
+
+class VentaStats(SQLModel):
+    grupo: Union[int, str]
+    cantidad: int
+    total: float
+    promedio: float
+    minimo: float
+    maximo: float
+
+class AutoFiltro(SQLModel):
+    """Filtros de las operaciones masivas sobre autos (como los del listado, más ids)."""
+    ids: Optional[List[int]] = None
+    marca: Optional[str] = None
+    modelo: Optional[str] = None
+
+class VentaFiltro(SQLModel):
+    """Filtros de las operaciones masivas sobre ventas; fechas inclusive."""
+    ids: Optional[List[int]] = None
+    auto_id: Optional[int] = None
+    marca: Optional[str] = None
+    modelo: Optional[str] = None
+    comprador: Optional[str] = None
+    desde: Optional[date] = None
+    hasta: Optional[date] = None
+
+class BulkResult(SQLModel):
+    dry_run: bool
+    autos: int = 0
+    ventas: int = 0
+
+class BatchItemError(SQLModel):
+    indice: int
+    detalle: str
+
+class AutoBatchResult(SQLModel):
+    creados: List[AutoRead] = []
+    errores: List[BatchItemError] = []
+
+class VentaBatchResult(SQLModel):
+    creadas: List[VentaReadWithAuto] = []
+    errores: List[BatchItemError] = []
+
+class ImportLineError(SQLModel):
+    linea: int
+    detalle: str
+
+class ImportResult(SQLModel):
+    filas_insertadas: int
+    filas_con_error: int
+    segundos: float
+    filas_por_segundo: float
+    errores: List[ImportLineError] = []
+
+class JobBase(SQLModel):
+    tipo: str
+    estado: str = Field(default="pendiente", index=True)
+    total: int = 0
+    procesados: int = 0
+    creados: int = 0
+    errores: List[BatchItemError] = Field(default_factory=list, sa_type=JSON)
+    detalle: Optional[str] = None
+    created_at: datetime = Field(default_factory=utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class Job(JobBase, table=True):
+    """Trabajo en segundo plano (altas masivas con ?async=true); los ítems pendientes van en `payload`."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    payload: List[Any] = Field(default_factory=list, sa_type=JSON)
+    updated_at: datetime = Field(default_factory=utcnow)
+
+class JobRead(JobBase):
+    id: int
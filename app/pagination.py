@@ -0,0 +1,26 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Tuple
+
+
+def encode_cursor(*values: Any) -> str:
+    """Codifica la clave de orden de la última fila de una página en un cursor opaco."""
+    payload = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, *types: type) -> Tuple[Any, ...]:
+    """Decodifica un cursor generado por encode_cursor convirtiendo cada valor al tipo indicado."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError
+        return tuple(
+            datetime.fromisoformat(value) if type_ is datetime else type_(value)
+            for type_, value in zip(types, values)
+        )
+    except (ValueError, TypeError) as e:
+        raise ValueError("Cursor inválido.") from e
@@ -0,0 +1,169 @@
+import re
+from datetime import date
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from app.config import env_int
+from app.models import Venta
+from app.search import create_search_indexes
+
+# Particionado mensual de `venta` por rango de `fecha_venta` (sólo PostgreSQL, fuera de Alembic):
+# con la tabla particionada, las consultas por desde/hasta sólo leen las particiones del rango
+# y los meses viejos se separan (DETACH) como tablas venta_archivo_AAAA_MM.
+
+# Meses siguientes al actual que se dejan creados (el cron de mantenimiento corre mensualmente).
+PARTICIONES_ADELANTE = env_int("VENTAS_PARTICIONES_ADELANTE", 2)
+# Ventas fuera de toda partición mensual (p. ej. de un mes ya archivado).
+DEFAULT_PARTITION = "venta_default"
+PARTITION_PATTERN = re.compile(r"^venta_p(\d{4})_(\d{2})$")
+
+
+class PartitioningNotSupported(Exception):
+    pass
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(month: date, months: int) -> date:
+    year, index = divmod(month.year * 12 + month.month - 1 + months, 12)
+    return date(year, index + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"venta_p{month.year:04d}_{month.month:02d}"
+
+
+def partition_month(name: str) -> Optional[date]:
+    match = PARTITION_PATTERN.match(name)
+    return date(int(match[1]), int(match[2]), 1) if match else None
+
+
+def partition_ddl(month: date, parent: str = "venta") -> str:
+    return (f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {parent} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')")
+
+
+def move_from_default_ddl(month: date) -> List[str]:
+    """Crea la partición de `month` cuando venta_default ya tiene ventas de ese mes.
+
+    Con filas del rango en la partición default, PostgreSQL rechaza el CREATE ... PARTITION OF:
+    se separa la default, se crea el mes, se mueven sus filas y se vuelve a adjuntar.
+    """
+    desde, hasta = month.isoformat(), add_months(month, 1).isoformat()
+    rango = f"fecha_venta >= '{desde}' AND fecha_venta < '{hasta}'"
+    return [
+        f"ALTER TABLE venta DETACH PARTITION {DEFAULT_PARTITION}",
+        partition_ddl(month),
+        f"INSERT INTO venta SELECT * FROM {DEFAULT_PARTITION} WHERE {rango}",
+        f"DELETE FROM {DEFAULT_PARTITION} WHERE {rango}",
+        f"ALTER TABLE venta ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT",
+    ]
+
+
+def _require_postgresql(connection: Connection) -> None:
+    if connection.dialect.name != "postgresql":
+        raise PartitioningNotSupported("El particionado de ventas sólo está disponible en PostgreSQL.")
+
+
+def is_partitioned(connection: Connection) -> bool:
+    _require_postgresql(connection)
+    return connection.execute(text(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('venta')"
+    )).first() is not None
+
+
+def attached_partitions(connection: Connection) -> List[str]:
+    return list(connection.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass('venta') ORDER BY c.relname"
+    )).scalars())
+
+
+def _default_has_rows(connection: Connection, month: date) -> bool:
+    """True si el mes todavía no tiene partición y venta_default (adjunta) tiene ventas de ese mes."""
+    if connection.execute(text("SELECT to_regclass(:name)"), {"name": partition_name(month)}).scalar() is not None:
+        return False
+    if DEFAULT_PARTITION not in attached_partitions(connection):
+        return False
+    return connection.execute(text(
+        f"SELECT 1 FROM {DEFAULT_PARTITION} WHERE fecha_venta >= :desde AND fecha_venta < :hasta LIMIT 1"
+    ), {"desde": month, "hasta": add_months(month, 1)}).first() is not None
+
+
+def create_partitions(connection: Connection, hasta: date, desde: Optional[date] = None,
+                      parent: str = "venta") -> List[str]:
+    """Crea las particiones mensuales de `desde` (por defecto el mes actual) a `hasta`, inclusive.
+
+    Si venta_default ya recibió ventas de un mes nuevo (p. ej. porque el cron se atrasó), esas
+    ventas se mueven a la partición del mes en la misma transacción.
+    """
+    month = month_start(desde or date.today())
+    creadas = []
+    while month <= month_start(hasta):
+        statements = [partition_ddl(month, parent)]
+        if parent == "venta" and _default_has_rows(connection, month):
+            statements = move_from_default_ddl(month)
+        for statement in statements:
+            connection.execute(text(statement))
+        creadas.append(partition_name(month))
+        month = add_months(month, 1)
+    return creadas
+
+
+def convert(connection: Connection, meses_adelante: int = PARTICIONES_ADELANTE) -> List[str]:
+    """Reemplaza `venta` por una tabla particionada por mes con los mismos datos, en una transacción.
+
+    La clave primaria pasa a ser (id, fecha_venta), como exige PostgreSQL; los ids siguen
+    saliendo de la misma secuencia, así que siguen siendo únicos.
+    """
+    if is_partitioned(connection):
+        return []
+    primera = connection.execute(text("SELECT min(fecha_venta) FROM venta")).scalar()
+    hasta = add_months(month_start(date.today()), meses_adelante)
+    secuencia = connection.execute(text("SELECT pg_get_serial_sequence('venta', 'id')")).scalar()
+
+    connection.execute(text("LOCK TABLE venta IN ACCESS EXCLUSIVE MODE"))
+    # La secuencia pertenece a venta.id: sin esto, el DROP de la tabla vieja la borraría.
+    connection.execute(text(f"ALTER SEQUENCE {secuencia} OWNED BY NONE"))
+    connection.execute(text(
+        "CREATE TABLE venta_particionada (LIKE venta INCLUDING DEFAULTS) PARTITION BY RANGE (fecha_venta)"
+    ))
+    creadas = create_partitions(connection, hasta, primera.date() if primera else None, parent="venta_particionada")
+    connection.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF venta_particionada DEFAULT"))
+    connection.execute(text("INSERT INTO venta_particionada SELECT * FROM venta"))
+    connection.execute(text("DROP TABLE venta"))
+    connection.execute(text("ALTER TABLE venta_particionada RENAME TO venta"))
+    connection.execute(text("ALTER TABLE venta ADD PRIMARY KEY (id, fecha_venta)"))
+    connection.execute(text("ALTER TABLE venta ADD FOREIGN KEY (auto_id) REFERENCES auto (id)"))
+    connection.execute(text(f"ALTER SEQUENCE {secuencia} OWNED BY venta.id"))
+    for index in Venta.__table__.indexes:
+        index.create(connection)
+    create_search_indexes(connection)
+    return creadas
+
+
+def ensure_partitions(connection: Connection, meses_adelante: int = PARTICIONES_ADELANTE) -> List[str]:
+    """Crea (si faltan) las particiones del mes actual y los `meses_adelante` siguientes."""
+    if not is_partitioned(connection):
+        raise PartitioningNotSupported("La tabla venta no está particionada: ejecutar `particionar-ventas`.")
+    return create_partitions(connection, add_months(month_start(date.today()), meses_adelante))
+
+
+def archive(connection: Connection, antes: date) -> List[str]:
+    """Separa las particiones de los meses anteriores a `antes` y las renombra a venta_archivo_AAAA_MM."""
+    if not is_partitioned(connection):
+        raise PartitioningNotSupported("La tabla venta no está particionada: ejecutar `particionar-ventas`.")
+    archivadas = []
+    for name in attached_partitions(connection):
+        month = partition_month(name)
+        if month is None or month >= month_start(antes):
+            continue
+        archivo = name.replace("venta_p", "venta_archivo_", 1)
+        connection.execute(text(f"ALTER TABLE venta DETACH PARTITION {name}"))
+        connection.execute(text(f"ALTER TABLE {name} RENAME TO {archivo}"))
+        archivadas.append(archivo)
+    return archivadas
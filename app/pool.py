@@ -0,0 +1,119 @@
+import threading
+import time
+from typing import Any, Dict
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+
+class PoolStats:
+    """Contadores de uso de un pool de conexiones, alimentados por eventos del pool."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._lock = threading.Lock()
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def record_wait(self, segundos: float) -> None:
+        with self._lock:
+            self.waits += 1
+            self.wait_total += segundos
+            self.wait_max = max(self.wait_max, segundos)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "checkouts": self.checkouts,
+            "checkins": self.checkins,
+            "connects": self.connects,
+            "invalidations": self.invalidations,
+            "timeouts": self.timeouts,
+            "wait_avg_ms": round(self.wait_total / self.waits * 1000, 3) if self.waits else 0.0,
+            "wait_max_ms": round(self.wait_max * 1000, 3),
+        }
+
+
+class InstrumentedPoolMixin:
+    """Mide cuánto espera cada checkout y cuenta los que agotan `pool_timeout`."""
+
+    stats: PoolStats
+
+    def _do_get(self):
+        stats = getattr(self, "stats", None)
+        if stats is None:
+            return super()._do_get()
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            stats.count("timeouts")
+            raise
+        finally:
+            stats.record_wait(time.perf_counter() - inicio)
+
+    def recreate(self):
+        # engine.dispose() reemplaza el pool: los contadores pasan al nuevo.
+        pool = super().recreate()
+        if hasattr(self, "stats"):
+            pool.stats = self.stats
+        return pool
+
+
+class InstrumentedQueuePool(InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def instrument(engine: Engine) -> PoolStats:
+    """Registra los eventos del pool de `engine` y devuelve sus estadísticas."""
+    stats = PoolStats()
+    engine.pool.stats = stats
+
+    @event.listens_for(engine, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        stats.count("checkouts")
+
+    @event.listens_for(engine, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        stats.count("checkins")
+
+    @event.listens_for(engine, "connect")
+    def _connect(dbapi_connection, connection_record):
+        stats.count("connects")
+
+    @event.listens_for(engine, "invalidate")
+    def _invalidate(dbapi_connection, connection_record, exception):
+        stats.count("invalidations")
+
+    return stats
+
+
+def pool_status(engine: Engine) -> Dict[str, Any]:
+    """Estado actual del pool (tamaño, conexiones en uso, overflow) junto con sus contadores."""
+    pool = engine.pool
+    status: Dict[str, Any] = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "timeout": pool.timeout(),
+        })
+    stats = getattr(pool, "stats", None)
+    if stats is not None:
+        status.update(stats.snapshot())
+    return status
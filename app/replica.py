@@ -0,0 +1,52 @@
+import time
+
+from starlette.requests import HTTPConnection
+
+from app.config import env_int
+
+# Después de escribir, el cliente lee de la primaria durante esta ventana para ver sus
+# propios cambios aunque la réplica todavía no los haya recibido.
+READ_YOUR_WRITES_SECONDS = env_int("READ_YOUR_WRITES_SECONDS", 5)
+WRITE_COOKIE = "ultima_escritura"
+
+UNSAFE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+# Marca en `Session.info` de las sesiones abiertas contra la réplica.
+REPLICA_INFO_KEY = "replica"
+
+
+def is_replica(session) -> bool:
+    """Las lecturas de la réplica pueden estar atrasadas: no se guardan en la caché de entidades."""
+    return session.info.get(REPLICA_INFO_KEY, False)
+
+
+def read_from_primary(request: HTTPConnection) -> bool:
+    """True si el cliente escribió hace menos de READ_YOUR_WRITES_SECONDS."""
+    try:
+        ultima = float(request.cookies.get(WRITE_COOKIE, ""))
+    except ValueError:
+        return False
+    return time.time() - ultima < READ_YOUR_WRITES_SECONDS
+
+
+class ReadYourWritesMiddleware:
+    """Marca con una cookie a los clientes que acaban de escribir con éxito."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in UNSAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                cookie = (
+                    f"{WRITE_COOKIE}={time.time():.3f}; Max-Age={READ_YOUR_WRITES_SECONDS}; "
+                    "Path=/; HttpOnly; SameSite=Lax"
+                )
+                message["headers"] = [*message.get("headers", []), (b"set-cookie", cookie.encode("latin-1"))]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -1,117 +1,604 @@
-from typing import List, Optional, Sequence
-from sqlmodel import Session, select
-from sqlalchemy import func
-from app.models import Auto, AutoCreate, Venta, VentaCreate
+import csv
+import io
+from datetime import date, datetime, time, timedelta
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Type, TypeVar
+from sqlmodel import Session, SQLModel, select
+from sqlalchemy import Float, Numeric, Row, and_, cast, delete, false, func, insert, or_, tuple_, update
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from app import cambios, search, stats
+from app.chasis import MAX_INTENTOS, chasis_allocator
+from app.cache import EntityCache, attach, auto_cache, entity_data, venta_cache
+from app.models import Auto, AutoCreate, AutoFiltro, Job, Venta, VentaCreate, VentaFiltro, VentaResumen
+from app.replica import is_replica
+from app.utils import chunked, utcnow
+
+IN_CLAUSE_SIZE = 1000
+EXPORT_CHUNK_SIZE = 1000
+
+T = TypeVar("T")
+
+# UPDATE ... RETURNING: la entidad devuelta reemplaza a la que pudiera estar en la sesión.
+RETURNING_OPTIONS = {"synchronize_session": False, "populate_existing": True}
+
+
+class VersionConflict(Exception):
+    """La entidad existe, pero su versión ya no es la que esperaba el cliente."""
+
+
+class DependentVentas(Exception):
+    """Los autos a borrar tienen ventas y no se pidió borrarlas en cascada."""
+
+    def __init__(self, ventas: int):
+        super().__init__(ventas)
+        self.ventas = ventas
+
+
+def fecha_conditions(desde: Optional[date] = None, hasta: Optional[date] = None) -> list:
+    """Rango de fecha_venta por días, ambos extremos inclusive."""
+    conditions = []
+    if desde:
+        conditions.append(Venta.fecha_venta >= datetime.combine(desde, time.min))
+    if hasta:
+        conditions.append(Venta.fecha_venta < datetime.combine(hasta + timedelta(days=1), time.min))
+    return conditions
+
+
+def precio_ajustado(factor: float):
+    """precio * factor redondeado a centavos. En PostgreSQL `round(x, 2)` no existe para
+    double precision: se redondea como numeric y se vuelve a Float."""
+    return cast(func.round(cast(Venta.precio * factor, Numeric), 2), Float)
+
+
+def _exists(session: Session, model: Type[SQLModel], entity_id: int) -> bool:
+    return session.execute(select(model.id).where(model.id == entity_id)).first() is not None
+
+
+def bulk_insert(session: Session, model: Type[SQLModel], rows: List[dict], return_ids: bool = False) -> List[int]:
+    """Inserta filas sin RETURNING: COPY sobre psycopg2, INSERT multi-fila en otros drivers.
+
+    Con `return_ids` devuelve los ids asignados: en PostgreSQL se reservan antes de la secuencia
+    y viajan en el COPY; en el resto se leen con el RETURNING del INSERT.
+    """
+    if not rows:
+        return []
+    bind = session.get_bind()
+    if bind.dialect.driver != "psycopg2":
+        if return_ids:
+            return list(session.scalars(insert(model).returning(model.id), rows))
+        session.execute(insert(model), rows)
+        return []
+    ids: List[int] = []
+    if return_ids:
+        secuencia = session.execute(
+            select(func.pg_get_serial_sequence(model.__tablename__, "id"))
+        ).scalar_one()
+        ids = list(session.scalars(select(func.nextval(secuencia)).select_from(func.generate_series(1, len(rows)))))
+        rows = [{**row, "id": id_} for row, id_ in zip(rows, ids)]
+    # COPY no aplica los defaults del lado de Python (version, updated_at, ...).
+    defaults = {
+        column.name: column.default.arg(None) if column.default.is_callable else column.default.arg
+        for column in model.__table__.columns
+        if column.default is not None and column.name not in rows[0]
+    }
+    columns = [*rows[0], *defaults]
+    rows = [{**row, **defaults} for row in rows]
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([row[column] for column in columns] for row in rows)
+    buffer.seek(0)
+    quote = bind.dialect.identifier_preparer.quote
+    copy_sql = f"COPY {quote(model.__tablename__)} ({', '.join(quote(c) for c in columns)}) FROM STDIN WITH (FORMAT csv)"
+    dbapi = bind.dialect.dbapi
+    with session.connection().connection.cursor() as cursor:
+        try:
+            cursor.copy_expert(copy_sql, buffer)
+        except dbapi.Error as e:
+            # El cursor crudo no pasa por SQLAlchemy: se traduce el error como lo haría él (una
+            # colisión de chasis llega como IntegrityError y _insert_with_chasis la reintenta).
+            raise DBAPIError.instance(copy_sql, None, e, dbapi.Error, dialect=bind.dialect) from e
+    return ids
 
 
 class AutoRepository:
-    def __init__(self, session: Session):
+    def __init__(self, session: Session, cache: Optional[EntityCache] = None):
         self.session = session
+        self.cache = cache if cache is not None else auto_cache
 
-    def create(self, auto_create: AutoCreate) -> Auto:
-        auto = Auto.model_validate(auto_create, from_attributes=True)
-        self.session.add(auto)
-        self.session.commit()
-        self.session.refresh(auto)
-        return auto
+    def store_in_cache(self, auto: Auto) -> None:
+        if is_replica(self.session):
+            return
+        data = entity_data(auto)
+        self.cache.set(f"id:{auto.id}", data)
+        self.cache.set(f"chasis:{auto.numero_chasis}", data)
 
-    def get_by_id(self, auto_id: int) -> Optional[Auto]:
-        return self.session.get(Auto, auto_id)
+    def _cache_invalidate(self, auto_id: int, numero_chasis: str, version: int) -> None:
+        """`version`: la mínima que puede volver a guardarse (la nueva, o la siguiente tras un borrado)."""
+        self.cache.invalidate(f"id:{auto_id}", f"chasis:{numero_chasis}", version=version)
 
-    def get_all(self, marca: Optional[str] = None, modelo: Optional[str] = None, skip: int = 0, limit: int = 10) -> Sequence[Auto]:
-        statement = select(Auto)
+    def _filter(self, statement, marca: Optional[str] = None, modelo: Optional[str] = None):
         if marca:
-            statement = statement.where(func.lower(Auto.marca).like(f"%{marca.lower()}%"))
+            statement = statement.where(search.contains(self.session, Auto, "marca", marca))
         if modelo:
-            statement = statement.where(func.lower(Auto.modelo).like(f"%{modelo.lower()}%"))
-        statement = statement.offset(skip).limit(limit)
-        return self.session.exec(statement).all()
+            statement = statement.where(search.contains(self.session, Auto, "modelo", modelo))
+        return statement
+
+    def create(self, auto_create: AutoCreate) -> Auto:
+        return self.create_multiple([auto_create])[0]
+
+    def _insert_with_chasis(self, rows: List[dict], insert_rows: Callable[[List[dict]], T]) -> T:
+        """Asigna chasis a `rows`, las inserta con `insert_rows` y confirma.
+
+        No se consulta si los números están libres: si el índice único rechaza alguno, se
+        descarta el bloque del asignador y se reintenta con números nuevos.
+        """
+        for intento in range(1, MAX_INTENTOS + 1):
+            numeros = chasis_allocator.allocate(self.session, [row["año"] for row in rows])
+            for row, numero_chasis in zip(rows, numeros):
+                row["numero_chasis"] = numero_chasis
+            try:
+                result = insert_rows(rows)
+                self.session.commit()
+                return result
+            except IntegrityError as e:
+                self.session.rollback()
+                if "numero_chasis" not in str(e.orig) or intento == MAX_INTENTOS:
+                    raise
+                chasis_allocator.discard()
+
+    def get_by_id(self, auto_id: int) -> Optional[Auto]:
+        cached = self.cache.get(f"id:{auto_id}")
+        if cached is not None:
+            return attach(self.session, Auto, cached)
+        auto = self.session.get(Auto, auto_id)
+        if auto:
+            self.store_in_cache(auto)
+        return auto
+
+    def get_by_id_with_ventas(self, auto_id: int) -> Optional[Auto]:
+        statement = select(Auto).where(Auto.id == auto_id).options(selectinload(Auto.ventas))
+        return self.session.exec(statement).first()
+
+    def _page(self, statement, marca: Optional[str], modelo: Optional[str], skip: int, limit: int,
+              after_id: Optional[int]):
+        statement = self._filter(statement, marca, modelo)
+        if after_id is not None:
+            statement = statement.where(Auto.id > after_id)
+        else:
+            statement = statement.offset(skip)
+        return statement.order_by(Auto.id).limit(limit)
+
+    def get_all_rows(self, columns: Sequence[str], marca: Optional[str] = None, modelo: Optional[str] = None,
+                     skip: int = 0, limit: int = 10, after_id: Optional[int] = None) -> Sequence[Row]:
+        """Página de autos con sólo las columnas pedidas, sin construir entidades."""
+        statement = select(*(getattr(Auto, name) for name in columns))
+        return self.session.execute(self._page(statement, marca, modelo, skip, limit, after_id)).all()
+
+    def iter_rows(self, columns: Sequence[str], marca: Optional[str] = None, modelo: Optional[str] = None,
+                  chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[Row]:
+        statement = self._filter(select(*(getattr(Auto, name) for name in columns)), marca, modelo)
+        statement = statement.order_by(Auto.id).execution_options(yield_per=chunk_size)
+        yield from self.session.execute(statement)
 
     def get_by_chasis(self, numero_chasis: str) -> Optional[Auto]:
+        cached = self.cache.get(f"chasis:{numero_chasis}")
+        if cached is not None:
+            return attach(self.session, Auto, cached)
         statement = select(Auto).where(Auto.numero_chasis == numero_chasis)
-        return self.session.exec(statement).first()
+        auto = self.session.exec(statement).first()
+        if auto:
+            self.store_in_cache(auto)
+        return auto
 
-    def update(self, auto_id: int, auto_data: dict) -> Optional[Auto]:
-        auto = self.get_by_id(auto_id)
-        if not auto:
+    def get_existing_ids(self, auto_ids: Iterable[int]) -> Set[int]:
+        pendientes = set(auto_ids)
+        existentes = {auto_id for auto_id in pendientes if self.cache.get(f"id:{auto_id}") is not None}
+        for lote in chunked(list(pendientes - existentes), IN_CLAUSE_SIZE):
+            statement = select(Auto.id).where(Auto.id.in_(lote))
+            existentes.update(self.session.exec(statement).all())
+        return existentes
+
+    def bulk_load(self, autos: List[AutoCreate]) -> None:
+        rows = [auto.model_dump() for auto in autos]
+        self._insert_with_chasis(rows, lambda rows: bulk_insert(self.session, Auto, rows))
+
+    def update(self, auto_id: int, auto_data: dict, versions: Optional[Iterable[int]] = None) -> Optional[Auto]:
+        """Modifica el auto con un único UPDATE ... RETURNING.
+
+        Con `versions` sólo se modifica si la versión actual es una de ellas (If-Match); si el
+        auto existe con otra versión se lanza VersionConflict. None si el auto no existe.
+        Sin cambios no se escribe: se devuelve el auto actual con su versión. Si cambian marca o
+        modelo, sus ventas pasan a otros grupos del resumen: se recalculan los viejos y los nuevos.
+        """
+        if not auto_data:
+            auto = self.get_by_id(auto_id)
+            if auto is not None and versions is not None and auto.version not in versions:
+                raise VersionConflict()
+            return auto
+        keys = set()
+        if "marca" in auto_data or "modelo" in auto_data:
+            keys = stats.keys_where(self.session, Venta.auto_id == auto_id)
+        statement = update(Auto).where(Auto.id == auto_id)
+        if versions is not None:
+            statement = statement.where(Auto.version.in_(list(versions)))
+        statement = statement.values(**auto_data, version=Auto.version + 1, updated_at=utcnow()).returning(Auto)
+        auto = self.session.scalars(statement, execution_options=RETURNING_OPTIONS).first()
+        if auto is None:
+            self.session.rollback()
+            if versions is not None and _exists(self.session, Auto, auto_id):
+                raise VersionConflict()
             return None
-        for key, value in auto_data.items():
-            setattr(auto, key, value)
-        self.session.add(auto)
+        self.session.expunge(auto)
+        if keys:
+            stats.recompute(self.session, keys | {(auto_id, auto.marca, auto.modelo, mes) for _, _, _, mes in keys})
         self.session.commit()
-        self.session.refresh(auto)
+        self._cache_invalidate(auto_id, auto.numero_chasis, auto.version)
         return auto
 
     def delete(self, auto_id: int) -> bool:
         auto = self.get_by_id(auto_id)
         if not auto:
             return False
+        numero_chasis, version = auto.numero_chasis, auto.version
         self.session.delete(auto)
         self.session.commit()
+        self._cache_invalidate(auto_id, numero_chasis, version + 1)
         return True
 
     def create_multiple(self, autos: List[AutoCreate]) -> List[Auto]:
-        created_autos = []
-        for auto_create in autos:
-            auto = self.create(auto_create)
-            created_autos.append(auto)
+        if not autos:
+            return []
+        return self._insert_with_chasis([auto.model_dump() for auto in autos], self._insert_returning)
+
+    def _insert_returning(self, rows: List[dict]) -> List[Auto]:
+        # Sin sort_by_parameter_order SQLite puede agrupar las filas en un único INSERT;
+        # el orden de entrada se recupera por numero_chasis, que es único por fila.
+        inserted = {auto.numero_chasis: auto for auto in self.session.scalars(insert(Auto).returning(Auto), rows)}
+        created_autos = [inserted[row["numero_chasis"]] for row in rows]
+        # Se desvinculan para que el commit no los expire y no haga falta un refresh por fila.
+        for auto in created_autos:
+            self.session.expunge(auto)
         return created_autos
 
+    def _bulk_conditions(self, filtro: AutoFiltro) -> list:
+        conditions = []
+        if filtro.ids is not None:
+            conditions.append(Auto.id.in_(filtro.ids))
+        if filtro.marca:
+            conditions.append(search.contains(self.session, Auto, "marca", filtro.marca))
+        if filtro.modelo:
+            conditions.append(search.contains(self.session, Auto, "modelo", filtro.modelo))
+        return conditions
+
+    def count_matching(self, filtro: AutoFiltro) -> Tuple[int, int]:
+        """Autos que cumplen el filtro y ventas de esos autos."""
+        autos = select(Auto.id).where(*self._bulk_conditions(filtro))
+        return (
+            self.session.execute(select(func.count()).select_from(autos.subquery())).scalar_one(),
+            self.session.execute(select(func.count()).where(Venta.auto_id.in_(autos))).scalar_one(),
+        )
+
+    def bulk_delete(self, filtro: AutoFiltro, cascada: bool = False) -> Tuple[int, int]:
+        """Borra con sentencias por conjunto los autos del filtro; devuelve (autos, ventas) borrados.
+
+        Si hay ventas de esos autos se lanza DependentVentas, salvo con `cascada`: entonces se
+        borran también las ventas y sus grupos del resumen de estadísticas.
+        """
+        autos = select(Auto.id).where(*self._bulk_conditions(filtro))
+        ventas: Sequence[Row] = []
+        if cascada:
+            keys = stats.keys_where(self.session, Venta.auto_id.in_(autos))
+            ventas = self.session.execute(
+                delete(Venta).where(Venta.auto_id.in_(autos)).returning(Venta.id, Venta.version),
+                execution_options=RETURNING_OPTIONS,
+            ).all()
+            stats.recompute(self.session, keys)
+            cambios.record(self.session, cambios.ELIMINADA, [venta_id for venta_id, _ in ventas])
+        else:
+            dependientes = self.session.execute(select(func.count()).where(Venta.auto_id.in_(autos))).scalar_one()
+            if dependientes:
+                raise DependentVentas(dependientes)
+        borrados = self.session.execute(
+            delete(Auto).where(Auto.id.in_(autos)).returning(Auto.id, Auto.numero_chasis, Auto.version),
+            execution_options=RETURNING_OPTIONS,
+        ).all()
+        self.session.commit()
+        for auto_id, numero_chasis, version in borrados:
+            self._cache_invalidate(auto_id, numero_chasis, version + 1)
+        for venta_id, version in ventas:
+            venta_cache.invalidate(f"id:{venta_id}", version=version + 1)
+        return len(borrados), len(ventas)
+
+
 class VentaRepository:
-    def __init__(self, session: Session):
+    def __init__(self, session: Session, cache: Optional[EntityCache] = None):
         self.session = session
+        self.cache = cache if cache is not None else venta_cache
+
+    @staticmethod
+    def _select(load_auto: bool = False):
+        statement = select(Venta)
+        if load_auto:
+            statement = statement.options(selectinload(Venta.auto))
+        return statement
 
     def create(self, venta_create: VentaCreate) -> Venta:
         venta = Venta.model_validate(venta_create, from_attributes=True)
         self.session.add(venta)
+        self.session.flush()
+        stats.record_added(self.session, [(venta.auto_id, venta.fecha_venta, venta.precio)])
+        cambios.record(self.session, cambios.CREADA, [venta.id])
         self.session.commit()
         self.session.refresh(venta)
         return venta
 
-    def get_by_id(self, venta_id: int) -> Optional[Venta]:
-        return self.session.get(Venta, venta_id)
+    def get_by_id(self, venta_id: int, load_auto: bool = False) -> Optional[Venta]:
+        cached = self.cache.get(f"id:{venta_id}")
+        if cached is not None:
+            venta = attach(self.session, Venta, cached)
+            if load_auto:
+                set_committed_value(venta, "auto", AutoRepository(self.session).get_by_id(venta.auto_id))
+            return venta
+        options = [selectinload(Venta.auto)] if load_auto else None
+        venta = self.session.get(Venta, venta_id, options=options)
+        if venta and not is_replica(self.session):
+            self.cache.set(f"id:{venta.id}", entity_data(venta))
+            if load_auto and venta.auto:
+                AutoRepository(self.session).store_in_cache(venta.auto)
+        return venta
+
+    @staticmethod
+    def _row_select(columns: Sequence[str], auto_columns: Sequence[str]):
+        statement = select(*(getattr(Venta, name) for name in columns), *(getattr(Auto, name) for name in auto_columns))
+        # Sin columnas del auto (p. ej. `fields=` sin campos `auto.*`) no hace falta el JOIN.
+        return statement.outerjoin(Auto, Auto.id == Venta.auto_id) if auto_columns else statement
+
+    @staticmethod
+    def _page(statement, skip: int, limit: int, after: Optional[Tuple[datetime, int]],
+              desde: Optional[date] = None, hasta: Optional[date] = None):
+        statement = statement.where(*fecha_conditions(desde, hasta))
+        if after is not None:
+            statement = statement.where(tuple_(Venta.fecha_venta, Venta.id) > tuple_(*after))
+        else:
+            statement = statement.offset(skip)
+        return statement.order_by(Venta.fecha_venta, Venta.id).limit(limit)
+
+    def get_all_rows(self, columns: Sequence[str], auto_columns: Sequence[str] = (), skip: int = 0, limit: int = 10,
+                     after: Optional[Tuple[datetime, int]] = None, desde: Optional[date] = None,
+                     hasta: Optional[date] = None) -> Sequence[Row]:
+        """Página de ventas con las columnas pedidas de la venta seguidas por las de su auto."""
+        statement = self._page(self._row_select(columns, auto_columns), skip, limit, after, desde, hasta)
+        return self.session.execute(statement).all()
 
-    def get_all(self, skip: int = 0, limit: int = 10) -> Sequence[Venta]:
-        statement = select(Venta).offset(skip).limit(limit)
-        return self.session.exec(statement).all()
+    def iter_rows(self, columns: Sequence[str], desde: Optional[date] = None, hasta: Optional[date] = None,
+                  chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[Row]:
+        statement = select(*(getattr(Venta, name) for name in columns)).where(*fecha_conditions(desde, hasta))
+        statement = statement.order_by(Venta.fecha_venta, Venta.id).execution_options(yield_per=chunk_size)
+        yield from self.session.execute(statement)
 
-    def get_by_auto_id(self, auto_id: int) -> Sequence[Venta]:
-        statement = select(Venta).where(Venta.auto_id == auto_id)
-        return self.session.exec(statement).all()
+    def get_by_auto_id(self, auto_id: int, load_auto: bool = False, desde: Optional[date] = None,
+                       hasta: Optional[date] = None) -> Sequence[Venta]:
+        """Ventas del auto ordenadas por fecha; usa el índice (auto_id, fecha_venta)."""
+        statement = self._select(load_auto).where(Venta.auto_id == auto_id, *fecha_conditions(desde, hasta))
+        return self.session.exec(statement.order_by(Venta.fecha_venta, Venta.id)).all()
 
-    def get_by_comprador(self, nombre: str) -> Sequence[Venta]:
-        statement = select(Venta).where(
-        func.lower(Venta.nombre_comprador).like(f"%{nombre.lower()}%")
-    )
-        return self.session.exec(statement).all()
+    def get_rows_by_comprador(self, nombre: str, columns: Sequence[str], auto_columns: Sequence[str] = (),
+                              skip: int = 0, limit: int = 100) -> Sequence[Row]:
+        statement = search.ranked(self.session, self._row_select(columns, auto_columns), Venta, "nombre_comprador",
+                                  nombre)
+        return self.session.execute(statement.offset(skip).limit(limit)).all()
 
-    def update(self, venta_id: int, venta_data: dict) -> Optional[Venta]:
-        venta = self.get_by_id(venta_id)
-        if not venta:
+    def bulk_load(self, ventas: List[VentaCreate]) -> None:
+        ids = bulk_insert(self.session, Venta, [venta.model_dump() for venta in ventas], return_ids=True)
+        stats.record_added(self.session, [(venta.auto_id, venta.fecha_venta, venta.precio) for venta in ventas])
+        cambios.record(self.session, cambios.CREADA, sorted(ids))
+        self.session.commit()
+
+    def update(self, venta_id: int, venta_data: dict,
+               versions: Optional[Iterable[Tuple[int, int]]] = None) -> Optional[Venta]:
+        """Modifica la venta con un único UPDATE ... RETURNING, como AutoRepository.update.
+
+        `versions` son pares (versión de la venta, versión de su auto), que es lo que identifica
+        la representación de la venta. Si cambian fecha o precio se leen antes los grupos del
+        resumen de la venta (bloqueando la fila), para recalcular también los que deja.
+        Sin cambios no se escribe: se devuelve la venta actual con su versión.
+        """
+        if not venta_data:
+            venta = self.get_by_id(venta_id, load_auto=True)
+            if venta is not None and versions is not None and (venta.version, venta.auto.version) not in versions:
+                raise VersionConflict()
+            return venta
+        keys = set()
+        if "fecha_venta" in venta_data or "precio" in venta_data:
+            keys = stats.keys_where(self.session, Venta.id == venta_id, for_update=True)
+            if not keys:
+                return None
+        statement = update(Venta).where(Venta.id == venta_id)
+        if versions is not None:
+            auto_version = select(Auto.version).where(Auto.id == Venta.auto_id).scalar_subquery()
+            statement = statement.where(or_(false(), *(
+                and_(Venta.version == version, auto_version == version_auto) for version, version_auto in versions
+            )))
+        statement = statement.values(**venta_data, version=Venta.version + 1, updated_at=utcnow()).returning(Venta)
+        venta = self.session.scalars(statement, execution_options=RETURNING_OPTIONS).first()
+        if venta is None:
+            self.session.rollback()
+            if versions is not None and (keys or _exists(self.session, Venta, venta_id)):
+                raise VersionConflict()
             return None
-        for key, value in venta_data.items():
-            setattr(venta, key, value)
-        self.session.add(venta)
+        self.session.expunge(venta)
+        if keys:
+            auto_id, marca, modelo, _ = next(iter(keys))
+            stats.recompute(self.session, keys | {(auto_id, marca, modelo, stats.mes_de(venta.fecha_venta))})
+        cambios.record(self.session, cambios.MODIFICADA, [venta_id])
         self.session.commit()
-        self.session.refresh(venta)
+        self.cache.invalidate(f"id:{venta_id}", version=venta.version)
+        # El auto no cambia con la venta: se toma de la caché para armar la respuesta y su ETag.
+        set_committed_value(venta, "auto", AutoRepository(self.session).get_by_id(venta.auto_id))
         return venta
 
     def delete(self, venta_id: int) -> bool:
-        venta = self.get_by_id(venta_id)
-        if not venta:
+        """Borra la venta con un único DELETE ... RETURNING.
+
+        Los grupos del resumen salen de la fila borrada, nunca de la caché. Si otra petición ya
+        la borró no vuelve ninguna fila: no se registra el cambio y se devuelve False (404).
+        """
+        marca = select(Auto.marca).where(Auto.id == Venta.auto_id).scalar_subquery()
+        modelo = select(Auto.modelo).where(Auto.id == Venta.auto_id).scalar_subquery()
+        statement = delete(Venta).where(Venta.id == venta_id).returning(
+            Venta.auto_id, marca, modelo, Venta.fecha_venta, Venta.version,
+        )
+        row = self.session.execute(statement).first()
+        if row is None:
+            self.session.rollback()
             return False
-        self.session.delete(venta)
+        auto_id, marca, modelo, fecha_venta, version = row
+        stats.recompute(self.session, {(auto_id, marca, modelo, stats.mes_de(fecha_venta))})
+        cambios.record(self.session, cambios.ELIMINADA, [venta_id])
         self.session.commit()
+        self.cache.invalidate(f"id:{venta_id}", version=version + 1)
         return True
 
+    def _bulk_conditions(self, filtro: VentaFiltro) -> list:
+        conditions = fecha_conditions(filtro.desde, filtro.hasta)
+        if filtro.ids is not None:
+            conditions.append(Venta.id.in_(filtro.ids))
+        if filtro.auto_id is not None:
+            conditions.append(Venta.auto_id == filtro.auto_id)
+        if filtro.comprador:
+            conditions.append(search.contains(self.session, Venta, "nombre_comprador", filtro.comprador))
+        if filtro.marca or filtro.modelo:
+            autos = AutoRepository(self.session)._bulk_conditions(AutoFiltro(marca=filtro.marca, modelo=filtro.modelo))
+            conditions.append(Venta.auto_id.in_(select(Auto.id).where(*autos)))
+        return conditions
+
+    def count_matching(self, filtro: VentaFiltro) -> int:
+        statement = select(func.count()).select_from(Venta).where(*self._bulk_conditions(filtro))
+        return self.session.execute(statement).scalar_one()
+
+    def bulk_update(self, filtro: VentaFiltro, venta_data: dict, precio_factor: Optional[float] = None) -> int:
+        """Modifica con un único UPDATE las ventas del filtro; devuelve cuántas cambiaron.
+
+        `precio_factor` multiplica el precio de cada venta (redondeado a centavos). Si cambian
+        precio o fecha, se recalculan los grupos del resumen que tocaban esas ventas.
+        """
+        conditions = self._bulk_conditions(filtro)
+        values = {**venta_data, "version": Venta.version + 1, "updated_at": utcnow()}
+        if precio_factor is not None:
+            values["precio"] = precio_ajustado(precio_factor)
+        keys = set()
+        if "precio" in values or "fecha_venta" in values:
+            keys = stats.keys_where(self.session, *conditions)
+        statement = update(Venta).where(*conditions).values(**values).returning(Venta.id, Venta.version)
+        modificadas = self.session.execute(statement, execution_options=RETURNING_OPTIONS).all()
+        ids = [venta_id for venta_id, _ in modificadas]
+        if "fecha_venta" in values:
+            mes = stats.mes_de(values["fecha_venta"])
+            keys |= {(auto_id, marca, modelo, mes) for auto_id, marca, modelo, _ in keys}
+        if keys:
+            stats.recompute(self.session, keys)
+        cambios.record(self.session, cambios.MODIFICADA, sorted(ids))
+        self.session.commit()
+        for venta_id, version in modificadas:
+            self.cache.invalidate(f"id:{venta_id}", version=version)
+        return len(ids)
+
     def count_by_modelo(self, modelo: str) -> int:
-        statement = select(func.count()).select_from(Venta).join(Auto).where(Auto.modelo == modelo)
+        statement = select(func.sum(VentaResumen.cantidad)).where(VentaResumen.modelo == modelo)
         result = self.session.exec(statement).first()
         return result if result is not None else 0
 
     def create_multiple(self, ventas: List[VentaCreate]) -> List[Venta]:
-        created_ventas = []
-        for venta_create in ventas:
-            venta = self.create(venta_create)
-            created_ventas.append(venta)
-        return created_ventas
\ No newline at end of file
+        if not ventas:
+            return []
+        rows = [venta.model_dump() for venta in ventas]
+        statement = insert(Venta).returning(Venta).options(selectinload(Venta.auto))
+        # Los ids se asignan en el orden de los VALUES, así que ordenar por id
+        # recupera el orden de entrada sin forzar un INSERT por fila en SQLite.
+        created_ventas = sorted(self.session.scalars(statement, rows).all(), key=lambda venta: venta.id)
+        autos = {venta.auto_id: venta.auto for venta in created_ventas}
+        # Los autos llegaron con el RETURNING, en esta transacción: no hace falta volver a leerlos.
+        stats.record_added(self.session, [(venta.auto_id, venta.fecha_venta, venta.precio) for venta in created_ventas],
+                           {auto_id: (auto.marca, auto.modelo) for auto_id, auto in autos.items()})
+        cambios.record(self.session, cambios.CREADA, [venta.id for venta in created_ventas])
+        for instance in [*created_ventas, *autos.values()]:
+            self.session.expunge(instance)
+        self.session.commit()
+        return created_ventas
+
+
+class JobRepository:
+    """Estado de los trabajos en segundo plano. Los cambios de estado son UPDATE condicionales,
+    para que dos procesos no tomen el mismo trabajo."""
+
+    def __init__(self, session: Session):
+        self.session = session
+
+    def create(self, tipo: str, payload: List[dict]) -> Job:
+        job = Job(tipo=tipo, payload=payload, total=len(payload))
+        self.session.add(job)
+        self.session.commit()
+        self.session.refresh(job)
+        return job
+
+    def get_by_id(self, job_id: int) -> Optional[Job]:
+        return self.session.get(Job, job_id)
+
+    def count_unfinished(self) -> int:
+        statement = select(func.count()).select_from(Job).where(Job.estado.in_(("pendiente", "en_curso")))
+        return self.session.execute(statement).scalar_one()
+
+    def _claimable(self, stale_before: datetime):
+        return or_(Job.estado == "pendiente", and_(Job.estado == "en_curso", Job.updated_at < stale_before))
+
+    def get_claimable_ids(self, stale_before: datetime) -> Sequence[int]:
+        """Pendientes y en curso sin avances desde `stale_before` (su proceso se detuvo)."""
+        return self.session.exec(select(Job.id).where(self._claimable(stale_before)).order_by(Job.id)).all()
+
+    def claim(self, job_id: int, stale_before: datetime) -> Optional[Job]:
+        ahora = utcnow()
+        statement = (
+            update(Job)
+            .where(Job.id == job_id, self._claimable(stale_before))
+            .values(estado="en_curso", started_at=func.coalesce(Job.started_at, ahora), updated_at=ahora)
+            .returning(Job)
+        )
+        job = self.session.scalars(statement, execution_options=RETURNING_OPTIONS).first()
+        if job is not None:
+            # El avance se escribe con save_progress; la entidad no debe sumar sus propios UPDATE.
+            self.session.expunge(job)
+        self.session.commit()
+        return job
+
+    def save_progress(self, job: Job) -> None:
+        """Registra el avance sin confirmar: va en la misma transacción que el bloque procesado."""
+        self.session.execute(
+            update(Job).where(Job.id == job.id).values(
+                procesados=job.procesados, creados=job.creados, errores=job.errores, updated_at=utcnow()
+            )
+        )
+
+    def release(self, job: Job) -> None:
+        """Devuelve a `pendiente` un trabajo en curso que este proceso deja (apagado ordenado)."""
+        self.session.execute(
+            update(Job).where(Job.id == job.id, Job.estado == "en_curso").values(estado="pendiente", updated_at=utcnow())
+        )
+        self.session.commit()
+
+    def heartbeat(self, job_ids: Iterable[int]) -> None:
+        """Renueva `updated_at` de los trabajos en curso de este proceso, para que nadie los dé por abandonados."""
+        job_ids = list(job_ids)
+        if job_ids:
+            self.session.execute(
+                update(Job).where(Job.id.in_(job_ids), Job.estado == "en_curso").values(updated_at=utcnow())
+            )
+            self.session.commit()
+
+    def finish(self, job: Job, estado: str, detalle: Optional[str] = None) -> None:
+        ahora = utcnow()
+        values = {"estado": estado, "detalle": detalle, "finished_at": ahora, "updated_at": ahora}
+        if estado == "completado":
+            # Los ítems ya están en sus tablas; con error se conservan para diagnosticar.
+            values["payload"] = []
+        self.session.execute(update(Job).where(Job.id == job.id).values(**values))
+        self.session.commit()
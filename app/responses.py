@@ -0,0 +1,39 @@
+from typing import Any, Iterable, List, Optional, Sequence
+
+from fastapi import HTTPException, Response
+from fastapi.responses import ORJSONResponse
+
+
+def row_dicts(rows: Iterable[Sequence], fields: Sequence[str]) -> List[dict]:
+    """Arma los objetos de respuesta a partir de filas de columnas, en el orden de `fields`."""
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def parse_fields(fields: Optional[str], allowed: Sequence[str]) -> List[str]:
+    """Campos de un `fields=a,b` (sparse fieldset) en el orden de `allowed`; todos si no se indicó.
+
+    400 si pide un campo que no existe, para que un error de tipeo no devuelva objetos vacíos.
+    """
+    if fields is None:
+        return list(allowed)
+    pedidos = {field.strip() for field in fields.split(",") if field.strip()}
+    desconocidos = pedidos.difference(allowed)
+    if desconocidos:
+        raise HTTPException(status_code=400, detail=f"Campos desconocidos en fields: {', '.join(sorted(desconocidos))}.")
+    if not pedidos:
+        raise HTTPException(status_code=400, detail="Indicar al menos un campo en fields.")
+    return [field for field in allowed if field in pedidos]
+
+
+def unique(names: Iterable[str]) -> List[str]:
+    return list(dict.fromkeys(names))
+
+
+def fast_json(content: Any, response: Response) -> ORJSONResponse:
+    """Serializa con orjson datos que vienen de la BD, sin volver a validarlos contra el response_model.
+
+    Conserva los headers y el status que el endpoint fijó en `response` (ETag, X-Next-Cursor, ...).
+    """
+    fast = ORJSONResponse(content, status_code=response.status_code or 200)
+    fast.headers.raw.extend(response.headers.raw)
+    return fast
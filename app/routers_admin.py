@@ -0,0 +1,23 @@
+from fastapi import APIRouter
+
+from app import database
+from app.cache import auto_cache, venta_cache
+from app.pool import pool_status
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+@router.get("/cache")
+def get_cache_stats():
+    return {
+        "autos": auto_cache.stats(),
+        "ventas": venta_cache.stats(),
+    }
+
+@router.get("/pool")
+def get_pool_stats():
+    pools = {"sync": pool_status(database.engine)}
+    if database.read_engine is not None:
+        pools["read"] = pool_status(database.read_engine)
+    for name, async_engine in database.current_async_engines().items():
+        pools[name] = pool_status(async_engine.sync_engine)
+    return pools
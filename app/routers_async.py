@@ -0,0 +1,132 @@
+import functools
+import inspect
+from typing import Callable
+
+from fastapi import APIRouter, Depends, Response
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.params import Depends as DependsParam
+from fastapi.responses import StreamingResponse
+from fastapi.routing import APIRoute
+from pydantic import TypeAdapter
+from sqlalchemy.util import greenlet_spawn
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.database import get_async_read_session, get_async_session, get_read_session, get_session
+
+
+async def get_bridged_session(session: AsyncSession = Depends(get_async_session)) -> Session:
+    """Sesión sync de una AsyncSession. Sus consultas sólo pueden ejecutarse dentro de `greenlet_spawn`."""
+    return session.sync_session
+
+
+async def get_bridged_read_session(session: AsyncSession = Depends(get_async_read_session)) -> Session:
+    return session.sync_session
+
+
+SESSION_BRIDGES = {get_session: get_bridged_session, get_read_session: get_bridged_read_session}
+
+
+def _uses_session(dependency: Callable) -> bool:
+    if dependency in SESSION_BRIDGES:
+        return True
+    return any(
+        isinstance(param.default, DependsParam) and param.default.dependency is not None
+        and _uses_session(param.default.dependency)
+        for param in inspect.signature(dependency).parameters.values()
+    )
+
+
+def _bridged_signature(call: Callable) -> inspect.Signature:
+    signature = inspect.signature(call)
+    params = []
+    for param in signature.parameters.values():
+        default = param.default
+        if isinstance(default, DependsParam) and default.dependency is not None and _uses_session(default.dependency):
+            param = param.replace(default=Depends(_bridge(default.dependency), use_cache=default.use_cache))
+        params.append(param)
+    return signature.replace(parameters=params)
+
+
+@functools.lru_cache(maxsize=None)
+def _bridge(dependency: Callable) -> Callable:
+    """Versión de una dependencia (p. ej. `get_auto_repo`) que recibe la sesión de la AsyncSession."""
+    if dependency in SESSION_BRIDGES:
+        return SESSION_BRIDGES[dependency]
+
+    # Las fábricas de repositorios no hacen I/O: se ejecutan en el event loop sin pasar por el threadpool.
+    @functools.wraps(dependency)
+    async def bridged(**kwargs):
+        return dependency(**kwargs)
+
+    bridged.__signature__ = _bridged_signature(dependency)
+    return bridged
+
+
+def _async_endpoint(route: APIRoute) -> Callable:
+    endpoint = route.endpoint
+    adapter = TypeAdapter(route.response_model) if route.response_model else None
+
+    def call(**kwargs):
+        result = endpoint(**kwargs)
+        if adapter is None or isinstance(result, Response):
+            return result
+        # Se serializa dentro del greenlet: un atributo sin cargar no puede hacer lazy load afuera.
+        return adapter.validate_python(result, from_attributes=True)
+
+    @functools.wraps(endpoint)
+    async def wrapper(**kwargs):
+        return await greenlet_spawn(call, **kwargs)
+
+    wrapper.__signature__ = _bridged_signature(endpoint)
+    return wrapper
+
+
+def _is_convertible(route) -> bool:
+    if not isinstance(route, APIRoute) or inspect.iscoroutinefunction(route.endpoint):
+        return False
+    response_class = route.response_class
+    if isinstance(response_class, DefaultPlaceholder):
+        response_class = response_class.value
+    # Los exports iteran la consulta mientras se envía la respuesta: siguen con la sesión sync.
+    return not issubclass(response_class, StreamingResponse)
+
+
+def to_async_router(router: APIRouter) -> APIRouter:
+    """Copia las rutas de `router` convirtiendo cada endpoint sync en `async def` sobre AsyncSession.
+
+    El handler original se ejecuta con `greenlet_spawn`, igual que `AsyncSession.run_sync`: la
+    lógica y las validaciones son las mismas en ambos modos, pero las consultas van por el driver
+    async y el request no retiene un thread del threadpool mientras espera a la base.
+    """
+    async_router = APIRouter()
+    for route in router.routes:
+        if not _is_convertible(route):
+            async_router.routes.append(route)
+            continue
+        async_router.add_api_route(
+            route.path,
+            _async_endpoint(route),
+            response_model=route.response_model,
+            status_code=route.status_code,
+            tags=route.tags,
+            dependencies=route.dependencies,
+            summary=route.summary,
+            description=route.description,
+            response_description=route.response_description,
+            responses=route.responses,
+            deprecated=route.deprecated,
+            methods=route.methods,
+            operation_id=route.operation_id,
+            response_model_include=route.response_model_include,
+            response_model_exclude=route.response_model_exclude,
+            response_model_by_alias=route.response_model_by_alias,
+            response_model_exclude_unset=route.response_model_exclude_unset,
+            response_model_exclude_defaults=route.response_model_exclude_defaults,
+            response_model_exclude_none=route.response_model_exclude_none,
+            include_in_schema=route.include_in_schema,
+            response_class=route.response_class,
+            name=route.name,
+            openapi_extra=route.openapi_extra,
+        )
+    return async_router
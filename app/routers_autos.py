@@ -1,95 +1,173 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 from sqlmodel import Session
-from typing import Sequence, Optional
-from app.database import get_session
-from app.models import Auto, AutoCreate, AutoRead, AutoReadWithVentas, AutoUpdate
-from app.repositories import AutoRepository
-from app.utils import generate_chasis_number
+from typing import List, Sequence, Optional, Union
+from app import conditional
+from app.database import get_read_session, get_session
+from app.importers import StreamingImporter
+from app.jobs import JobQueue, accepted, get_job_queue
+from app.models import (Auto, AutoBatchResult, AutoCreate, AutoFiltro, AutoRead, AutoReadWithVentas, AutoUpdate,
+                        BulkResult, ImportResult, JobRead)
+from app.exporters import ExportFormat, export_response
+from app.pagination import decode_cursor, encode_cursor
+from app.repositories import AutoRepository, DependentVentas, VersionConflict
+from app.responses import fast_json, parse_fields, row_dicts, unique
+from app.validation import batch_of, batch_validation_error, item_errors, validate_batch
 
 router = APIRouter(prefix="/autos", tags=["autos"])
 
+AUTO_FIELDS = list(AutoRead.model_fields)
+
+def get_auto_fields(fields: Optional[str] = Query(None, description="Campos a devolver separados por coma")) -> List[str]:
+    return parse_fields(fields, AUTO_FIELDS)
+
 def get_auto_repo(session: Session = Depends(get_session)):
     return AutoRepository(session)
 
+def get_auto_read_repo(session: Session = Depends(get_read_session)):
+    return AutoRepository(session)
+
+def get_auto_filtro(ids: Optional[List[int]] = Query(None), marca: Optional[str] = None,
+                    modelo: Optional[str] = None) -> AutoFiltro:
+    filtro = AutoFiltro(ids=ids, marca=marca, modelo=modelo)
+    if not filtro.model_dump(exclude_none=True):
+        raise HTTPException(status_code=400, detail="Indicar al menos un filtro.")
+    return filtro
+
+def auto_etag(auto: Auto) -> str:
+    return conditional.version_etag("auto", auto.id, auto.version)
+
 @router.post("/", response_model=AutoRead, status_code=status.HTTP_201_CREATED)
 def create_auto(auto: AutoCreate, repo: AutoRepository = Depends(get_auto_repo)):
-    while True:
-        numero_chasis = generate_chasis_number()
-        if not repo.get_by_chasis(numero_chasis):
-            break
-    
-    auto_dict = auto.model_dump()
-    auto_dict["numero_chasis"] = numero_chasis
-    auto_completo = Auto(**auto_dict)
-    
-    repo.session.add(auto_completo)
-    repo.session.commit()
-    repo.session.refresh(auto_completo)
-    
-    return auto_completo
-
-@router.post("/batch/", response_model=Sequence[AutoRead], status_code=status.HTTP_201_CREATED)
-def create_multiple_autos(autos: list[AutoCreate], repo: AutoRepository = Depends(get_auto_repo)):
-    created_autos = []
-    for auto in autos:
-        while True:
-            numero_chasis = generate_chasis_number()
-            if not repo.get_by_chasis(numero_chasis):
-                break
-        
-        auto_dict = auto.model_dump()
-        auto_dict["numero_chasis"] = numero_chasis
-        auto_completo = Auto(**auto_dict)
-        
-        repo.session.add(auto_completo)
-        repo.session.flush()
-        created_autos.append(auto_completo)
-    
-    repo.session.commit()
-    for auto_obj in created_autos:
-        repo.session.refresh(auto_obj)
-    
-    return created_autos
+    return repo.create(auto)
+
+@router.post("/batch/", response_model=Union[Sequence[AutoRead], AutoBatchResult], status_code=status.HTTP_201_CREATED,
+             responses={202: {"model": JobRead, "description": "Alta encolada (con `async=true`)"}})
+def create_multiple_autos(items: batch_of(AutoCreate),
+                          parcial: bool = False,
+                          en_segundo_plano: bool = Query(False, alias="async"),
+                          repo: AutoRepository = Depends(get_auto_repo),
+                          jobs: JobQueue = Depends(get_job_queue)):
+    validos, errores = validate_batch(AutoCreate, items)
+    if errores and (not parcial or en_segundo_plano):
+        raise batch_validation_error(errores)
+    autos = [auto for _, auto in validos]
+    if en_segundo_plano:
+        return accepted(jobs.enqueue(repo.session, "autos_batch", autos))
+    creados = repo.create_multiple(autos) if autos else []
+    if parcial:
+        return AutoBatchResult(creados=creados, errores=item_errors(errores))
+    return creados
+
+@router.post("/import", response_model=ImportResult)
+async def import_autos(request: Request, formato: ExportFormat = "ndjson", repo: AutoRepository = Depends(get_auto_repo)):
+    def write(items):
+        repo.bulk_load([auto for _, auto in items])
+        return []
+
+    return await StreamingImporter(AutoCreate, write, formato).run(request.stream())
 
 @router.get("/", response_model=Sequence[AutoRead])
 def list_autos(
+    request: Request,
+    response: Response,
     marca: Optional[str] = None,
     modelo: Optional[str] = None,
     skip: int = 0, 
     limit: int = 10, 
-    repo: AutoRepository = Depends(get_auto_repo)
+    cursor: Optional[str] = None,
+    fields: List[str] = Depends(get_auto_fields),
+    repo: AutoRepository = Depends(get_auto_read_repo)
 ):
-    return repo.get_all(marca=marca, modelo=modelo, skip=skip, limit=limit)
+    after_id = None
+    if cursor:
+        try:
+            (after_id,) = decode_cursor(cursor, int)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    # Los campos pedidos y, al final, los que usan el cursor y el ETag.
+    columns = unique([*fields, "id", "version", "updated_at"])
+    rows = repo.get_all_rows(columns, marca=marca, modelo=modelo, skip=skip, limit=limit, after_id=after_id)
+    if rows and len(rows) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1].id)
+    etag = conditional.make_etag("autos", fields, [(row.id, row.version) for row in rows])
+    not_modified = conditional.check(request, response, etag, conditional.latest(row.updated_at for row in rows))
+    if not_modified:
+        return not_modified
+    return fast_json(row_dicts(rows, fields), response)
+
+@router.get("/export", response_class=StreamingResponse)
+def export_autos(
+    formato: ExportFormat = "ndjson",
+    marca: Optional[str] = None,
+    modelo: Optional[str] = None,
+    repo: AutoRepository = Depends(get_auto_read_repo)
+):
+    columns = list(AutoRead.model_fields)
+    return export_response(repo.iter_rows(columns, marca=marca, modelo=modelo), columns, formato, "autos")
+
+@router.delete("/bulk", response_model=BulkResult)
+def delete_autos_bulk(filtro: AutoFiltro = Depends(get_auto_filtro), cascada: bool = False, dry_run: bool = False,
+                      repo: AutoRepository = Depends(get_auto_repo)):
+    """Borra los autos del filtro con una sentencia por conjunto; con `cascada=true` también sus ventas."""
+    if dry_run:
+        autos, ventas = repo.count_matching(filtro)
+        return BulkResult(dry_run=True, autos=autos, ventas=ventas)
+    try:
+        autos, ventas = repo.bulk_delete(filtro, cascada=cascada)
+    except DependentVentas as e:
+        raise HTTPException(status_code=409,
+                            detail=f"Los autos tienen {e.ventas} ventas asociadas; usar cascada=true para borrarlas.")
+    return BulkResult(dry_run=False, autos=autos, ventas=ventas)
 
 @router.get("/chasis/{numero_chasis}", response_model=AutoRead)
-def get_auto_by_chasis(numero_chasis: str, repo: AutoRepository = Depends(get_auto_repo)):
+def get_auto_by_chasis(numero_chasis: str, request: Request, response: Response,
+                       repo: AutoRepository = Depends(get_auto_read_repo)):
     auto = repo.get_by_chasis(numero_chasis)
     if not auto:
         raise HTTPException(status_code=404, detail="Auto no encontrado con ese número de chasis.")
+    not_modified = conditional.check(request, response, auto_etag(auto), auto.updated_at)
+    if not_modified:
+        return not_modified
     return auto
 
 @router.get("/{auto_id}", response_model=AutoRead)
-def get_auto(auto_id: int, repo: AutoRepository = Depends(get_auto_repo)):
+def get_auto(auto_id: int, request: Request, response: Response, repo: AutoRepository = Depends(get_auto_read_repo)):
     auto = repo.get_by_id(auto_id)
     if not auto:
         raise HTTPException(status_code=404, detail="Auto no encontrado.")
+    not_modified = conditional.check(request, response, auto_etag(auto), auto.updated_at)
+    if not_modified:
+        return not_modified
     return auto
 
 @router.get("/{auto_id}/with-ventas", response_model=AutoReadWithVentas)
-def get_auto_with_ventas(auto_id: int, repo: AutoRepository = Depends(get_auto_repo)):
-    auto = repo.get_by_id(auto_id)
+def get_auto_with_ventas(auto_id: int, request: Request, response: Response,
+                         repo: AutoRepository = Depends(get_auto_read_repo)):
+    auto = repo.get_by_id_with_ventas(auto_id)
     if not auto:
         raise HTTPException(status_code=404, detail="Auto no encontrado.")
+    etag = conditional.make_etag("auto-ventas", auto.id, auto.version, [(v.id, v.version) for v in auto.ventas])
+    last_modified = conditional.latest([auto.updated_at, *(v.updated_at for v in auto.ventas)])
+    not_modified = conditional.check(request, response, etag, last_modified)
+    if not_modified:
+        return not_modified
     return auto
 
 @router.put("/{auto_id}", response_model=AutoRead)
-def update_auto(auto_id: int, auto_update: AutoUpdate, repo: AutoRepository = Depends(get_auto_repo)):
-    auto = repo.get_by_id(auto_id)
+def update_auto(auto_id: int, auto_update: AutoUpdate, request: Request, response: Response,
+                repo: AutoRepository = Depends(get_auto_repo)):
+    versions = conditional.expected_versions(request, "auto", auto_id)
+    if versions is not None:
+        versions = [version for (version,) in versions]
+    try:
+        auto = repo.update(auto_id, auto_update.model_dump(exclude_unset=True), versions)
+    except VersionConflict:
+        raise conditional.precondition_failed()
     if not auto:
         raise HTTPException(status_code=404, detail="Auto no encontrado.")
-    
-    update_data = auto_update.model_dump(exclude_unset=True)
-    return repo.update(auto_id, update_data)
+    response.headers["ETag"] = auto_etag(auto)
+    return auto
 
 @router.delete("/{auto_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_auto(auto_id: int, repo: AutoRepository = Depends(get_auto_repo)):
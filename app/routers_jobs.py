@@ -0,0 +1,19 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlmodel import Session
+
+from app.database import get_session
+from app.models import JobRead
+from app.repositories import JobRepository
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+def get_job_repo(session: Session = Depends(get_session)):
+    # El avance se escribe en la primaria: leerlo de una réplica mostraría un estado atrasado.
+    return JobRepository(session)
+
+@router.get("/{job_id}", response_model=JobRead)
+def get_job(job_id: int, repo: JobRepository = Depends(get_job_repo)):
+    job = repo.get_by_id(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado.")
+    return job
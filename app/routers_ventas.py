@@ -1,19 +1,120 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Row
 from sqlmodel import Session
-from typing import Sequence, Optional
+from typing import List, Sequence, Optional, Union
+from datetime import date, datetime
 
-from app.database import get_session
-from app.models import Venta, VentaCreate, VentaRead, VentaReadWithAuto, VentaUpdate
-from app.repositories import VentaRepository, AutoRepository
+from app.database import get_read_session, get_session
+from app.importers import StreamingImporter
+from app.jobs import JobQueue, accepted, get_job_queue
+from app.models import (AutoRead, BatchItemError, BulkResult, ImportLineError, ImportResult, JobRead, Venta,
+                        VentaBatchResult, VentaBulkUpdate, VentaCreate, VentaFiltro, VentaRead, VentaReadWithAuto,
+                        VentaStats, VentaUpdate)
+from app import conditional, stats
+from app.cambios import ChangeFeed, get_change_feed
+from app.exporters import ExportFormat, export_response
+from app.pagination import decode_cursor, encode_cursor
+from app.repositories import VersionConflict, VentaRepository, AutoRepository
+from app.responses import fast_json, parse_fields, row_dicts, unique
+from app.validation import batch_of, batch_validation_error, item_errors, validate_batch
 
 router = APIRouter(prefix="/ventas", tags=["ventas"])
 
+VENTA_FIELDS = list(VentaRead.model_fields)
+AUTO_FIELDS = list(AutoRead.model_fields)
+# Valores de `fields=`: campos de la venta, `auto` (el auto completo) o `auto.<campo>`.
+FIELD_NAMES = [*VENTA_FIELDS, "auto", *(f"auto.{name}" for name in AUTO_FIELDS)]
+
+class VentaProjection:
+    """Columnas que leen los listados de ventas y campos que devuelven, según `fields=`.
+
+    Además de los campos pedidos se leen las columnas del cursor y del ETag; las del auto
+    (y el JOIN) sólo si se pidió algún campo del auto.
+    """
+
+    def __init__(self, venta_fields: Sequence[str] = VENTA_FIELDS, auto_fields: Sequence[str] = AUTO_FIELDS):
+        self.venta_fields = list(venta_fields)
+        self.auto_fields = list(auto_fields)
+        self.columns = unique([*venta_fields, "id", "fecha_venta", "version", "updated_at"])
+        self.auto_columns = unique([*auto_fields, "id", "version"]) if auto_fields else []
+        self._id, self._fecha, self._version, self._updated_at = (
+            self.columns.index(name) for name in ("id", "fecha_venta", "version", "updated_at"))
+        self._auto_start = len(self.columns)
+        self._auto_end = self._auto_start + len(self.auto_fields)
+        self._auto_id = self._auto_start + self.auto_columns.index("id") if self.auto_columns else None
+        self._auto_version = self._auto_start + self.auto_columns.index("version") if self.auto_columns else None
+
+    @classmethod
+    def from_fields(cls, fields: Optional[str]) -> "VentaProjection":
+        pedidos = parse_fields(fields, FIELD_NAMES)
+        venta_fields = [name for name in pedidos if name in VENTA_FIELDS]
+        if "auto" in pedidos:
+            auto_fields = AUTO_FIELDS
+        else:
+            auto_fields = [name[len("auto."):] for name in pedidos if name.startswith("auto.")]
+        return cls(venta_fields, auto_fields)
+
+    def cursor(self, row: Row) -> str:
+        return encode_cursor(row[self._fecha], row[self._id])
+
+    def etag(self, rows: Sequence[Row]) -> str:
+        auto_version = self._auto_version
+        return conditional.make_etag("ventas", self.venta_fields, self.auto_fields, [
+            (row[self._id], row[self._version], row[auto_version] if auto_version is not None else None)
+            for row in rows
+        ])
+
+    def last_modified(self, rows: Sequence[Row]):
+        return conditional.latest(row[self._updated_at] for row in rows)
+
+    def dicts(self, rows: Sequence[Row]) -> list:
+        """Ventas (con su auto anidado si se pidió, como VentaReadWithAuto) a partir de filas de get_all_rows."""
+        ventas = row_dicts(rows, self.venta_fields)
+        if self.auto_fields:
+            for venta, row in zip(ventas, rows):
+                venta["auto"] = (dict(zip(self.auto_fields, row[self._auto_start:self._auto_end]))
+                                 if row[self._auto_id] is not None else None)
+        return ventas
+
+FULL_PROJECTION = VentaProjection()
+
+def get_venta_projection(fields: Optional[str] = Query(
+        None, description="Campos a devolver separados por coma; `auto` o `auto.<campo>` para el auto")) -> VentaProjection:
+    return VentaProjection.from_fields(fields) if fields is not None else FULL_PROJECTION
+
 def get_venta_repo(session: Session = Depends(get_session)):
     return VentaRepository(session)
 
 def get_auto_repo(session: Session = Depends(get_session)):
     return AutoRepository(session)
 
+def get_venta_read_repo(session: Session = Depends(get_read_session)):
+    return VentaRepository(session)
+
+def get_auto_read_repo(session: Session = Depends(get_read_session)):
+    return AutoRepository(session)
+
+def get_venta_filtro(ids: Optional[List[int]] = Query(None),
+                     auto_id: Optional[int] = None,
+                     marca: Optional[str] = None,
+                     modelo: Optional[str] = None,
+                     comprador: Optional[str] = None,
+                     desde: Optional[date] = None,
+                     hasta: Optional[date] = None) -> VentaFiltro:
+    filtro = VentaFiltro(ids=ids, auto_id=auto_id, marca=marca, modelo=modelo, comprador=comprador, desde=desde,
+                         hasta=hasta)
+    if not filtro.model_dump(exclude_none=True):
+        raise HTTPException(status_code=400, detail="Indicar al menos un filtro.")
+    return filtro
+
+def venta_etag(venta: Venta) -> str:
+    # La representación incluye el auto, así que su versión también invalida el ETag.
+    return conditional.version_etag("venta", venta.id, venta.version, venta.auto.version if venta.auto else 0)
+
+def ventas_etag(ventas: Sequence[Venta]) -> str:
+    return conditional.make_etag("ventas", [(v.id, v.version, v.auto.version if v.auto else None) for v in ventas])
+
 @router.post("/", response_model=VentaReadWithAuto, status_code=status.HTTP_201_CREATED)
 def create_venta(venta: VentaCreate, 
                  repo: VentaRepository = Depends(get_venta_repo),
@@ -22,44 +123,153 @@ def create_venta(venta: VentaCreate,
         raise HTTPException(status_code=404, detail="Auto no encontrado.")
     return repo.create(venta)
 
-@router.post("/batch/", response_model=Sequence[VentaReadWithAuto], status_code=status.HTTP_201_CREATED)
-def create_multiple_ventas(ventas: list[VentaCreate], 
+@router.post("/batch/", response_model=Union[Sequence[VentaReadWithAuto], VentaBatchResult], status_code=status.HTTP_201_CREATED,
+             responses={202: {"model": JobRead, "description": "Alta encolada (con `async=true`)"}})
+def create_multiple_ventas(items: batch_of(VentaCreate),
+                          parcial: bool = False,
+                          en_segundo_plano: bool = Query(False, alias="async"),
                           repo: VentaRepository = Depends(get_venta_repo),
-                          auto_repo: AutoRepository = Depends(get_auto_repo)):
-    for venta in ventas:
-        if not auto_repo.get_by_id(venta.auto_id):
-            raise HTTPException(status_code=404, detail=f"Auto con ID {venta.auto_id} no encontrado.")
-    return repo.create_multiple(ventas)
+                          auto_repo: AutoRepository = Depends(get_auto_repo),
+                          jobs: JobQueue = Depends(get_job_queue)):
+    validos, invalidos = validate_batch(VentaCreate, items)
+    if invalidos and (not parcial or en_segundo_plano):
+        raise batch_validation_error(invalidos)
+    if en_segundo_plano:
+        # En segundo plano las ventas sin auto quedan en los errores del trabajo.
+        return accepted(jobs.enqueue(repo.session, "ventas_batch", [venta for _, venta in validos]))
+    existentes = auto_repo.get_existing_ids(venta.auto_id for _, venta in validos)
+    errores = item_errors(invalidos) + [
+        BatchItemError(indice=indice, detalle=f"Auto con ID {venta.auto_id} no encontrado.")
+        for indice, venta in validos
+        if venta.auto_id not in existentes
+    ]
+    if errores and not parcial:
+        raise HTTPException(status_code=404, detail=errores[0].detalle)
+    ventas = [venta for _, venta in validos if venta.auto_id in existentes]
+    creadas = repo.create_multiple(ventas) if ventas else []
+    if parcial:
+        return VentaBatchResult(creadas=creadas, errores=sorted(errores, key=lambda error: error.indice))
+    return creadas
+
+@router.post("/import", response_model=ImportResult)
+async def import_ventas(request: Request,
+                        formato: ExportFormat = "ndjson",
+                        repo: VentaRepository = Depends(get_venta_repo),
+                        auto_repo: AutoRepository = Depends(get_auto_repo)):
+    def write(items):
+        existentes = auto_repo.get_existing_ids(venta.auto_id for _, venta in items)
+        repo.bulk_load([venta for _, venta in items if venta.auto_id in existentes])
+        return [
+            ImportLineError(linea=linea, detalle=f"Auto con ID {venta.auto_id} no encontrado.")
+            for linea, venta in items
+            if venta.auto_id not in existentes
+        ]
+
+    return await StreamingImporter(VentaCreate, write, formato).run(request.stream())
 
 @router.get("/", response_model=Sequence[VentaReadWithAuto])
-def list_ventas(skip: int = 0, limit: int = 10, repo: VentaRepository = Depends(get_venta_repo)):
-    return repo.get_all(skip=skip, limit=limit)
+def list_ventas(request: Request,
+                response: Response,
+                skip: int = 0,
+                limit: int = 10,
+                cursor: Optional[str] = None,
+                desde: Optional[date] = None,
+                hasta: Optional[date] = None,
+                proyeccion: VentaProjection = Depends(get_venta_projection),
+                repo: VentaRepository = Depends(get_venta_read_repo)):
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor, datetime, int)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    rows = repo.get_all_rows(proyeccion.columns, proyeccion.auto_columns, skip=skip, limit=limit, after=after,
+                             desde=desde, hasta=hasta)
+    if rows and len(rows) == limit:
+        response.headers["X-Next-Cursor"] = proyeccion.cursor(rows[-1])
+    not_modified = conditional.check(request, response, proyeccion.etag(rows), proyeccion.last_modified(rows))
+    if not_modified:
+        return not_modified
+    return fast_json(proyeccion.dicts(rows), response)
+
+@router.get("/export", response_class=StreamingResponse)
+def export_ventas(formato: ExportFormat = "ndjson", desde: Optional[date] = None, hasta: Optional[date] = None,
+                  repo: VentaRepository = Depends(get_venta_read_repo)):
+    columns = list(VentaRead.model_fields)
+    return export_response(repo.iter_rows(columns, desde=desde, hasta=hasta), columns, formato, "ventas")
+
+@router.get("/stream", response_class=StreamingResponse,
+            responses={200: {"content": {"text/event-stream": {}}, "description": "Eventos `creada`, `modificada` y `eliminada`"}})
+def stream_ventas(last_event_id: Optional[int] = Header(None), feed: ChangeFeed = Depends(get_change_feed)):
+    """Server-sent events con las altas, cambios y bajas de ventas; con `Last-Event-ID` retoma desde ese evento."""
+    return StreamingResponse(feed.events(last_event_id), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.get("/stats", response_model=Sequence[VentaStats])
+def get_ventas_stats(agrupar: stats.StatsGroupBy = "modelo",
+                     desde: Optional[date] = None,
+                     hasta: Optional[date] = None,
+                     repo: VentaRepository = Depends(get_venta_read_repo)):
+    return stats.query(repo.session, agrupar, desde=desde, hasta=hasta)
 
 @router.get("/auto/{auto_id}", response_model=Sequence[VentaReadWithAuto])
-def get_ventas_by_auto(auto_id: int, repo: VentaRepository = Depends(get_venta_repo), auto_repo: AutoRepository = Depends(get_auto_repo)):
+def get_ventas_by_auto(auto_id: int, request: Request, response: Response,
+                       desde: Optional[date] = None, hasta: Optional[date] = None,
+                       repo: VentaRepository = Depends(get_venta_read_repo), auto_repo: AutoRepository = Depends(get_auto_read_repo)):
     if not auto_repo.get_by_id(auto_id):
         raise HTTPException(status_code=404, detail="Auto no encontrado.")
-    return repo.get_by_auto_id(auto_id)
+    ventas = repo.get_by_auto_id(auto_id, load_auto=True, desde=desde, hasta=hasta)
+    last_modified = conditional.latest(venta.updated_at for venta in ventas)
+    not_modified = conditional.check(request, response, ventas_etag(ventas), last_modified)
+    if not_modified:
+        return not_modified
+    return ventas
 
 @router.get("/comprador/{nombre}", response_model=Sequence[VentaReadWithAuto])
-def get_ventas_by_comprador(nombre: str, repo: VentaRepository = Depends(get_venta_repo)):
-    return repo.get_by_comprador(nombre)
+def get_ventas_by_comprador(nombre: str,
+                            response: Response,
+                            skip: int = 0,
+                            limit: int = 100,
+                            repo: VentaRepository = Depends(get_venta_read_repo)):
+    rows = repo.get_rows_by_comprador(nombre, FULL_PROJECTION.columns, FULL_PROJECTION.auto_columns,
+                                      skip=skip, limit=limit)
+    return fast_json(FULL_PROJECTION.dicts(rows), response)
+
+@router.patch("/bulk", response_model=BulkResult)
+def update_ventas_bulk(cambios: VentaBulkUpdate,
+                       filtro: VentaFiltro = Depends(get_venta_filtro),
+                       dry_run: bool = False,
+                       repo: VentaRepository = Depends(get_venta_repo)):
+    """Modifica las ventas del filtro con un único UPDATE (p. ej. `precio_factor` para reajustar precios)."""
+    venta_data = cambios.model_dump(exclude_unset=True, exclude={"precio_factor"})
+    if not venta_data and cambios.precio_factor is None:
+        raise HTTPException(status_code=400, detail="No se indicó ningún cambio.")
+    if dry_run:
+        return BulkResult(dry_run=True, ventas=repo.count_matching(filtro))
+    return BulkResult(dry_run=False, ventas=repo.bulk_update(filtro, venta_data, cambios.precio_factor))
 
 @router.get("/{venta_id}", response_model=VentaReadWithAuto)
-def get_venta(venta_id: int, repo: VentaRepository = Depends(get_venta_repo)):
-    venta = repo.get_by_id(venta_id)
+def get_venta(venta_id: int, request: Request, response: Response, repo: VentaRepository = Depends(get_venta_read_repo)):
+    venta = repo.get_by_id(venta_id, load_auto=True)
     if not venta:
         raise HTTPException(status_code=404, detail="Venta no encontrada.")
+    not_modified = conditional.check(request, response, venta_etag(venta), venta.updated_at)
+    if not_modified:
+        return not_modified
     return venta
 
 @router.put("/{venta_id}", response_model=VentaRead)
-def update_venta(venta_id: int, venta_update: VentaUpdate, repo: VentaRepository = Depends(get_venta_repo)):
-    venta = repo.get_by_id(venta_id)
+def update_venta(venta_id: int, venta_update: VentaUpdate, request: Request, response: Response,
+                 repo: VentaRepository = Depends(get_venta_repo)):
+    versions = conditional.expected_versions(request, "venta", venta_id, size=2)
+    try:
+        venta = repo.update(venta_id, venta_update.model_dump(exclude_unset=True), versions)
+    except VersionConflict:
+        raise conditional.precondition_failed()
     if not venta:
         raise HTTPException(status_code=404, detail="Venta no encontrada.")
-    
-    update_data = venta_update.model_dump(exclude_unset=True)
-    return repo.update(venta_id, update_data)
+    response.headers["ETag"] = venta_etag(venta)
+    return venta
 
 @router.delete("/{venta_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_venta(venta_id: int, repo: VentaRepository = Depends(get_venta_repo)):
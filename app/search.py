@@ -0,0 +1,128 @@
+from typing import Dict, Tuple
+
+from sqlalchemy import column, event, func, literal_column, select, table, text
+from sqlalchemy.engine import Connection
+from sqlmodel import Session, SQLModel
+
+# Columnas con búsqueda por subcadena, por tabla.
+SEARCH_COLUMNS: Dict[str, Tuple[str, ...]] = {
+    "auto": ("marca", "modelo"),
+    "venta": ("nombre_comprador",),
+}
+
+# El tokenizer trigram de FTS5 no indexa términos de menos de 3 caracteres.
+MIN_FTS_TERM = 3
+
+
+def _fts_name(tablename: str) -> str:
+    return f"{tablename}_fts"
+
+
+def is_search_object(name: str) -> bool:
+    """True para las tablas FTS5 (y sus tablas internas) y los índices pg_trgm creados por este módulo."""
+    return any(name.startswith(_fts_name(t)) for t in SEARCH_COLUMNS) or (name.startswith("ix_") and name.endswith("_trgm"))
+
+
+def _sqlite_ddl(tablename: str, columns: Tuple[str, ...]) -> list:
+    fts = _fts_name(tablename)
+    cols = ", ".join(columns)
+    new_values = ", ".join(f"new.{c}" for c in columns)
+    old_values = ", ".join(f"old.{c}" for c in columns)
+    return [
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='{tablename}', content_rowid='id', tokenize='trigram')",
+        f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {tablename} BEGIN "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_values}); END",
+        f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {tablename} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values}); END",
+        f"CREATE TRIGGER {fts}_au AFTER UPDATE ON {tablename} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values}); "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_values}); END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def _postgresql_ddl(tablename: str, columns: Tuple[str, ...]) -> list:
+    return [
+        f"CREATE INDEX IF NOT EXISTS ix_{tablename}_{c}_trgm ON {tablename} USING gin (lower({c}) gin_trgm_ops)"
+        for c in columns
+    ]
+
+
+def create_search_indexes(connection: Connection) -> None:
+    """Crea los índices de búsqueda: tablas FTS5 en SQLite, índices GIN pg_trgm en PostgreSQL."""
+    dialect = connection.dialect.name
+    if dialect == "postgresql":
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for tablename, columns in SEARCH_COLUMNS.items():
+            for statement in _postgresql_ddl(tablename, columns):
+                connection.execute(text(statement))
+    elif dialect == "sqlite":
+        for tablename, columns in SEARCH_COLUMNS.items():
+            exists = connection.execute(
+                text("SELECT 1 FROM sqlite_master WHERE name = :name"), {"name": _fts_name(tablename)}
+            ).first()
+            if not exists:
+                for statement in _sqlite_ddl(tablename, columns):
+                    connection.execute(text(statement))
+
+
+def drop_search_indexes(connection: Connection) -> None:
+    if connection.dialect.name == "sqlite":
+        for tablename in SEARCH_COLUMNS:
+            connection.execute(text(f"DROP TABLE IF EXISTS {_fts_name(tablename)}"))
+    elif connection.dialect.name == "postgresql":
+        for tablename, columns in SEARCH_COLUMNS.items():
+            for c in columns:
+                connection.execute(text(f"DROP INDEX IF EXISTS ix_{tablename}_{c}_trgm"))
+
+
+def rebuild_search_indexes(connection: Connection) -> None:
+    """Reconstruye los índices de búsqueda a partir de las tablas base (backfill)."""
+    create_search_indexes(connection)
+    if connection.dialect.name == "sqlite":
+        for tablename in SEARCH_COLUMNS:
+            fts = _fts_name(tablename)
+            connection.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+    elif connection.dialect.name == "postgresql":
+        for tablename, columns in SEARCH_COLUMNS.items():
+            for c in columns:
+                connection.execute(text(f"REINDEX INDEX ix_{tablename}_{c}_trgm"))
+
+
+@event.listens_for(SQLModel.metadata, "after_create")
+def _after_create(target, connection, **kw):
+    create_search_indexes(connection)
+
+
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _fts_query(field: str, term: str) -> str:
+    return f'{field} : "{term.replace(chr(34), chr(34) * 2)}"'
+
+
+def _use_fts(session: Session, term: str) -> bool:
+    return session.get_bind().dialect.name == "sqlite" and len(term) >= MIN_FTS_TERM
+
+
+def contains(session: Session, model, field: str, term: str):
+    """Condición de búsqueda por subcadena (sin distinguir mayúsculas) que puede usar un índice."""
+    if _use_fts(session, term):
+        fts = table(_fts_name(model.__tablename__), column("rowid"))
+        match = literal_column(fts.name).op("MATCH")(_fts_query(field, term))
+        return model.id.in_(select(fts.c.rowid).where(match))
+    return func.lower(getattr(model, field)).like(f"%{_escape_like(term.lower())}%", escape="\\")
+
+
+def ranked(session: Session, statement, model, field: str, term: str):
+    """Filtra `statement` por subcadena en `field` y lo ordena por relevancia."""
+    if _use_fts(session, term):
+        fts = table(_fts_name(model.__tablename__), column("rowid"), column("rank"))
+        match = literal_column(fts.name).op("MATCH")(_fts_query(field, term))
+        return statement.join(fts, fts.c.rowid == model.id).where(match).order_by(fts.c.rank, model.id)
+    statement = statement.where(contains(session, model, field, term))
+    if session.get_bind().dialect.name == "postgresql":
+        similarity = func.similarity(func.lower(getattr(model, field)), term.lower())
+        return statement.order_by(similarity.desc(), model.id)
+    return statement.order_by(model.id)
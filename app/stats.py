@@ -0,0 +1,240 @@
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Literal, Optional, Set, Tuple
+
+from sqlalchemy import and_, delete, func, insert, or_, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, select
+
+from app.models import Auto, Venta, VentaResumen, VentaResumenAuto, VentaStats
+from app.particiones import add_months, month_start
+from app.utils import chunked
+
+# Grupos que toca una venta: (marca, modelo, mes) en venta_resumen y (auto_id, mes) en venta_resumen_auto.
+VentaKey = Tuple[int, str, str, str]
+StatsGroupBy = Literal["marca", "modelo", "auto", "mes"]
+
+KEYS_PER_QUERY = 200
+
+
+def mes_de(fecha: date) -> str:
+    return fecha.strftime("%Y-%m")
+
+
+def _mes_bounds(mes: str) -> Tuple[datetime, datetime]:
+    inicio = date.fromisoformat(f"{mes}-01")
+    return datetime.combine(inicio, time.min), datetime.combine(add_months(inicio, 1), time.min)
+
+
+def _mes_expr(session: Session):
+    """`fecha_venta` como 'AAAA-MM' en SQL."""
+    if session.get_bind().dialect.name == "postgresql":
+        return func.to_char(Venta.fecha_venta, "YYYY-MM")
+    return func.strftime("%Y-%m", Venta.fecha_venta)
+
+
+def _metrics():
+    return func.count(), func.sum(Venta.precio), func.min(Venta.precio), func.max(Venta.precio)
+
+
+def _metric_values(cantidad: int, total: float, minimo: float, maximo: float) -> dict:
+    return {"cantidad": cantidad, "total": total, "minimo": minimo, "maximo": maximo}
+
+
+def keys_where(session: Session, *conditions, for_update: bool = False) -> Set[VentaKey]:
+    """Grupos de los resúmenes con ventas que cumplen `conditions`, para recalcularlos tras un cambio.
+
+    Se leen siempre de la BD (nunca de la caché de entidades): con `for_update` se bloquean
+    además las ventas, para que otro cambio concurrente no las mueva de grupo.
+    """
+    statement = (
+        select(Venta.auto_id, Auto.marca, Auto.modelo, _mes_expr(session))
+        .join(Auto, Auto.id == Venta.auto_id)
+        .where(*conditions)
+        .distinct()
+    )
+    if for_update:
+        statement = statement.with_for_update(of=Venta)
+    return {tuple(row) for row in session.execute(statement)}
+
+
+def record_added(session: Session, ventas: Iterable[Tuple[int, datetime, float]],
+                 autos: Optional[Dict[int, Tuple[str, str]]] = None) -> None:
+    """Suma ventas nuevas (auto_id, fecha_venta, precio) a los resúmenes con un upsert por grupo.
+
+    `autos` (id -> (marca, modelo)) evita leer los autos si el llamador ya los tiene cargados
+    en esta transacción.
+    """
+    por_auto: Dict[Tuple[int, str], list] = {}
+    for auto_id, fecha_venta, precio in ventas:
+        _accumulate(por_auto, (auto_id, mes_de(fecha_venta)), [1, precio, precio, precio])
+    if not por_auto:
+        return
+
+    autos = dict(autos or {})
+    faltantes = {auto_id for auto_id, _ in por_auto} - set(autos)
+    for lote in chunked(sorted(faltantes), KEYS_PER_QUERY):
+        autos.update((auto_id, (marca, modelo)) for auto_id, marca, modelo in session.execute(
+            select(Auto.id, Auto.marca, Auto.modelo).where(Auto.id.in_(lote))
+        ))
+
+    dialect = session.get_bind().dialect.name
+    if dialect not in ("sqlite", "postgresql"):
+        recompute(session, {(auto_id, *autos[auto_id], mes) for auto_id, mes in por_auto})
+        return
+
+    por_modelo: Dict[Tuple[str, str, str], list] = {}
+    for (auto_id, mes), valores in por_auto.items():
+        _accumulate(por_modelo, (*autos[auto_id], mes), list(valores))
+    _upsert(session, dialect, VentaResumenAuto, ["auto_id", "mes"],
+            [{"auto_id": auto_id, "mes": mes, **_metric_values(*valores)} for (auto_id, mes), valores in por_auto.items()])
+    _upsert(session, dialect, VentaResumen, ["marca", "modelo", "mes"],
+            [{"marca": marca, "modelo": modelo, "mes": mes, **_metric_values(*valores)}
+             for (marca, modelo, mes), valores in por_modelo.items()])
+
+
+def _accumulate(grupos: dict, key, valores: list) -> None:
+    acumulado = grupos.get(key)
+    if acumulado is None:
+        grupos[key] = valores
+    else:
+        acumulado[0] += valores[0]
+        acumulado[1] += valores[1]
+        acumulado[2] = min(acumulado[2], valores[2])
+        acumulado[3] = max(acumulado[3], valores[3])
+
+
+def _upsert(session: Session, dialect: str, model, index_elements: List[str], rows: List[dict]) -> None:
+    insert_ = sqlite.insert if dialect == "sqlite" else postgresql.insert
+    least, greatest = (func.min, func.max) if dialect == "sqlite" else (func.least, func.greatest)
+    statement = insert_(model)
+    table = model.__table__
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c[name] for name in index_elements],
+        set_={
+            "cantidad": table.c.cantidad + statement.excluded.cantidad,
+            "total": table.c.total + statement.excluded.total,
+            "minimo": least(table.c.minimo, statement.excluded.minimo),
+            "maximo": greatest(table.c.maximo, statement.excluded.maximo),
+        },
+    )
+    session.execute(statement, rows)
+
+
+def recompute(session: Session, keys: Iterable[VentaKey]) -> None:
+    """Recalcula desde la tabla de ventas los grupos de ambos resúmenes que tocan `keys`."""
+    keys = set(keys)
+    mes = _mes_expr(session)
+    for lote in chunked(sorted({(marca, modelo, m) for _, marca, modelo, m in keys}), KEYS_PER_QUERY):
+        session.execute(delete(VentaResumen).where(
+            tuple_(VentaResumen.marca, VentaResumen.modelo, VentaResumen.mes).in_(lote)
+        ))
+        condiciones = [
+            and_(Auto.marca == marca, Auto.modelo == modelo, Venta.fecha_venta >= inicio, Venta.fecha_venta < fin)
+            for marca, modelo, m in lote
+            for inicio, fin in [_mes_bounds(m)]
+        ]
+        statement = (
+            select(Auto.marca, Auto.modelo, mes, *_metrics())
+            .join(Auto, Auto.id == Venta.auto_id)
+            .where(or_(*condiciones))
+            .group_by(Auto.marca, Auto.modelo, mes)
+        )
+        rows = [{"marca": marca, "modelo": modelo, "mes": m, **_metric_values(*valores)}
+                for marca, modelo, m, *valores in session.execute(statement)]
+        if rows:
+            session.execute(insert(VentaResumen), rows)
+    for lote in chunked(sorted({(auto_id, m) for auto_id, _, _, m in keys}), KEYS_PER_QUERY):
+        session.execute(delete(VentaResumenAuto).where(tuple_(VentaResumenAuto.auto_id, VentaResumenAuto.mes).in_(lote)))
+        condiciones = [
+            and_(Venta.auto_id == auto_id, Venta.fecha_venta >= inicio, Venta.fecha_venta < fin)
+            for auto_id, m in lote
+            for inicio, fin in [_mes_bounds(m)]
+        ]
+        statement = select(Venta.auto_id, mes, *_metrics()).where(or_(*condiciones)).group_by(Venta.auto_id, mes)
+        rows = [{"auto_id": auto_id, "mes": m, **_metric_values(*valores)}
+                for auto_id, m, *valores in session.execute(statement)]
+        if rows:
+            session.execute(insert(VentaResumenAuto), rows)
+
+
+def rebuild(session: Session) -> int:
+    """Regenera ambos resúmenes a partir de la tabla de ventas. Devuelve la cantidad de grupos por modelo y mes."""
+    mes = _mes_expr(session)
+    session.execute(delete(VentaResumen))
+    session.execute(delete(VentaResumenAuto))
+    columnas = ["cantidad", "total", "minimo", "maximo"]
+    session.execute(insert(VentaResumen).from_select(
+        ["marca", "modelo", "mes", *columnas],
+        select(Auto.marca, Auto.modelo, mes, *_metrics())
+        .join(Auto, Auto.id == Venta.auto_id)
+        .group_by(Auto.marca, Auto.modelo, mes),
+    ))
+    session.execute(insert(VentaResumenAuto).from_select(
+        ["auto_id", "mes", *columnas],
+        select(Venta.auto_id, mes, *_metrics()).group_by(Venta.auto_id, mes),
+    ))
+    return session.execute(select(func.count()).select_from(VentaResumen)).scalar_one()
+
+
+def _split_range(desde: Optional[date], hasta: Optional[date]):
+    """Divide [desde, hasta] en meses completos (se leen del resumen) y bordes (se leen de las ventas).
+
+    Devuelve (si hay meses completos, el primero, el siguiente al último, y los bordes como rangos
+    de fecha_venta); None en un extremo significa sin límite.
+    """
+    fin = hasta + timedelta(days=1) if hasta else None
+    primero = add_months(month_start(desde), 1) if desde and desde.day != 1 else desde
+    ultimo = month_start(fin) if fin else None
+    inicio, limite = (datetime.combine(d, time.min) if d else None for d in (desde, fin))
+    if primero and ultimo and primero >= ultimo:
+        return False, None, None, [(inicio, limite)]
+    bordes = []
+    if desde and primero != desde:
+        bordes.append((inicio, datetime.combine(primero, time.min)))
+    if fin and ultimo != fin:
+        bordes.append((datetime.combine(ultimo, time.min), limite))
+    return True, primero, ultimo, bordes
+
+
+def query(session: Session, agrupar: StatsGroupBy, desde: Optional[date] = None,
+          hasta: Optional[date] = None) -> List[VentaStats]:
+    """Agrega los resúmenes por marca, modelo, auto o mes en un rango de fechas (inclusive).
+
+    Los meses completos del rango se leen de los resúmenes (O(grupos)); sólo los días sueltos
+    de los meses de los extremos se agregan desde las ventas, con el índice de fecha_venta.
+    """
+    hay_completos, primero, ultimo, bordes = _split_range(desde, hasta)
+    acumulado: Dict[object, list] = {}
+
+    resumen = VentaResumenAuto if agrupar == "auto" else VentaResumen
+    grupo = {
+        "marca": VentaResumen.marca,
+        "modelo": VentaResumen.modelo,
+        "auto": VentaResumenAuto.auto_id,
+        "mes": VentaResumen.mes,
+    }[agrupar]
+    completos = select(grupo, func.sum(resumen.cantidad), func.sum(resumen.total), func.min(resumen.minimo),
+                       func.max(resumen.maximo))
+    if primero:
+        completos = completos.where(resumen.mes >= mes_de(primero))
+    if ultimo:
+        completos = completos.where(resumen.mes < mes_de(ultimo))
+    filas = list(session.execute(completos.group_by(grupo))) if hay_completos else []
+
+    grupo_venta = {"marca": Auto.marca, "modelo": Auto.modelo, "auto": Venta.auto_id, "mes": _mes_expr(session)}[agrupar]
+    for inicio, fin in bordes:
+        statement = select(grupo_venta, *_metrics())
+        if agrupar in ("marca", "modelo"):
+            statement = statement.join(Auto, Auto.id == Venta.auto_id)
+        if inicio:
+            statement = statement.where(Venta.fecha_venta >= inicio)
+        if fin:
+            statement = statement.where(Venta.fecha_venta < fin)
+        filas.extend(session.execute(statement.group_by(grupo_venta)))
+
+    for valor, *valores in filas:
+        _accumulate(acumulado, valor, list(valores))
+    return [
+        VentaStats(grupo=valor, cantidad=cantidad, total=total, promedio=total / cantidad, minimo=minimo, maximo=maximo)
+        for valor, (cantidad, total, minimo, maximo) in sorted(acumulado.items())
+    ]
@@ -1,24 +1,64 @@
-import random
-import string
 from datetime import datetime, timezone, date as date_type
+from contextvars import ContextVar
+from typing import Any, Iterator, List, Optional, Sequence, TypeVar
 
-def generate_chasis_number() -> str:
-    """Genera un número de chasis aleatorio de 17 caracteres (formato VIN)."""
-    chars = string.ascii_uppercase.replace('I', '').replace('O', '').replace('Q', '') + string.digits
-    return ''.join(random.choice(chars) for _ in range(17))
+T = TypeVar("T")
 
-def is_valid_year(year: int) -> bool:
+# Caracteres válidos en un VIN (ISO 3779): sin I, O ni Q.
+VIN_CHARS = "0123456789ABCDEFGHJKLMNPRSTUVWXYZ"
+VIN_WEIGHTS = (8, 7, 6, 5, 4, 3, 2, 10, 0, 9, 8, 7, 6, 5, 4, 3, 2)
+VIN_VALUES = {
+    **{str(d): d for d in range(10)},
+    **dict(zip("ABCDEFGH", range(1, 9))),
+    **dict(zip("JKLMN", range(1, 6))), "P": 7, "R": 9,
+    **dict(zip("STUVWXYZ", range(2, 10))),
+}
+# Código de año modelo (posición 10), en ciclos de 30 años a partir de 1980.
+VIN_YEAR_CODES = "ABCDEFGHJKLMNPRSTVWXY123456789"
+
+def vin_check_digit(vin: str) -> str:
+    """Dígito verificador (posición 9) de un VIN de 17 caracteres; la posición 9 no se tiene en cuenta."""
+    total = sum(VIN_VALUES[c] * w for c, w in zip(vin, VIN_WEIGHTS))
+    resto = total % 11
+    return "X" if resto == 10 else str(resto)
+
+def vin_year_code(year: int) -> str:
+    return VIN_YEAR_CODES[(year - 1980) % 30]
+
+def is_valid_vin(vin: str) -> bool:
+    """Valida longitud, caracteres y dígito verificador de un VIN."""
+    return len(vin) == 17 and all(c in VIN_VALUES for c in vin) and vin[8] == vin_check_digit(vin)
+
+def utcnow() -> datetime:
+    """Fecha y hora actual en UTC, sin zona horaria (como se guarda en la BD)."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def local_now() -> datetime:
+    """Fecha y hora local con zona horaria: el "ahora" que comparten los validadores de un lote."""
+    return datetime.now().astimezone()
+
+# "Ahora" del lote en validación. Los modelos de SQLModel definen su propio __init__, y
+# pydantic no les pasa el contexto cuando van dentro de una lista: validate_batch lo fija acá.
+batch_now: ContextVar[Optional[datetime]] = ContextVar("batch_now", default=None)
+
+def context_now(info: Any) -> Optional[datetime]:
+    """El "ahora" del contexto de validación (ver app.validation), si lo hay."""
+    context = getattr(info, "context", None)
+    return context.get("now") if context else batch_now.get()
+
+def is_valid_year(year: int, now: Optional[datetime] = None) -> bool:
     """Valida que el año esté entre 1900 y el año actual."""
-    current_year = datetime.now().year
+    current_year = (now or datetime.now()).year
     return 1900 <= year <= current_year
 
 def is_valid_price(price: float) -> bool:
     """Valida que el precio sea mayor a 0."""
     return price > 0
 
-def is_valid_future_date(date: datetime) -> bool:
+def is_valid_future_date(date: datetime, now: Optional[datetime] = None) -> bool:
     """Valida que la fecha no sea en el futuro."""
-    today = datetime.now(timezone.utc).date() if date.tzinfo else datetime.now().date()
+    now = now or local_now()
+    today = now.astimezone(timezone.utc).date() if date.tzinfo else now.date()
     
     if date.tzinfo:
         date_only = date.astimezone(timezone.utc).date()
@@ -30,3 +70,8 @@ def is_valid_future_date(date: datetime) -> bool:
 def is_valid_comprador_name(nombre: str) -> bool:
     """Valida que el nombre del comprador no esté vacío."""
     return bool(nombre and nombre.strip())
+
+def chunked(items: Sequence[T], size: int) -> Iterator[List[T]]:
+    """Divide una secuencia en lotes de a lo sumo `size` elementos."""
+    for start in range(0, len(items), size):
+        yield list(items[start:start + size])
@@ -0,0 +1,88 @@
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type, TypeVar
+
+from fastapi.exceptions import RequestValidationError
+from pydantic import TypeAdapter, ValidationError, WithJsonSchema
+from sqlmodel import SQLModel
+from typing_extensions import Annotated
+
+from app.models import BatchItemError
+from app.utils import batch_now, local_now
+
+M = TypeVar("M", bound=SQLModel)
+
+# Errores de pydantic de cada ítem inválido, por índice dentro del lote.
+ItemErrors = Dict[int, List[dict]]
+
+
+def validation_context(now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Contexto compartido por los validadores de un lote: un único "ahora" para todos los ítems."""
+    return {"now": now or local_now()}
+
+
+@lru_cache(maxsize=None)
+def _list_adapter(model: Type[M]) -> TypeAdapter:
+    return TypeAdapter(List[model])
+
+
+def validate_batch(model: Type[M], items: Sequence[Any],
+                   context: Optional[Dict[str, Any]] = None) -> Tuple[List[Tuple[int, M]], ItemErrors]:
+    """Valida el lote completo de una vez y devuelve los ítems válidos (con su índice) y los errores por índice.
+
+    Un lote sin errores se valida en una sola llamada al core de pydantic; si hay errores,
+    se agrupan por ítem y los válidos se validan en una segunda llamada, así que el cliente
+    recibe todos los errores en una misma respuesta.
+    """
+    adapter = _list_adapter(model)
+    context = context or validation_context()
+    token = batch_now.set(context["now"])
+    try:
+        try:
+            return list(enumerate(adapter.validate_python(items, context=context))), {}
+        except ValidationError as e:
+            errores: ItemErrors = {}
+            for error in e.errors():
+                if not error["loc"] or not isinstance(error["loc"][0], int):
+                    # El lote en sí no es una lista: no hay ítems que rescatar.
+                    raise
+                errores.setdefault(error["loc"][0], []).append(error)
+        indices = [indice for indice in range(len(items)) if indice not in errores]
+        validos = adapter.validate_python([items[indice] for indice in indices], context=context)
+        return list(zip(indices, validos)), errores
+    finally:
+        batch_now.reset(token)
+
+
+def format_errors(errors: List[dict]) -> str:
+    """Resume en una línea los errores de pydantic de un ítem."""
+    return "; ".join(
+        f"{'.'.join(str(loc) for loc in e['loc'])}: {e['msg']}" if e["loc"] else e["msg"]
+        for e in errors
+    )
+
+
+def item_errors(errores: ItemErrors) -> List[BatchItemError]:
+    """Errores de validación como BatchItemError, con la ubicación relativa al ítem."""
+    return [
+        BatchItemError(indice=indice, detalle=format_errors([{**e, "loc": e["loc"][1:]} for e in errors]))
+        for indice, errors in sorted(errores.items())
+    ]
+
+
+def batch_validation_error(errores: ItemErrors) -> RequestValidationError:
+    """422 con los errores de todos los ítems, en el mismo formato que la validación del body de FastAPI."""
+    return RequestValidationError([
+        {**e, "loc": ("body", *e["loc"])}
+        for _, errors in sorted(errores.items())
+        for e in errors
+    ])
+
+
+def batch_of(model: Type[SQLModel]):
+    """Tipo del body de un alta masiva: la lista se valida con validate_batch y no ítem por ítem
+    en FastAPI, pero la documentación de OpenAPI sigue mostrando el modelo."""
+    return Annotated[
+        List[Dict[str, Any]],
+        WithJsonSchema({"type": "array", "items": {"$ref": f"#/components/schemas/{model.__name__}"}}),
+    ]
@@ -1,19 +1,45 @@
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from contextlib import asynccontextmanager
-from app.database import create_db_and_tables
+from app import cambios
+from app.compression import CompressionMiddleware
+from app.database import DB_ASYNC, DB_CREATE_ALL, create_db_and_tables, dispose_async_engines
+from app.jobs import job_queue
+from app.metrics import MetricsMiddleware, router as metrics_router
+from app.replica import ReadYourWritesMiddleware
+from app.routers_admin import router as admin_router
+from app.routers_async import to_async_router
 from app.routers_autos import router as autos_router
+from app.routers_jobs import router as jobs_router
 from app.routers_ventas import router as ventas_router
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    create_db_and_tables()
+    if DB_CREATE_ALL:
+        create_db_and_tables()
+    # Retoma los trabajos pendientes o a medias y vigila los que abandonen otros procesos.
+    job_queue.start()
+    # En PostgreSQL, los cambios de ventas de todos los procesos llegan por LISTEN/NOTIFY.
+    cambios.listener.start()
     yield
+    cambios.listener.stop()
+    await run_in_threadpool(job_queue.shutdown)
+    await dispose_async_engines()
 
-app = FastAPI(lifespan=lifespan)
+def read_root():
+    return {"message": "API de Ventas de Autos"}
 
-app.include_router(autos_router)
-app.include_router(ventas_router)
+def create_app(async_db: bool = DB_ASYNC) -> FastAPI:
+    """Arma la aplicación; con `async_db` las rutas usan AsyncSession en lugar de Session."""
+    app = FastAPI(lifespan=lifespan)
+    # La más interna: las métricas de tamaño de respuesta miden los bytes que salen comprimidos.
+    app.add_middleware(CompressionMiddleware)
+    app.add_middleware(ReadYourWritesMiddleware)
+    app.add_middleware(MetricsMiddleware)
+    for router in (autos_router, ventas_router, jobs_router, admin_router):
+        app.include_router(to_async_router(router) if async_db else router)
+    app.include_router(metrics_router)
+    app.get("/")(read_root)
+    return app
 
-@app.get("/")
-def read_root():
-    return {"message": "API de Ventas de Autos"}
\ No newline at end of file
+app = create_app()
@@ -0,0 +1,165 @@
+"""Esquema inicial: tablas, índices, unicidad de chasis, resumen de ventas y búsqueda
+
+Revision ID: 0001
+Revises:
+Create Date: 2025-11-20
+
+También adopta bases creadas antes con `create_all`: crea sólo lo que falta
+(tablas, columnas `version`/`updated_at`, índices) en lugar de fallar.
+
+No importa código de la aplicación: el DDL de búsqueda y el cálculo del resumen
+quedan copiados tal como eran al momento de esta migración.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ("auto", "ix_auto_marca", ["marca"], False),
+    ("auto", "ix_auto_modelo", ["modelo"], False),
+    ("auto", "ix_auto_numero_chasis", ["numero_chasis"], True),
+    ("venta", "ix_venta_auto_id", ["auto_id"], False),
+    ("venta", "ix_venta_fecha_venta", ["fecha_venta"], False),
+    ("venta_resumen", "ix_venta_resumen_mes", ["mes"], False),
+]
+
+# Columnas con búsqueda por subcadena: FTS5 (trigram) en SQLite, GIN pg_trgm en PostgreSQL.
+SEARCH_COLUMNS = {"auto": ("marca", "modelo"), "venta": ("nombre_comprador",)}
+
+
+def _sqlite_search_ddl(tablename: str, columns) -> list:
+    fts = f"{tablename}_fts"
+    cols = ", ".join(columns)
+    new_values = ", ".join(f"new.{c}" for c in columns)
+    old_values = ", ".join(f"old.{c}" for c in columns)
+    return [
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='{tablename}', content_rowid='id', tokenize='trigram')",
+        f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {tablename} BEGIN "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_values}); END",
+        f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {tablename} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values}); END",
+        f"CREATE TRIGGER {fts}_au AFTER UPDATE ON {tablename} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values}); "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_values}); END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def _create_search_indexes(bind, inspector) -> None:
+    if bind.dialect.name == "postgresql":
+        op.execute(sa.text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for tablename, columns in SEARCH_COLUMNS.items():
+            for c in columns:
+                op.execute(sa.text(
+                    f"CREATE INDEX IF NOT EXISTS ix_{tablename}_{c}_trgm ON {tablename} USING gin (lower({c}) gin_trgm_ops)"
+                ))
+    elif bind.dialect.name == "sqlite":
+        for tablename, columns in SEARCH_COLUMNS.items():
+            if not inspector.has_table(f"{tablename}_fts"):
+                for statement in _sqlite_search_ddl(tablename, columns):
+                    op.execute(sa.text(statement))
+
+
+def _rebuild_resumen(bind) -> None:
+    if bind.dialect.name == "postgresql":
+        dia, mes = "CAST(fecha_venta AS date)", "to_char(fecha_venta, 'YYYY-MM')"
+    else:
+        dia, mes = "date(fecha_venta)", "strftime('%Y-%m', fecha_venta)"
+    op.execute(sa.text(
+        "INSERT INTO venta_resumen (auto_id, dia, mes, cantidad, total, minimo, maximo) "
+        f"SELECT auto_id, {dia}, {mes}, count(*), sum(precio), min(precio), max(precio) "
+        f"FROM venta GROUP BY auto_id, {dia}, {mes}"
+    ))
+
+
+def _add_missing_columns(inspector, table: str) -> None:
+    columns = {column["name"] for column in inspector.get_columns(table)}
+    if "version" not in columns:
+        op.add_column(table, sa.Column("version", sa.Integer(), nullable=False, server_default="1"))
+    if "updated_at" not in columns:
+        # SQLite no admite CURRENT_TIMESTAMP como default en ADD COLUMN: se completa después.
+        op.add_column(table, sa.Column("updated_at", sa.DateTime(), nullable=False,
+                                       server_default=sa.text("'1970-01-01 00:00:00'")))
+        op.execute(sa.text(f"UPDATE {table} SET updated_at = CURRENT_TIMESTAMP"))
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if not inspector.has_table("auto"):
+        op.create_table(
+            "auto",
+            sa.Column("marca", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+            sa.Column("modelo", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+            sa.Column("año", sa.Integer(), nullable=False),
+            sa.Column("numero_chasis", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("version", sa.Integer(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint("id"),
+        )
+    else:
+        _add_missing_columns(inspector, "auto")
+
+    if not inspector.has_table("venta"):
+        op.create_table(
+            "venta",
+            sa.Column("nombre_comprador", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+            sa.Column("precio", sa.Float(), nullable=False),
+            sa.Column("fecha_venta", sa.DateTime(), nullable=False),
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("auto_id", sa.Integer(), nullable=False),
+            sa.Column("version", sa.Integer(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(["auto_id"], ["auto.id"]),
+            sa.PrimaryKeyConstraint("id"),
+        )
+    else:
+        _add_missing_columns(inspector, "venta")
+
+    resumen_nuevo = not inspector.has_table("venta_resumen")
+    if resumen_nuevo:
+        op.create_table(
+            "venta_resumen",
+            sa.Column("auto_id", sa.Integer(), nullable=False),
+            sa.Column("dia", sa.Date(), nullable=False),
+            sa.Column("mes", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+            sa.Column("cantidad", sa.Integer(), nullable=False),
+            sa.Column("total", sa.Float(), nullable=False),
+            sa.Column("minimo", sa.Float(), nullable=False),
+            sa.Column("maximo", sa.Float(), nullable=False),
+            sa.ForeignKeyConstraint(["auto_id"], ["auto.id"]),
+            sa.PrimaryKeyConstraint("auto_id", "dia"),
+        )
+
+    inspector = sa.inspect(bind)
+    for table, name, columns, unique in INDEXES:
+        if name not in {index["name"] for index in inspector.get_indexes(table)}:
+            op.create_index(name, table, columns, unique=unique)
+
+    _create_search_indexes(bind, inspector)
+    if resumen_nuevo:
+        _rebuild_resumen(bind)
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    for tablename, columns in SEARCH_COLUMNS.items():
+        if bind.dialect.name == "sqlite":
+            op.execute(sa.text(f"DROP TABLE IF EXISTS {tablename}_fts"))
+        elif bind.dialect.name == "postgresql":
+            for c in columns:
+                op.execute(sa.text(f"DROP INDEX IF EXISTS ix_{tablename}_{c}_trgm"))
+    for table, name, _, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
+    op.drop_table("venta_resumen")
+    op.drop_table("venta")
+    op.drop_table("auto")
@@ -0,0 +1,45 @@
+"""Secuencia para asignar números de chasis por bloques
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2025-12-01
+
+En PostgreSQL se usa una SEQUENCE con incremento igual al tamaño de bloque; en el
+resto de los motores, la fila 'auto' de chasis_secuencia.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Igual a app.chasis.BLOCK_SIZE al momento de esta migración.
+BLOCK_SIZE = 1000
+
+
+def upgrade() -> None:
+    # Una base creada con `create_all` ya tiene la tabla (y su fila): se adopta como en 0001.
+    if not sa.inspect(op.get_bind()).has_table("chasis_secuencia"):
+        op.create_table(
+            "chasis_secuencia",
+            sa.Column("nombre", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+            sa.Column("siguiente", sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint("nombre"),
+        )
+    op.execute(sa.text(
+        "INSERT INTO chasis_secuencia (nombre, siguiente) SELECT 'auto', 1 "
+        "WHERE NOT EXISTS (SELECT 1 FROM chasis_secuencia WHERE nombre = 'auto')"
+    ))
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute(sa.text(f"CREATE SEQUENCE IF NOT EXISTS chasis_serie_seq START 1 INCREMENT {BLOCK_SIZE}"))
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute(sa.text("DROP SEQUENCE IF EXISTS chasis_serie_seq"))
+    op.drop_table("chasis_secuencia")
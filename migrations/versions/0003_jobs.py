@@ -0,0 +1,45 @@
+"""Tabla de trabajos en segundo plano
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2025-12-10
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Una base creada con `create_all` ya tiene la tabla: se adopta como en 0001.
+    if sa.inspect(op.get_bind()).has_table("job"):
+        return
+    op.create_table(
+        "job",
+        sa.Column("tipo", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("estado", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("total", sa.Integer(), nullable=False),
+        sa.Column("procesados", sa.Integer(), nullable=False),
+        sa.Column("creados", sa.Integer(), nullable=False),
+        sa.Column("errores", sa.JSON(), nullable=False),
+        sa.Column("detalle", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("started_at", sa.DateTime(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("payload", sa.JSON(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_job_estado", "job", ["estado"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_job_estado", table_name="job")
+    op.drop_table("job")
@@ -0,0 +1,27 @@
+"""Índice compuesto (auto_id, fecha_venta) para las ventas de un auto por rango de fechas
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2025-12-15
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0004"
+down_revision: Union[str, None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Una base creada con `create_all` ya tiene el índice: se adopta como en 0001.
+    indexes = {index["name"] for index in sa.inspect(op.get_bind()).get_indexes("venta")}
+    if "ix_venta_auto_id_fecha_venta" in indexes:
+        return
+    op.create_index("ix_venta_auto_id_fecha_venta", "venta", ["auto_id", "fecha_venta"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_venta_auto_id_fecha_venta", table_name="venta")
@@ -0,0 +1,37 @@
+"""Registro de cambios de ventas para GET /ventas/stream
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2025-12-20
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+revision: str = "0005"
+down_revision: Union[str, None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Una base creada con `create_all` ya tiene la tabla: se adopta como en 0001.
+    if sa.inspect(op.get_bind()).has_table("venta_cambio"):
+        return
+    op.create_table(
+        "venta_cambio",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("venta_id", sa.Integer(), nullable=False),
+        sa.Column("tipo", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sqlite_autoincrement=True,
+    )
+    op.create_index("ix_venta_cambio_created_at", "venta_cambio", ["created_at"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_venta_cambio_created_at", table_name="venta_cambio")
+    op.drop_table("venta_cambio")
@@ -0,0 +1,100 @@
+"""Resumen de ventas por marca, modelo y mes, y por auto y mes
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-01-10
+
+El resumen por auto y día tenía casi una fila por venta (cada auto es un vehículo):
+agrupar por marca, modelo o mes lo recorría entero. Se reemplaza por agregados con la
+granularidad de los reportes y se regenera desde las ventas con SQL propio de la migración.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+revision: str = "0006"
+down_revision: Union[str, None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+METRICAS = "count(*), sum(precio), min(precio), max(precio)"
+
+
+def _metric_columns() -> list:
+    return [
+        sa.Column("cantidad", sa.Integer(), nullable=False),
+        sa.Column("total", sa.Float(), nullable=False),
+        sa.Column("minimo", sa.Float(), nullable=False),
+        sa.Column("maximo", sa.Float(), nullable=False),
+    ]
+
+
+def _mes(bind) -> str:
+    if bind.dialect.name == "postgresql":
+        return "to_char(fecha_venta, 'YYYY-MM')"
+    return "strftime('%Y-%m', fecha_venta)"
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    # Una base creada con `create_all` ya tiene las tablas nuevas: se adopta como en 0001.
+    if inspector.has_table("venta_resumen_auto"):
+        return
+    op.drop_index("ix_venta_resumen_mes", table_name="venta_resumen")
+    op.drop_table("venta_resumen")
+    op.create_table(
+        "venta_resumen",
+        sa.Column("marca", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("modelo", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("mes", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        *_metric_columns(),
+        sa.PrimaryKeyConstraint("marca", "modelo", "mes"),
+    )
+    op.create_index("ix_venta_resumen_mes", "venta_resumen", ["mes"], unique=False)
+    op.create_table(
+        "venta_resumen_auto",
+        sa.Column("auto_id", sa.Integer(), nullable=False),
+        sa.Column("mes", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        *_metric_columns(),
+        sa.ForeignKeyConstraint(["auto_id"], ["auto.id"]),
+        sa.PrimaryKeyConstraint("auto_id", "mes"),
+    )
+    op.create_index("ix_venta_resumen_auto_mes", "venta_resumen_auto", ["mes"], unique=False)
+
+    mes = _mes(bind)
+    op.execute(sa.text(
+        "INSERT INTO venta_resumen (marca, modelo, mes, cantidad, total, minimo, maximo) "
+        f"SELECT auto.marca, auto.modelo, {mes}, {METRICAS} FROM venta JOIN auto ON auto.id = venta.auto_id "
+        f"GROUP BY auto.marca, auto.modelo, {mes}"
+    ))
+    op.execute(sa.text(
+        "INSERT INTO venta_resumen_auto (auto_id, mes, cantidad, total, minimo, maximo) "
+        f"SELECT auto_id, {mes}, {METRICAS} FROM venta GROUP BY auto_id, {mes}"
+    ))
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    op.drop_index("ix_venta_resumen_auto_mes", table_name="venta_resumen_auto")
+    op.drop_table("venta_resumen_auto")
+    op.drop_index("ix_venta_resumen_mes", table_name="venta_resumen")
+    op.drop_table("venta_resumen")
+    op.create_table(
+        "venta_resumen",
+        sa.Column("auto_id", sa.Integer(), nullable=False),
+        sa.Column("dia", sa.Date(), nullable=False),
+        sa.Column("mes", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        *_metric_columns(),
+        sa.ForeignKeyConstraint(["auto_id"], ["auto.id"]),
+        sa.PrimaryKeyConstraint("auto_id", "dia"),
+    )
+    op.create_index("ix_venta_resumen_mes", "venta_resumen", ["mes"], unique=False)
+    dia = "CAST(fecha_venta AS date)" if bind.dialect.name == "postgresql" else "date(fecha_venta)"
+    mes = _mes(bind)
+    op.execute(sa.text(
+        "INSERT INTO venta_resumen (auto_id, dia, mes, cantidad, total, minimo, maximo) "
+        f"SELECT auto_id, {dia}, {mes}, {METRICAS} FROM venta GROUP BY auto_id, {dia}, {mes}"
+    ))
@@ -1,12 +1,43 @@
+import asyncio
+import csv
+import io
+import json
+import threading
+import time
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+from typing import Sequence
+
 import pytest
+from alembic.autogenerate import compare_metadata
+from alembic.runtime.migration import MigrationContext
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from fastapi.testclient import TestClient
-from sqlmodel import Session, create_engine, SQLModel
+from pydantic import TypeAdapter
+from sqlalchemy import event, exc, func, inspect, text, update
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import selectinload
+from sqlalchemy.pool import NullPool
+from sqlalchemy.util import greenlet_spawn
+from sqlmodel import Session, SQLModel, create_engine, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlmodel.pool import StaticPool
-from datetime import datetime, timedelta
-
-from main import app
-from app.database import get_session
 
+from app import cache, cambios, cli, compression, database, particiones, search, stats
+from app.chasis import ChasisAllocator, build_vin, chasis_allocator
+from app.database import (async_url, get_async_read_session, get_async_session, get_read_session,
+                          get_session)
+from app.jobs import HANDLERS, JobQueue, get_job_queue
+from app.models import (Auto, AutoCreate, AutoRead, ChasisSecuencia, Job, Venta, VentaCreate, VentaReadWithAuto,
+                        VentaResumen)
+from app.pool import InstrumentedQueuePool, instrument, pool_status
+from app.repositories import AutoRepository, VentaRepository, precio_ajustado
+from app.utils import is_valid_vin
+from app.validation import validate_batch, validation_context
+from main import app, create_app
 
 @pytest.fixture(name="session")
 def session_fixture():
@@ -28,11 +59,60 @@ def client_fixture(session: Session):
         return session
 
     app.dependency_overrides[get_session] = get_session_override
+    app.dependency_overrides[get_read_session] = get_session_override
+    cache.clear_all()
+    chasis_allocator.discard()
     client = TestClient(app)
     yield client
     app.dependency_overrides.clear()
 
 
+@pytest.fixture(name="async_engine")
+def async_engine_fixture(tmp_path):
+    """BD SQLite en archivo para el modo async (aiosqlite) y el engine sync de los exports."""
+    url = f"sqlite:///{tmp_path / 'test.db'}"
+    sync_engine = create_engine(url)
+    SQLModel.metadata.create_all(sync_engine)
+    yield sync_engine, create_async_engine(async_url(url), poolclass=NullPool)
+    sync_engine.dispose()
+
+
+@pytest.fixture(name="async_client")
+def async_client_fixture(async_engine):
+    """Cliente de prueba de la app en modo async."""
+    sync_engine, engine = async_engine
+
+    async def get_async_session_override():
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            yield session
+
+    def get_session_override():
+        with Session(sync_engine) as session:
+            yield session
+
+    async_app = create_app(async_db=True)
+    async_app.dependency_overrides[get_async_session] = get_async_session_override
+    async_app.dependency_overrides[get_async_read_session] = get_async_session_override
+    async_app.dependency_overrides[get_session] = get_session_override
+    async_app.dependency_overrides[get_read_session] = get_session_override
+    cache.clear_all()
+    yield TestClient(async_app)
+
+
+@pytest.fixture(name="query_counter")
+def query_counter_fixture(session: Session):
+    """Contar las sentencias SQL emitidas contra la BD de test."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = session.get_bind()
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    yield statements
+    event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
 class TestAutos:
     """Tests para endpoints de Autos."""
 
@@ -84,6 +164,61 @@ class TestAutos:
         assert response.status_code == 200
         assert len(response.json()) == 2
 
+    def test_list_autos_with_cursor(self, client: TestClient):
+        """Test: Recorrer autos con paginación por cursor y filtro de marca."""
+        for i in range(5):
+            client.post(
+                "/autos/",
+                json={"marca": "Fiat" if i % 2 == 0 else "Renault", "modelo": f"Modelo{i}", "año": 2020},
+            )
+
+        first = client.get("/autos/?marca=fiat&limit=2")
+        assert first.status_code == 200
+        assert [a["modelo"] for a in first.json()] == ["Modelo0", "Modelo2"]
+        cursor = first.headers["X-Next-Cursor"]
+
+        second = client.get(f"/autos/?marca=fiat&limit=2&cursor={cursor}")
+        assert second.status_code == 200
+        assert [a["modelo"] for a in second.json()] == ["Modelo4"]
+        assert "X-Next-Cursor" not in second.headers
+
+    def test_list_autos_invalid_cursor(self, client: TestClient):
+        """Test: Cursor malformado."""
+        response = client.get("/autos/?cursor=no-es-un-cursor")
+        assert response.status_code == 400
+
+    def test_create_multiple_autos(self, client: TestClient, query_counter):
+        """Test: Alta masiva de autos con chasis únicos y pocas consultas."""
+        payload = [{"marca": "VW", "modelo": f"Gol{i}", "año": 2015} for i in range(50)]
+        response = client.post("/autos/batch/", json=payload)
+        assert response.status_code == 201
+        data = response.json()
+        assert [a["modelo"] for a in data] == [f"Gol{i}" for i in range(50)]
+        assert all(a["id"] for a in data)
+        assert len({a["numero_chasis"] for a in data}) == 50
+        # Sin SELECT previo de chasis: sólo el INSERT ... RETURNING.
+        assert len([q for q in query_counter if q.lstrip().upper().startswith(("SELECT", "INSERT"))]) == 1
+
+    def test_export_autos(self, client: TestClient):
+        """Test: Exportar autos filtrados en NDJSON y CSV."""
+        client.post("/autos/batch/", json=[
+            {"marca": "Fiat", "modelo": "Uno", "año": 2010},
+            {"marca": "Ford", "modelo": "Fiesta", "año": 2012},
+            {"marca": "Fiat", "modelo": "Palio", "año": 2011},
+        ])
+
+        response = client.get("/autos/export?marca=fiat")
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        lineas = [json.loads(linea) for linea in response.text.splitlines()]
+        assert [a["modelo"] for a in lineas] == ["Uno", "Palio"]
+        assert set(lineas[0]) == {"id", "marca", "modelo", "año", "numero_chasis"}
+
+        response = client.get("/autos/export?marca=fiat&formato=csv")
+        assert response.status_code == 200
+        filas = list(csv.DictReader(io.StringIO(response.text)))
+        assert [f["modelo"] for f in filas] == ["Uno", "Palio"]
+
     def test_get_auto_by_id(self, client: TestClient):
         """Test: Obtener un auto por ID."""
         create_response = client.post(
@@ -210,6 +345,149 @@ class TestVentas:
         assert response.status_code == 200
         assert len(response.json()) >= 2
 
+    def test_create_multiple_ventas(self, client: TestClient, query_counter):
+        """Test: Alta masiva de ventas validando los autos con una sola consulta."""
+        autos = client.post("/autos/batch/", json=[
+            {"marca": "Kia", "modelo": f"Rio{i}", "año": 2018} for i in range(3)
+        ]).json()
+        query_counter.clear()
+
+        payload = [{
+            "nombre_comprador": f"Comprador{i}",
+            "precio": 12000.00 + i,
+            "fecha_venta": (datetime.now() - timedelta(days=1)).isoformat(),
+            "auto_id": autos[i % 3]["id"],
+        } for i in range(9)]
+        response = client.post("/ventas/batch/", json=payload)
+        assert response.status_code == 201
+        data = response.json()
+        assert [v["nombre_comprador"] for v in data] == [f"Comprador{i}" for i in range(9)]
+        assert [v["auto"]["id"] for v in data] == [autos[i % 3]["id"] for i in range(9)]
+        # Validación de autos, INSERT multi-fila, registro de cambios, carga de autos y upsert de los dos resúmenes.
+        assert len([q for q in query_counter if q.lstrip().upper().startswith(("SELECT", "INSERT"))]) == 6
+
+    def test_create_multiple_ventas_missing_auto(self, client: TestClient):
+        """Test: Un auto inexistente rechaza todo el lote sin altas parciales."""
+        auto_id = client.post("/autos/", json={"marca": "Kia", "modelo": "Rio", "año": 2018}).json()["id"]
+        payload = [{
+            "nombre_comprador": "Comprador",
+            "precio": 12000.00,
+            "fecha_venta": (datetime.now() - timedelta(days=1)).isoformat(),
+            "auto_id": id_,
+        } for id_ in (auto_id, 999)]
+
+        response = client.post("/ventas/batch/", json=payload)
+        assert response.status_code == 404
+        assert client.get("/ventas/").json() == []
+
+        response = client.post("/ventas/batch/?parcial=true", json=payload)
+        assert response.status_code == 201
+        data = response.json()
+        assert len(data["creadas"]) == 1
+        assert data["errores"] == [{"indice": 1, "detalle": "Auto con ID 999 no encontrado."}]
+
+    def test_list_ventas_with_cursor(self, client: TestClient):
+        """Test: Recorrer ventas por cursor ordenadas por fecha de venta."""
+        auto_response = client.post(
+            "/autos/",
+            json={"marca": "Peugeot", "modelo": "208", "año": 2022},
+        )
+        auto_id = auto_response.json()["id"]
+
+        for dias in (3, 1, 2):
+            client.post("/ventas/", json={
+                "nombre_comprador": f"Comprador{dias}",
+                "precio": 15000.00,
+                "fecha_venta": (datetime.now() - timedelta(days=dias)).isoformat(),
+                "auto_id": auto_id,
+            })
+
+        first = client.get("/ventas/?limit=2")
+        assert [v["nombre_comprador"] for v in first.json()] == ["Comprador3", "Comprador2"]
+
+        second = client.get(f"/ventas/?limit=2&cursor={first.headers['X-Next-Cursor']}")
+        assert [v["nombre_comprador"] for v in second.json()] == ["Comprador1"]
+
+    def test_export_ventas(self, client: TestClient):
+        """Test: Exportar ventas en NDJSON."""
+        auto_id = client.post("/autos/", json={"marca": "Fiat", "modelo": "Uno", "año": 2010}).json()["id"]
+        fecha = datetime.now() - timedelta(days=1)
+        client.post("/ventas/", json={
+            "nombre_comprador": "Lucía Gómez",
+            "precio": 9000.00,
+            "fecha_venta": fecha.isoformat(),
+            "auto_id": auto_id,
+        })
+
+        response = client.get("/ventas/export")
+        assert response.status_code == 200
+        lineas = [json.loads(linea) for linea in response.text.splitlines()]
+        assert lineas == [{
+            "nombre_comprador": "Lucía Gómez",
+            "precio": 9000.00,
+            "fecha_venta": fecha.isoformat(),
+            "id": lineas[0]["id"],
+            "auto_id": auto_id,
+        }]
+
+    def test_filter_ventas_by_fecha(self, client: TestClient):
+        """Test: `desde`/`hasta` filtran el listado, el export y las ventas de un auto, ordenados por fecha."""
+        auto_id = client.post("/autos/", json={"marca": "Fiat", "modelo": "Uno", "año": 2010}).json()["id"]
+        otro_id = client.post("/autos/", json={"marca": "Fiat", "modelo": "Palio", "año": 2012}).json()["id"]
+        client.post("/ventas/batch/", json=[{
+            "nombre_comprador": f"Comprador{dia}",
+            "precio": 1000.00,
+            "fecha_venta": f"2024-03-{dia:02d}T10:00:00",
+            "auto_id": auto_id if dia % 2 else otro_id,
+        } for dia in (9, 1, 5, 3, 7)])
+
+        listado = client.get("/ventas/?desde=2024-03-03&hasta=2024-03-07").json()
+        assert [v["nombre_comprador"] for v in listado] == ["Comprador3", "Comprador5", "Comprador7"]
+        export = client.get("/ventas/export?desde=2024-03-05").text.splitlines()
+        assert [json.loads(linea)["nombre_comprador"] for linea in export] == ["Comprador5", "Comprador7", "Comprador9"]
+        del_auto = client.get(f"/ventas/auto/{auto_id}?hasta=2024-03-07").json()
+        assert [v["nombre_comprador"] for v in del_auto] == ["Comprador1", "Comprador3", "Comprador5", "Comprador7"]
+        assert client.get(f"/ventas/auto/{otro_id}?desde=2024-04-01").json() == []
+
+    def test_import_ventas_csv(self, client: TestClient):
+        """Test: Importar ventas desde CSV informando errores por línea."""
+        auto_id = client.post("/autos/", json={"marca": "Fiat", "modelo": "Uno", "año": 2010}).json()["id"]
+        fecha = (datetime.now() - timedelta(days=1)).isoformat()
+        contenido = "\n".join([
+            "nombre_comprador,precio,fecha_venta,auto_id",
+            f"Ana,1000,{fecha},{auto_id}",
+            f"Beto,-5,{fecha},{auto_id}",
+            f"Carla,2000,{fecha},999",
+            "",
+            f"\"Díaz, Dario\",3000,{fecha},{auto_id}",
+        ])
+
+        response = client.post("/ventas/import?formato=csv", content=contenido.encode())
+        assert response.status_code == 200
+        data = response.json()
+        assert data["filas_insertadas"] == 2
+        assert data["filas_con_error"] == 2
+        assert [e["linea"] for e in data["errores"]] == [3, 4]
+        compradores = [v["nombre_comprador"] for v in client.get("/ventas/").json()]
+        assert sorted(compradores) == ["Ana", "Díaz, Dario"]
+
+    def test_import_autos_ndjson(self, client: TestClient):
+        """Test: Importar autos desde NDJSON generando los chasis."""
+        contenido = "\n".join([
+            json.dumps({"marca": "Fiat", "modelo": "Uno", "año": 2010}),
+            "{no es json",
+            json.dumps({"marca": "Ford", "modelo": "Ka", "año": 1800}),
+            json.dumps({"marca": "Ford", "modelo": "Ka", "año": 2015}),
+        ])
+
+        response = client.post("/autos/import", content=contenido.encode())
+        data = response.json()
+        assert data["filas_insertadas"] == 2
+        assert [e["linea"] for e in data["errores"]] == [2, 3]
+        autos = client.get("/autos/").json()
+        assert [a["modelo"] for a in autos] == ["Uno", "Ka"]
+        assert all(len(a["numero_chasis"]) == 17 for a in autos)
+
     def test_get_ventas_by_comprador(self, client: TestClient):
         """Test: Buscar ventas por nombre de comprador."""
         # Crear auto
@@ -233,6 +511,26 @@ class TestVentas:
         assert response.status_code == 200
         assert len(response.json()) >= 1
 
+    def test_get_ventas_by_comprador_search(self, client: TestClient):
+        """Test: Búsqueda de comprador paginada y sincronizada con los cambios."""
+        auto_id = client.post("/autos/", json={"marca": "BMW", "modelo": "X1", "año": 2021}).json()["id"]
+        fecha = (datetime.now() - timedelta(days=1)).isoformat()
+        ids = []
+        for nombre in ["Roberto Fernández", "Alberto Robles", "Lucía Ro", "Marta Díaz"]:
+            ids.append(client.post("/ventas/", json={
+                "nombre_comprador": nombre, "precio": 1000.0, "fecha_venta": fecha, "auto_id": auto_id,
+            }).json()["id"])
+
+        nombres = {v["nombre_comprador"] for v in client.get("/ventas/comprador/ROB").json()}
+        assert nombres == {"Roberto Fernández", "Alberto Robles"}
+        assert len(client.get("/ventas/comprador/rob?limit=1").json()) == 1
+        assert len(client.get("/ventas/comprador/ro").json()) == 3
+
+        client.put(f"/ventas/{ids[0]}", json={"nombre_comprador": "Ramiro Sosa"})
+        client.delete(f"/ventas/{ids[1]}")
+        assert client.get("/ventas/comprador/rob").json() == []
+        assert [v["id"] for v in client.get("/ventas/comprador/miro").json()] == [ids[0]]
+
     def test_delete_venta(self, client: TestClient):
         """Test: Eliminar una venta."""
         # Crear auto
@@ -259,3 +557,1134 @@ class TestVentas:
         # Verificar que fue eliminada
         get_response = client.get(f"/ventas/{venta_id}")
         assert get_response.status_code == 404
+
+
+class TestQueryCount:
+    """Tests de cantidad de consultas por request (sin N+1)."""
+
+    def _seed(self, client: TestClient, cantidad: int) -> int:
+        auto_id = None
+        for i in range(cantidad):
+            auto_id = client.post(
+                "/autos/",
+                json={"marca": "Ford", "modelo": f"Ka{i}", "año": 2019},
+            ).json()["id"]
+            for _ in range(2):
+                client.post("/ventas/", json={
+                    "nombre_comprador": f"Cliente{i}",
+                    "precio": 10000.00,
+                    "fecha_venta": (datetime.now() - timedelta(days=1)).isoformat(),
+                    "auto_id": auto_id,
+                })
+        return auto_id
+
+    @pytest.mark.parametrize("cantidad", [1, 5])
+    def test_list_ventas_fixed_queries(self, client: TestClient, session: Session, query_counter, cantidad):
+        """Test: Listar ventas con su auto cuesta lo mismo sin importar el tamaño de la página."""
+        self._seed(client, cantidad)
+        session.expunge_all()
+        query_counter.clear()
+
+        response = client.get("/ventas/?limit=100")
+        assert len(response.json()) == cantidad * 2
+        assert all(v["auto"] is not None for v in response.json())
+        assert len(query_counter) == 1
+
+    def test_auto_with_ventas_fixed_queries(self, client: TestClient, session: Session, query_counter):
+        """Test: Obtener un auto con sus ventas en una cantidad fija de consultas."""
+        auto_id = self._seed(client, 3)
+        session.expunge_all()
+        query_counter.clear()
+
+        response = client.get(f"/autos/{auto_id}/with-ventas")
+        assert len(response.json()["ventas"]) == 2
+        assert len(query_counter) == 2
+
+    def test_fast_list_output_matches_response_model(self, client: TestClient, session: Session):
+        """Test: Los listados con orjson producen el mismo JSON que la validación con el response_model."""
+        self._seed(client, 3)
+        session.expunge_all()
+        ventas = select(Venta).options(selectinload(Venta.auto))
+        casos = [
+            ("/autos/?limit=100", Sequence[AutoRead], select(Auto).order_by(Auto.id)),
+            ("/ventas/?limit=100", Sequence[VentaReadWithAuto], ventas.order_by(Venta.fecha_venta, Venta.id)),
+            ("/ventas/comprador/Cliente?limit=100", Sequence[VentaReadWithAuto],
+             search.ranked(session, ventas, Venta, "nombre_comprador", "Cliente")),
+        ]
+        # El oráculo carga entidades con el ORM; las rutas leen tuplas de columnas.
+        for url, response_model, statement in casos:
+            esperado = JSONResponse(jsonable_encoder(
+                TypeAdapter(response_model).validate_python(session.exec(statement).all(), from_attributes=True)
+            )).body
+            assert client.get(url).content == esperado
+
+
+class TestStats:
+    """Tests para las estadísticas de ventas."""
+
+    def _venta(self, client: TestClient, auto_id: int, precio: float, fecha: datetime) -> int:
+        return client.post("/ventas/", json={
+            "nombre_comprador": "Cliente", "precio": precio, "fecha_venta": fecha.isoformat(), "auto_id": auto_id,
+        }).json()["id"]
+
+    def test_stats_by_modelo_and_mes(self, client: TestClient, session: Session):
+        """Test: Estadísticas por modelo y por mes mantenidas en altas, cambios y bajas."""
+        gol = client.post("/autos/", json={"marca": "VW", "modelo": "Gol", "año": 2015}).json()["id"]
+        ka = client.post("/autos/", json={"marca": "Ford", "modelo": "Ka", "año": 2016}).json()["id"]
+        enero, febrero = datetime(2024, 1, 10, 12), datetime(2024, 2, 5, 9)
+        self._venta(client, gol, 100.0, enero)
+        barata = self._venta(client, gol, 50.0, enero)
+        self._venta(client, ka, 300.0, febrero)
+        client.post("/ventas/batch/", json=[
+            {"nombre_comprador": "Otro", "precio": 200.0, "fecha_venta": febrero.isoformat(), "auto_id": gol},
+        ])
+
+        response = client.get("/ventas/stats?agrupar=modelo")
+        assert response.status_code == 200
+        assert response.json() == [
+            {"grupo": "Gol", "cantidad": 3, "total": 350.0, "promedio": 350.0 / 3, "minimo": 50.0, "maximo": 200.0},
+            {"grupo": "Ka", "cantidad": 1, "total": 300.0, "promedio": 300.0, "minimo": 300.0, "maximo": 300.0},
+        ]
+
+        client.delete(f"/ventas/{barata}")
+        client.put(f"/ventas/{barata - 1}", json={"precio": 150.0})
+        data = client.get("/ventas/stats?agrupar=mes&desde=2024-01-01&hasta=2024-01-31").json()
+        assert data == [
+            {"grupo": "2024-01", "cantidad": 1, "total": 150.0, "promedio": 150.0, "minimo": 150.0, "maximo": 150.0},
+        ]
+
+        por_marca = client.get("/ventas/stats?agrupar=marca").json()
+        assert stats.rebuild(session) == 3
+        session.commit()
+        assert client.get("/ventas/stats?agrupar=marca").json() == por_marca
+
+    def test_stats_summary_by_group_and_partial_months(self, client: TestClient, session: Session):
+        """Test: Un grupo por modelo y mes (no por venta), cambios de marca y rangos que cortan meses."""
+        autos = client.post("/autos/batch/", json=[{"marca": "VW", "modelo": "Gol", "año": 2015}] * 3).json()
+        client.post("/ventas/batch/", json=[
+            {"nombre_comprador": "Cliente", "precio": 100.0 * (i + 1), "fecha_venta": datetime(2024, 1, 5 + 10 * i).isoformat(),
+             "auto_id": auto["id"]}
+            for i, auto in enumerate(autos)
+        ])
+        assert session.exec(select(func.count()).select_from(VentaResumen)).one() == 1
+
+        data = client.get("/ventas/stats?agrupar=modelo&desde=2024-01-10&hasta=2024-01-20").json()
+        assert data == [{"grupo": "Gol", "cantidad": 1, "total": 200.0, "promedio": 200.0, "minimo": 200.0, "maximo": 200.0}]
+        por_auto = client.get("/ventas/stats?agrupar=auto&desde=2024-01-01&hasta=2024-02-29").json()
+        assert [(g["grupo"], g["cantidad"]) for g in por_auto] == [(auto["id"], 1) for auto in autos]
+
+        client.put(f"/autos/{autos[0]['id']}", json={"marca": "Volkswagen", "modelo": "Up"})
+        assert [(g["grupo"], g["cantidad"], g["total"]) for g in client.get("/ventas/stats?agrupar=modelo").json()] == [
+            ("Gol", 2, 500.0), ("Up", 1, 100.0),
+        ]
+        assert [g["grupo"] for g in client.get("/ventas/stats?agrupar=marca").json()] == ["VW", "Volkswagen"]
+
+
+class TestBulk:
+    """Tests de las operaciones masivas por filtro."""
+
+    def _datos(self, client: TestClient):
+        autos = client.post("/autos/batch/", json=[
+            {"marca": "Fiat", "modelo": "Cronos", "año": 2020},
+            {"marca": "Fiat", "modelo": "Argo", "año": 2021},
+            {"marca": "Ford", "modelo": "Ka", "año": 2019},
+        ]).json()
+        ventas = client.post("/ventas/batch/", json=[
+            {"nombre_comprador": f"Cliente {i}", "precio": 1000.0, "fecha_venta": datetime(2024, 1, 10 + i).isoformat(),
+             "auto_id": autos[i % 3]["id"]}
+            for i in range(6)
+        ]).json()
+        return autos, ventas
+
+    def test_bulk_update_ventas(self, client: TestClient, query_counter):
+        """Test: Reajuste de precios por marca y fecha en un único UPDATE, con dry-run, resumen y caché al día."""
+        autos, ventas = self._datos(client)
+        fiat = [v for v in ventas if v["auto_id"] != autos[2]["id"]]
+        client.get(f"/ventas/{fiat[0]['id']}")
+
+        url = "/ventas/bulk?marca=fiat&desde=2024-01-10&hasta=2024-01-13"
+        dry = client.patch(f"{url}&dry_run=true", json={"precio_factor": 1.1})
+        assert dry.json() == {"dry_run": True, "autos": 0, "ventas": 3}
+        query_counter.clear()
+        response = client.patch(url, json={"precio_factor": 1.1})
+        assert response.status_code == 200
+        assert response.json()["ventas"] == 3
+        assert len([q for q in query_counter if q.lstrip().upper().startswith("UPDATE")]) == 1
+
+        assert client.get(f"/ventas/{fiat[0]['id']}").json()["precio"] == 1100.0
+        assert client.get("/ventas/stats?agrupar=marca").json()[0] == {
+            "grupo": "Fiat", "cantidad": 4, "total": 4300.0, "promedio": 1075.0, "minimo": 1000.0, "maximo": 1100.0,
+        }
+        renombradas = client.patch("/ventas/bulk?comprador=cliente 5", json={"nombre_comprador": "Otro"}).json()
+        assert renombradas["ventas"] == 1
+
+    def test_precio_factor_rounds_as_numeric_on_postgresql(self):
+        """Test: En PostgreSQL el reajuste redondea como numeric (no hay round(double precision, int))."""
+        sql = str(update(Venta).values(precio=precio_ajustado(1.1)).compile(dialect=postgresql.dialect()))
+        assert "precio=CAST(round(CAST(venta.precio * %(precio_1)s AS NUMERIC), %(round_1)s) AS FLOAT)" in sql
+
+    def test_bulk_update_requires_filter_and_changes(self, client: TestClient):
+        """Test: Sin filtro o sin cambios no se modifica nada."""
+        assert client.patch("/ventas/bulk", json={"precio": 1.0}).status_code == 400
+        assert client.patch("/ventas/bulk?auto_id=1", json={}).status_code == 400
+        assert client.patch("/ventas/bulk?auto_id=1", json={"precio": 1.0, "precio_factor": 2}).status_code == 422
+
+    def test_bulk_delete_autos_cascade(self, client: TestClient):
+        """Test: Borrado masivo de autos: 409 si tienen ventas, cascada explícita y dry-run."""
+        autos, _ = self._datos(client)
+        fiat = client.delete("/autos/bulk?marca=fiat")
+        assert fiat.status_code == 409
+
+        dry = client.delete("/autos/bulk?marca=fiat&cascada=true&dry_run=true").json()
+        assert dry == {"dry_run": True, "autos": 2, "ventas": 4}
+        assert len(client.get("/autos/").json()) == 3
+
+        response = client.delete("/autos/bulk?marca=fiat&cascada=true")
+        assert response.json() == {"dry_run": False, "autos": 2, "ventas": 4}
+        assert client.get(f"/autos/{autos[0]['id']}").status_code == 404
+        assert [v["auto_id"] for v in client.get("/ventas/").json()] == [autos[2]["id"]] * 2
+        assert [g["grupo"] for g in client.get("/ventas/stats?agrupar=marca").json()] == ["Ford"]
+
+        client.post("/autos/", json={"marca": "Renault", "modelo": "Clio", "año": 2012})
+        assert client.delete("/autos/bulk").status_code == 400
+        assert client.delete(f"/autos/bulk?ids={autos[2]['id'] + 1}").json()["autos"] == 1
+
+
+@pytest.fixture(name="jobs")
+def jobs_fixture(client: TestClient, session: Session):
+    """Cola de trabajos sobre la BD de test, con bloques chicos para ejercitar el avance."""
+    queue = JobQueue(lambda: Session(session.get_bind()), max_workers=1, chunk_size=2)
+    app.dependency_overrides[get_job_queue] = lambda: queue
+    yield queue
+    queue.shutdown()
+
+
+class TestJobs:
+    """Tests de las altas masivas en segundo plano."""
+
+    def test_async_batch_autos(self, client: TestClient, jobs: JobQueue):
+        """Test: Con async=true el alta responde 202 y el trabajo avanza por bloques hasta completarse."""
+        payload = [{"marca": "VW", "modelo": f"Gol{i}", "año": 2015} for i in range(5)]
+        response = client.post("/autos/batch/?async=true", json=payload)
+        assert response.status_code == 202
+        job = response.json()
+        assert job["estado"] == "pendiente" and job["total"] == 5
+        assert response.headers["Location"] == f"/jobs/{job['id']}"
+
+        jobs.join()
+        estado = client.get(f"/jobs/{job['id']}").json()
+        assert estado["estado"] == "completado"
+        assert (estado["procesados"], estado["creados"], estado["errores"]) == (5, 5, [])
+        assert sorted(a["modelo"] for a in client.get("/autos/").json()) == [f"Gol{i}" for i in range(5)]
+        assert client.get("/jobs/999").status_code == 404
+
+    def test_async_batch_ventas_reports_errors(self, client: TestClient, jobs: JobQueue):
+        """Test: Las ventas sin auto quedan como errores del trabajo, con su índice en el lote."""
+        auto_id = client.post("/autos/", json={"marca": "Fiat", "modelo": "Uno", "año": 2010}).json()["id"]
+        payload = [
+            {"nombre_comprador": f"Cliente {i}", "precio": 100.0, "fecha_venta": datetime(2024, 1, 10).isoformat(),
+             "auto_id": auto_id if i != 2 else 999}
+            for i in range(4)
+        ]
+        job_id = client.post("/ventas/batch/?async=true", json=payload).json()["id"]
+        jobs.join()
+        estado = client.get(f"/jobs/{job_id}").json()
+        assert estado["creados"] == 3
+        assert estado["errores"] == [{"indice": 2, "detalle": "Auto con ID 999 no encontrado."}]
+        assert client.get("/ventas/stats?agrupar=auto").json()[0]["cantidad"] == 3
+
+    def test_jobs_resume_after_restart(self, client: TestClient, session: Session, jobs: JobQueue):
+        """Test: Un trabajo que quedó a medias se retoma desde el último bloque confirmado."""
+        items = [{"marca": "Ford", "modelo": f"Ka{i}", "año": 2019} for i in range(4)]
+        job = Job(tipo="autos_batch", estado="en_curso", payload=items, total=4, procesados=2, creados=2,
+                  updated_at=datetime(2020, 1, 1))
+        session.add(job)
+        session.commit()
+
+        assert jobs.resume() == 1
+        jobs.join()
+        assert client.get(f"/jobs/{job.id}").json()["creados"] == 4
+        assert sorted(a["modelo"] for a in client.get("/autos/").json()) == ["Ka2", "Ka3"]
+
+    def test_graceful_stop_releases_job(self, client: TestClient, session: Session, jobs: JobQueue, monkeypatch):
+        """Test: Un apagado a mitad de un trabajo lo deja pendiente y el próximo proceso lo retoma enseguida."""
+        validate, write = HANDLERS["autos_batch"]
+
+        def write_and_stop(session, autos):
+            write(session, autos)
+            threading.Thread(target=jobs.shutdown).start()
+            jobs._stopping.wait(5)
+
+        monkeypatch.setitem(HANDLERS, "autos_batch", (validate, write_and_stop))
+        items = [{"marca": "Ford", "modelo": f"Ka{i}", "año": 2019} for i in range(4)]
+        job_id = client.post("/autos/batch/?async=true", json=items).json()["id"]
+        jobs.join()
+        estado = client.get(f"/jobs/{job_id}").json()
+        assert (estado["estado"], estado["procesados"]) == ("pendiente", 2)
+
+        monkeypatch.setitem(HANDLERS, "autos_batch", (validate, write))
+        reiniciada = JobQueue(lambda: Session(session.get_bind()), max_workers=1, chunk_size=2)
+        assert reiniciada.resume() == 1
+        reiniciada.join()
+        assert client.get(f"/jobs/{job_id}").json()["estado"] == "completado"
+        assert len(client.get("/autos/").json()) == 4
+
+    def test_monitor_resumes_job_of_dead_process(self, session: Session):
+        """Test: Un trabajo en curso de un proceso que murió se retoma cuando deja de renovarse, sin reiniciar."""
+        job = Job(tipo="autos_batch", estado="en_curso", payload=[{"marca": "VW", "modelo": "Up", "año": 2015}], total=1)
+        session.add(job)
+        session.commit()
+        queue = JobQueue(lambda: Session(session.get_bind()), stale_seconds=1, heartbeat_seconds=0.05)
+        queue.start()
+        try:
+            assert queue.resume() == 0
+            for _ in range(100):
+                session.refresh(job)
+                if job.estado == "completado":
+                    break
+                time.sleep(0.05)
+            assert (job.estado, job.creados) == ("completado", 1)
+        finally:
+            queue.shutdown()
+
+    def test_queue_limit(self, client: TestClient, session: Session):
+        """Test: Con la cola llena se rechaza el alta en segundo plano con 503."""
+        app.dependency_overrides[get_job_queue] = lambda: JobQueue(lambda: Session(session.get_bind()), max_pending=0)
+        response = client.post("/autos/batch/?async=true", json=[{"marca": "VW", "modelo": "Up", "año": 2015}])
+        assert response.status_code == 503
+        assert response.headers["Retry-After"]
+
+
+class TestCache:
+    """Tests para la caché de entidades."""
+
+    def test_auto_lookups_are_cached_and_invalidated(self, client: TestClient, session: Session, query_counter):
+        """Test: Las lecturas repetidas no van a la BD y un update invalida la entrada."""
+        auto = client.post("/autos/", json={"marca": "Renault", "modelo": "Clio", "año": 2012}).json()
+        session.expunge_all()
+
+        client.get(f"/autos/{auto['id']}")
+        query_counter.clear()
+        assert client.get(f"/autos/{auto['id']}").json()["modelo"] == "Clio"
+        assert client.get(f"/autos/chasis/{auto['numero_chasis']}").json()["id"] == auto["id"]
+        assert query_counter == []
+
+        client.put(f"/autos/{auto['id']}", json={"modelo": "Sandero"})
+        session.expunge_all()
+        assert client.get(f"/autos/{auto['id']}").json()["modelo"] == "Sandero"
+        assert client.get(f"/autos/chasis/{auto['numero_chasis']}").json()["modelo"] == "Sandero"
+
+        stats_response = client.get("/admin/cache").json()
+        assert stats_response["autos"]["hits"] >= 3
+        assert stats_response["autos"]["misses"] >= 1
+
+    def test_venta_lookup_cached_and_invalidated_on_delete(self, client: TestClient, session: Session, query_counter):
+        """Test: Una venta cacheada deja de estar disponible al eliminarla."""
+        auto_id = client.post("/autos/", json={"marca": "Renault", "modelo": "Clio", "año": 2012}).json()["id"]
+        venta_id = client.post("/ventas/", json={
+            "nombre_comprador": "Pablo", "precio": 5000.0,
+            "fecha_venta": (datetime.now() - timedelta(days=1)).isoformat(), "auto_id": auto_id,
+        }).json()["id"]
+        client.get(f"/ventas/{venta_id}")
+        session.expunge_all()
+        query_counter.clear()
+
+        response = client.get(f"/ventas/{venta_id}")
+        assert response.json()["auto"]["modelo"] == "Clio"
+        assert query_counter == []
+
+        client.delete(f"/ventas/{venta_id}")
+        assert client.get(f"/ventas/{venta_id}").status_code == 404
+
+    def test_delete_ignores_cached_copy(self, client: TestClient, session: Session):
+        """Test: Borrar una venta en caché que ya no existe en la BD da 404, sin evento ni cambios en el resumen."""
+        auto_id = client.post("/autos/", json={"marca": "Renault", "modelo": "Clio", "año": 2012}).json()["id"]
+        ids = [v["id"] for v in client.post("/ventas/batch/", json=[
+            {"nombre_comprador": f"C{i}", "precio": 100.0, "fecha_venta": datetime(2024, 3, 1 + i).isoformat(), "auto_id": auto_id}
+            for i in range(2)
+        ]).json()]
+        assert client.get(f"/ventas/{ids[0]}").status_code == 200
+        session.execute(text("DELETE FROM venta WHERE id = :id"), {"id": ids[0]})
+        session.commit()
+        eventos = session.execute(text("SELECT count(*) FROM venta_cambio")).scalar_one()
+
+        assert client.delete(f"/ventas/{ids[0]}").status_code == 404
+        assert session.execute(text("SELECT count(*) FROM venta_cambio")).scalar_one() == eventos
+        assert client.get("/ventas/stats?agrupar=modelo").json()[0]["cantidad"] == 2
+
+        assert client.delete(f"/ventas/{ids[1]}").status_code == 204
+        assert client.get("/ventas/stats?agrupar=modelo").json() == []
+
+    def test_memory_cache_lru_and_ttl(self):
+        """Test: El backend en memoria respeta el tamaño máximo y el TTL."""
+        backend = cache.MemoryCache(maxsize=2, ttl=60)
+        backend.set("a", {"v": 1})
+        backend.set("b", {"v": 2})
+        backend.get("a")
+        backend.set("c", {"v": 3})
+        assert backend.get("b") is None
+        assert backend.get("a") == {"v": 1}
+
+        expirado = cache.MemoryCache(ttl=-1)
+        expirado.set("a", {"v": 1})
+        assert expirado.get("a") is None
+
+    def test_stale_read_not_stored_after_invalidate(self):
+        """Test: Tras invalidar, una lectura previa a la escritura no vuelve a la caché."""
+        entidades = cache.EntityCache(cache.MemoryCache(), "auto")
+        entidades.set("id:1", {"id": 1, "version": 1})
+        entidades.invalidate("id:1", version=2)
+        assert entidades.get("id:1") is None
+        entidades.set("id:1", {"id": 1, "version": 1})
+        assert entidades.get("id:1") is None
+        entidades.set("id:1", {"id": 1, "version": 2})
+        assert entidades.get("id:1") == {"id": 1, "version": 2}
+        entidades.set("id:1", {"id": 1, "version": 1})
+        assert entidades.get("id:1") == {"id": 1, "version": 2}
+
+    def test_concurrent_set_and_invalidate(self):
+        """Test: Un `set` con una lectura vieja no pisa un `invalidate` concurrente, aunque el backend sea lento."""
+
+        class Lenta(cache.MemoryCache):
+            def get(self, key):
+                value = super().get(key)
+                time.sleep(0.005)
+                return value
+
+        entidades = cache.EntityCache(Lenta(), "auto")
+        for version in range(1, 51):
+            barrera = threading.Barrier(2)
+
+            def guardar():
+                barrera.wait()
+                entidades.set("id:1", {"id": 1, "version": version})
+
+            def invalidar():
+                barrera.wait()
+                time.sleep(0.001)  # cae entre la lectura y la escritura de `guardar`
+                entidades.invalidate("id:1", version=version + 1)
+
+            hilos = [threading.Thread(target=guardar), threading.Thread(target=invalidar)]
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+            assert entidades.get("id:1") is None
+
+    def test_redis_set_if_newer_uses_script(self):
+        """Test: RedisCache compara y guarda con un único script Lua (atómico en el servidor)."""
+        llamadas = []
+
+        class FakeRedis:
+            def register_script(self, script):
+                assert "redis.call('SET'" in script and cache.INVALIDADO in script
+                return lambda keys, args: llamadas.append((keys, args)) or 1
+
+        backend = cache.RedisCache(FakeRedis(), prefix="p:", ttl=60)
+        assert backend.set_if_newer("id:1", {"id": 1, "version": 3}, 3)
+        assert llamadas == [(["p:id:1"], ['{"id": 1, "version": 3}', 3, 60])]
+
+    def test_redis_calls_leave_event_loop_in_async_mode(self):
+        """Test: Desde un handler en modo async (greenlet sobre el loop) el cliente Redis se llama en otro thread."""
+        threads = []
+
+        class FakeRedis:
+            def get(self, key):
+                threads.append(threading.get_ident())
+                return None
+
+        backend = cache.RedisCache(FakeRedis())
+
+        async def handler():
+            loop_thread = threading.get_ident()
+            await greenlet_spawn(backend.get, "id:1")
+            return loop_thread
+
+        loop_thread = asyncio.run(handler())
+        assert len(threads) == 1 and threads[0] != loop_thread
+        backend.get("id:1")
+        assert threads[-1] == threading.get_ident()
+
+    def test_redis_backend_selected_by_env(self, monkeypatch):
+        """Test: CACHE_BACKEND=redis usa un RedisCache por namespace con la URL configurada."""
+        urls = []
+
+        class FakeRedis:
+            @staticmethod
+            def from_url(url):
+                urls.append(url)
+                return object()
+
+        monkeypatch.setenv("CACHE_BACKEND", "redis")
+        monkeypatch.setenv("CACHE_REDIS_URL", "redis://cache:6379/1")
+        monkeypatch.setattr(cache, "redis", SimpleNamespace(Redis=FakeRedis))
+        backend = cache.build_backend("venta")
+        assert isinstance(backend, cache.RedisCache) and backend.prefix == "autos-api:venta:"
+        assert urls == ["redis://cache:6379/1"]
+
+        monkeypatch.setattr(cache, "redis", None)
+        with pytest.raises(ValueError, match="redis"):
+            cache.build_backend("venta")
+
+
+class TestConditionalRequests:
+    """Tests para ETag / requests condicionales."""
+
+    def test_get_auto_not_modified_and_if_match(self, client: TestClient):
+        """Test: 304 con If-None-Match y 412 al actualizar con un ETag viejo."""
+        auto_id = client.post("/autos/", json={"marca": "Fiat", "modelo": "Uno", "año": 2010}).json()["id"]
+        response = client.get(f"/autos/{auto_id}")
+        etag = response.headers["ETag"]
+        assert response.headers["Last-Modified"]
+
+        cached = client.get(f"/autos/{auto_id}", headers={"If-None-Match": etag})
+        assert cached.status_code == 304
+        assert cached.content == b""
+
+        updated = client.put(f"/autos/{auto_id}", json={"modelo": "Palio"}, headers={"If-Match": etag})
+        assert updated.status_code == 200
+        assert updated.headers["ETag"] != etag
+
+        stale = client.put(f"/autos/{auto_id}", json={"modelo": "Siena"}, headers={"If-Match": etag})
+        assert stale.status_code == 412
+        assert client.get(f"/autos/{auto_id}").json()["modelo"] == "Palio"
+        assert client.get(f"/autos/{auto_id}", headers={"If-None-Match": etag}).status_code == 200
+
+    def test_empty_update_keeps_version(self, client: TestClient):
+        """Test: Un PUT sin campos no escribe ni cambia el ETag, pero sigue verificando If-Match."""
+        auto_id = client.post("/autos/", json={"marca": "Fiat", "modelo": "Uno", "año": 2010}).json()["id"]
+        venta_id = client.post("/ventas/", json={
+            "nombre_comprador": "Ana", "precio": 1000.0, "fecha_venta": "2024-03-01T10:00:00", "auto_id": auto_id,
+        }).json()["id"]
+        for url in (f"/autos/{auto_id}", f"/ventas/{venta_id}"):
+            etag = client.get(url).headers["ETag"]
+            response = client.put(url, json={}, headers={"If-Match": etag})
+            assert response.status_code == 200
+            assert response.headers["ETag"] == etag
+            assert client.get(url).headers["ETag"] == etag
+        client.put(f"/autos/{auto_id}", json={"modelo": "Palio"})
+        assert client.put(f"/autos/{auto_id}", json={}, headers={"If-Match": f'"auto-{auto_id}-1"'}).status_code == 412
+
+    def test_venta_and_list_etags_follow_auto_changes(self, client: TestClient):
+        """Test: El ETag de una venta y del listado cambia si cambia el auto embebido."""
+        auto_id = client.post("/autos/", json={"marca": "Fiat", "modelo": "Uno", "año": 2010}).json()["id"]
+        venta_id = client.post("/ventas/", json={
+            "nombre_comprador": "Eva", "precio": 1000.0,
+            "fecha_venta": (datetime.now() - timedelta(days=1)).isoformat(), "auto_id": auto_id,
+        }).json()["id"]
+        venta_etag = client.get(f"/ventas/{venta_id}").headers["ETag"]
+        list_etag = client.get("/ventas/").headers["ETag"]
+        assert client.get("/ventas/", headers={"If-None-Match": list_etag}).status_code == 304
+
+        client.put(f"/autos/{auto_id}", json={"marca": "FIAT"})
+        assert client.get(f"/ventas/{venta_id}", headers={"If-None-Match": venta_etag}).status_code == 200
+        assert client.get("/ventas/", headers={"If-None-Match": list_etag}).status_code == 200
+
+    def test_update_is_single_statement(self, client: TestClient, query_counter):
+        """Test: Un PUT con If-Match es un único UPDATE ... RETURNING con la versión en el WHERE."""
+        auto_id = client.post("/autos/", json={"marca": "Fiat", "modelo": "Uno", "año": 2010}).json()["id"]
+        etag = client.get(f"/autos/{auto_id}").headers["ETag"]
+        query_counter.clear()
+
+        # Cambiar marca o modelo además lee los grupos del resumen de sus ventas (ver TestStats).
+        response = client.put(f"/autos/{auto_id}", json={"año": 2011}, headers={"If-Match": etag})
+        assert response.status_code == 200
+        assert response.json()["año"] == 2011
+        assert len(query_counter) == 1
+        assert query_counter[0].lstrip().upper().startswith("UPDATE") and "RETURNING" in query_counter[0]
+
+    def test_update_conflicts_and_missing(self, client: TestClient):
+        """Test: 404 si no existe; 412 si cambió la versión de la venta o de su auto, o el ETag es de otro recurso."""
+        auto_id = client.post("/autos/", json={"marca": "Fiat", "modelo": "Uno", "año": 2010}).json()["id"]
+        venta_id = client.post("/ventas/", json={
+            "nombre_comprador": "Eva", "precio": 1000.0, "fecha_venta": datetime(2024, 1, 10).isoformat(),
+            "auto_id": auto_id,
+        }).json()["id"]
+        auto_etag = client.get(f"/autos/{auto_id}").headers["ETag"]
+        venta_etag = client.get(f"/ventas/{venta_id}").headers["ETag"]
+
+        assert client.put("/autos/999", json={"modelo": "X"}).status_code == 404
+        missing = client.put("/ventas/999", json={"precio": 1.0}, headers={"If-Match": '"venta-999-1-1"'})
+        assert missing.status_code == 404
+        wrong = client.put(f"/ventas/{venta_id}", json={"precio": 1.0}, headers={"If-Match": auto_etag})
+        assert wrong.status_code == 412
+
+        client.put(f"/autos/{auto_id}", json={"marca": "FIAT"}, headers={"If-Match": auto_etag})
+        stale = client.put(f"/ventas/{venta_id}", json={"precio": 1.0}, headers={"If-Match": venta_etag})
+        assert stale.status_code == 412
+
+        venta_etag = client.get(f"/ventas/{venta_id}").headers["ETag"]
+        response = client.put(f"/ventas/{venta_id}", json={"fecha_venta": datetime(2024, 2, 1).isoformat()},
+                              headers={"If-Match": venta_etag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] == client.get(f"/ventas/{venta_id}").headers["ETag"]
+        assert [g["grupo"] for g in client.get("/ventas/stats?agrupar=mes").json()] == ["2024-02"]
+
+
+class TestAsyncMode:
+    """Tests de la app con AsyncSession (aiosqlite)."""
+
+    def test_async_endpoints_are_coroutines(self, async_client: TestClient):
+        """Test: Las rutas con BD son async def, salvo los exports en streaming."""
+        rutas = {(route.path, tuple(route.methods)): route for route in async_client.app.routes
+                 if hasattr(route, "methods")}
+        assert asyncio.iscoroutinefunction(rutas[("/autos/{auto_id}", ("GET",))].endpoint)
+        assert asyncio.iscoroutinefunction(rutas[("/ventas/", ("POST",))].endpoint)
+        assert not asyncio.iscoroutinefunction(rutas[("/autos/export", ("GET",))].endpoint)
+
+    def test_async_crud_flow(self, async_client: TestClient):
+        """Test: Alta, consulta, modificación y baja de autos y ventas en modo async."""
+        auto = async_client.post(
+            "/autos/", json={"marca": "Toyota", "modelo": "Corolla", "año": 2020}
+        ).json()
+        venta = async_client.post("/ventas/", json={
+            "nombre_comprador": "Juan Pérez",
+            "precio": 15000,
+            "auto_id": auto["id"],
+            "fecha_venta": datetime.now().isoformat(),
+        })
+        assert venta.status_code == 201
+        assert venta.json()["auto"]["marca"] == "Toyota"
+
+        response = async_client.get(f"/autos/{auto['id']}/with-ventas")
+        assert response.status_code == 200
+        assert len(response.json()["ventas"]) == 1
+
+        etag = async_client.get(f"/autos/{auto['id']}").headers["ETag"]
+        assert async_client.get(f"/autos/{auto['id']}", headers={"If-None-Match": etag}).status_code == 304
+        response = async_client.put(f"/autos/{auto['id']}", json={"modelo": "Yaris"}, headers={"If-Match": etag})
+        assert response.status_code == 200
+        assert response.json()["modelo"] == "Yaris"
+
+        lineas = async_client.get("/ventas/export").text.splitlines()
+        assert len(lineas) == 1
+
+        assert async_client.delete(f"/ventas/{venta.json()['id']}").status_code == 204
+        assert async_client.get(f"/ventas/{venta.json()['id']}").status_code == 404
+
+    def test_async_batch_and_list(self, async_client: TestClient):
+        """Test: Alta masiva y listado con cursor en modo async."""
+        autos = [{"marca": "Ford", "modelo": f"Focus {i}", "año": 2020} for i in range(3)]
+        assert async_client.post("/autos/batch/", json=autos).status_code == 201
+        response = async_client.get("/autos/?limit=2")
+        assert len(response.json()) == 2
+        cursor = response.headers["X-Next-Cursor"]
+        assert len(async_client.get(f"/autos/?limit=2&cursor={cursor}").json()) == 1
+
+
+class TestPool:
+    """Tests de instrumentación del pool de conexiones."""
+
+    def test_pool_stats_endpoint(self, client: TestClient):
+        """Test: Estadísticas del pool en el endpoint de administración."""
+        response = client.get("/admin/pool")
+        assert response.status_code == 200
+        data = response.json()["sync"]
+        assert {"checkouts", "checkins", "timeouts", "wait_avg_ms"} <= set(data)
+
+    def test_pool_wait_and_timeouts(self, tmp_path):
+        """Test: El pool instrumentado cuenta esperas, conexiones en uso y timeouts."""
+        engine = create_engine(
+            f"sqlite:///{tmp_path / 'pool.db'}",
+            poolclass=InstrumentedQueuePool, pool_size=1, max_overflow=0, pool_timeout=0.05,
+        )
+        estadisticas = instrument(engine)
+        with engine.connect():
+            assert pool_status(engine)["checked_out"] == 1
+            with pytest.raises(exc.TimeoutError):
+                engine.connect()
+        engine.dispose()
+
+        assert estadisticas.checkouts == 1
+        assert estadisticas.checkins == 1
+        assert estadisticas.timeouts == 1
+        assert estadisticas.wait_max >= 0.05
+
+
+class TestMetrics:
+    """Tests del endpoint /metrics."""
+
+    def test_metrics_by_route_template(self, client: TestClient):
+        """Test: Latencia, tamaño y consultas SQL se agrupan por plantilla de ruta."""
+        auto = client.post("/autos/", json={"marca": "Toyota", "modelo": "Corolla", "año": 2020}).json()
+        client.get(f"/autos/{auto['id']}/with-ventas")
+        client.get("/autos/999999")
+
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        body = response.text
+        assert 'http_requests_total{method="GET",route="/autos/{auto_id}",status="404"}' in body
+        assert f"/autos/{auto['id']}/with-ventas" not in body
+        assert 'http_request_duration_seconds_bucket{method="GET",route="/autos/{auto_id}/with-ventas",le="+Inf"}' in body
+        assert "http_requests_in_flight" in body
+
+        queries = [line for line in body.splitlines()
+                   if line.startswith('http_request_db_queries_sum{method="GET",route="/autos/{auto_id}/with-ventas"}')]
+        assert queries and float(queries[0].split()[-1]) >= 1
+
+
+class TestBenchmarks:
+    """Test de humo del harness de benchmarks."""
+
+    def test_benchmark_run_and_compare(self, tmp_path):
+        """Test: El harness mide todos los escenarios sin errores y detecta regresiones."""
+        from benchmarks.run import compare, run_benchmarks
+
+        resultado = run_benchmarks(f"sqlite:///{tmp_path / 'bench.db'}", autos=200, ventas=400, requests=3, warmup=1)
+        escenarios = resultado["escenarios"]
+        assert "buscar_comprador" in escenarios and "batch_ventas" in escenarios
+        assert all(e["errores"] == 0 for e in escenarios.values())
+        assert compare(resultado, resultado, tolerancia=0.3) == []
+
+        peor = json.loads(json.dumps(resultado))
+        peor["escenarios"]["get_auto"]["p50_ms"] = escenarios["get_auto"]["p50_ms"] * 2 + 1
+        peor["escenarios"]["get_auto"]["queries_por_request"] += 1
+        assert len(compare(peor, resultado, tolerancia=0.3)) == 2
+
+
+class TestReadReplica:
+    """Tests del ruteo de lecturas a la réplica, con dos archivos SQLite como primaria y réplica."""
+
+    def test_reads_go_to_replica_except_after_writes(self, tmp_path, monkeypatch):
+        """Test: Los GET leen de la réplica salvo en la ventana posterior a una escritura del cliente."""
+        primaria = create_engine(f"sqlite:///{tmp_path / 'primaria.db'}")
+        replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+        SQLModel.metadata.create_all(primaria)
+        SQLModel.metadata.create_all(replica)
+        monkeypatch.setattr(database, "engine", primaria)
+        monkeypatch.setattr(database, "read_engine", replica)
+        cache.clear_all()
+        client = TestClient(create_app(async_db=False))
+
+        response = client.post("/autos/", json={"marca": "Toyota", "modelo": "Corolla", "año": 2020})
+        assert response.status_code == 201
+        assert "ultima_escritura" in response.cookies
+        auto_id = response.json()["id"]
+
+        # Dentro de la ventana de read-your-writes el listado sale de la primaria.
+        assert len(client.get("/autos/").json()) == 1
+
+        # Otro cliente (sin cookie) lee de la réplica, que todavía no recibió el alta.
+        otro = TestClient(client.app)
+        assert otro.get("/autos/").json() == []
+
+        # Cuando la réplica se pone al día, también lo ve.
+        with Session(primaria) as origen, Session(replica) as destino:
+            destino.add(Auto.model_validate(origen.get(Auto, auto_id).model_dump()))
+            destino.commit()
+        assert len(otro.get("/autos/").json()) == 1
+
+        # Una lectura atrasada de la réplica no queda en la caché que usa quien escribió.
+        client.put(f"/autos/{auto_id}", json={"modelo": "Yaris"})
+        assert otro.get(f"/autos/{auto_id}").json()["modelo"] == "Corolla"
+        assert client.get(f"/autos/{auto_id}").json()["modelo"] == "Yaris"
+        primaria.dispose()
+        replica.dispose()
+
+    def test_reads_fall_back_to_primary(self, client: TestClient):
+        """Test: Sin réplica configurada las lecturas usan la primaria."""
+        assert database.read_engine is None
+        auto = client.post("/autos/", json={"marca": "Fiat", "modelo": "Cronos", "año": 2021}).json()
+        client.cookies.clear()
+        assert client.get(f"/autos/{auto['id']}").status_code == 200
+
+
+class TestMigrations:
+    """Tests de las migraciones del esquema."""
+
+    def test_migration_matches_models(self, tmp_path):
+        """Test: Migrar una BD vacía deja el mismo esquema que los modelos, con índices y chasis único."""
+        url = f"sqlite:///{tmp_path / 'migrada.db'}"
+        cli.main(["migrar", "--url", url])
+        engine = create_engine(url)
+        with engine.connect() as connection:
+            contexto = MigrationContext.configure(connection, opts={
+                "include_object": lambda obj, name, *args: not search.is_search_object(name),
+            })
+            assert compare_metadata(contexto, SQLModel.metadata) == []
+        indices = {i["name"]: i for i in inspect(engine).get_indexes("auto")}
+        assert indices["ix_auto_numero_chasis"]["unique"]
+        assert {"ix_venta_auto_id", "ix_venta_fecha_venta"} <= {i["name"] for i in inspect(engine).get_indexes("venta")}
+        engine.dispose()
+
+    def test_migration_adopts_create_all_database(self, tmp_path):
+        """Test: Una BD creada con el esquema original (sin versión ni índices) se migra sin perder datos."""
+        url = f"sqlite:///{tmp_path / 'legacy.db'}"
+        engine = create_engine(url)
+        with engine.begin() as connection:
+            connection.execute(text(
+                'CREATE TABLE auto (marca VARCHAR NOT NULL, modelo VARCHAR NOT NULL, "año" INTEGER NOT NULL, '
+                "numero_chasis VARCHAR NOT NULL, id INTEGER NOT NULL PRIMARY KEY)"
+            ))
+            connection.execute(text(
+                "CREATE TABLE venta (nombre_comprador VARCHAR NOT NULL, precio FLOAT NOT NULL, "
+                "fecha_venta DATETIME NOT NULL, id INTEGER NOT NULL PRIMARY KEY, "
+                "auto_id INTEGER NOT NULL REFERENCES auto (id))"
+            ))
+            connection.execute(text("INSERT INTO auto VALUES ('Fiat', 'Cronos', 2020, 'ABC12345678901234', 1)"))
+            connection.execute(text("INSERT INTO venta VALUES ('Ana Gómez', 1000, '2024-05-01 10:00:00', 1, 1)"))
+
+        cli.main(["migrar", "--url", url])
+
+        with Session(engine) as session:
+            auto = session.get(Auto, 1)
+            assert auto.version == 1 and auto.updated_at.year > 1970
+            assert VentaRepository(session).count_by_modelo("Cronos") == 1
+            assert [v.id for v in VentaRepository(session).get_rows_by_comprador("Gómez", ["id"])] == [1]
+        engine.dispose()
+
+    def test_migration_adopts_current_create_all_database(self, tmp_path):
+        """Test: Una BD creada con `create_all` a partir de los modelos actuales se migra sin errores."""
+        url = f"sqlite:///{tmp_path / 'create_all.db'}"
+        engine = create_engine(url)
+        SQLModel.metadata.create_all(engine)
+
+        cli.main(["migrar", "--url", url])
+
+        with engine.connect() as connection:
+            assert connection.execute(text("SELECT count(*) FROM chasis_secuencia")).scalar_one() == 1
+            assert connection.execute(text("SELECT version_num FROM alembic_version")).scalar_one() == "0006"
+        engine.dispose()
+
+
+class TestSparseFields:
+    """Tests de `fields=` en los listados y de la compresión de respuestas."""
+
+    def test_list_autos_fields(self, client: TestClient, query_counter):
+        """Test: `fields=` recorta la respuesta y la consulta a las columnas pedidas."""
+        client.post("/autos/", json={"marca": "Fiat", "modelo": "Uno", "año": 2010})
+        query_counter.clear()
+        response = client.get("/autos/?fields=marca,id")
+        assert response.json() == [{"id": 1, "marca": "Fiat"}]
+        consulta = next(q for q in query_counter if q.lstrip().upper().startswith("SELECT"))
+        assert "numero_chasis" not in consulta and "modelo" not in consulta
+
+        assert client.get("/autos/?fields=precio").status_code == 400
+        assert response.headers["ETag"] != client.get("/autos/").headers["ETag"]
+
+    def test_list_ventas_fields_without_auto(self, client: TestClient, query_counter):
+        """Test: Sin campos del auto no hay JOIN ni objeto `auto` anidado."""
+        auto_id = client.post("/autos/", json={"marca": "Fiat", "modelo": "Uno", "año": 2010}).json()["id"]
+        client.post("/ventas/", json={"nombre_comprador": "Ana", "precio": 1000.0,
+                                      "fecha_venta": "2024-03-01T10:00:00", "auto_id": auto_id})
+        query_counter.clear()
+        assert client.get("/ventas/?fields=id,precio").json() == [{"id": 1, "precio": 1000.0}]
+        consulta = next(q for q in query_counter if q.lstrip().upper().startswith("SELECT"))
+        assert "JOIN" not in consulta.upper()
+
+        data = client.get("/ventas/?fields=precio,auto.marca").json()
+        assert data == [{"precio": 1000.0, "auto": {"marca": "Fiat"}}]
+        completo = client.get("/ventas/?fields=nombre_comprador,auto").json()[0]
+        assert set(completo["auto"]) == set(AutoRead.model_fields)
+        assert client.get("/ventas/?fields=auto.precio").status_code == 400
+
+    def test_compression_negotiation(self):
+        """Test: Se prefiere br si está disponible, respetando los pesos q de Accept-Encoding."""
+        assert compression.negotiate("gzip, deflate, br", brotli_available=True) == "br"
+        assert compression.negotiate("gzip, deflate, br", brotli_available=False) == "gzip"
+        assert compression.negotiate("br;q=0, gzip;q=0.5", brotli_available=True) == "gzip"
+        assert compression.negotiate("*", brotli_available=False) == "gzip"
+        assert compression.negotiate("identity", brotli_available=True) is None
+
+    def test_compresses_large_responses(self, client: TestClient):
+        """Test: Las respuestas que superan el umbral salen comprimidas; las chicas no."""
+        client.post("/autos/batch/", json=[{"marca": "Fiat", "modelo": f"Uno{i}", "año": 2010} for i in range(50)])
+        response = client.get("/autos/?limit=50", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["Vary"]
+        assert len(response.json()) == 50
+
+        response = client.get("/autos/?limit=1", headers={"Accept-Encoding": "gzip"})
+        assert "Content-Encoding" not in response.headers
+
+
+@pytest.fixture(name="feed")
+def feed_fixture(session: Session):
+    """Stream de cambios sobre la BD de test, con keepalive corto."""
+    return cambios.ChangeFeed(lambda: Session(session.get_bind()), keepalive=0.05)
+
+
+async def next_events(stream, cantidad: int) -> list:
+    """Los próximos eventos SSE del stream (sin los keepalive), como dicts id/event/data."""
+    eventos = []
+    while len(eventos) < cantidad:
+        chunk = await asyncio.wait_for(stream.__anext__(), 5)
+        if chunk.startswith(("id:", "event:")):
+            campos = dict(line.split(": ", 1) for line in chunk.strip().splitlines())
+            eventos.append({**campos, "data": json.loads(campos["data"])})
+    return eventos
+
+
+class TestCambios:
+    """Tests del stream de cambios de ventas (GET /ventas/stream)."""
+
+    @staticmethod
+    def _venta(auto_id: int, nombre: str) -> dict:
+        return {"nombre_comprador": nombre, "precio": 1000.0, "fecha_venta": "2024-03-01T10:00:00", "auto_id": auto_id}
+
+    def test_resume_from_last_event_id(self, client: TestClient, feed: cambios.ChangeFeed):
+        """Test: Con Last-Event-ID se reenvían desde el registro las altas, cambios y bajas posteriores."""
+        auto_id = client.post("/autos/", json={"marca": "Fiat", "modelo": "Uno", "año": 2010}).json()["id"]
+        ventas = client.post("/ventas/batch/", json=[self._venta(auto_id, f"C{i}") for i in range(3)]).json()
+        client.put(f"/ventas/{ventas[0]['id']}", json={"precio": 1500.0})
+        client.delete(f"/ventas/{ventas[1]['id']}")
+
+        async def leer(last_event_id):
+            stream = feed.events(last_event_id)
+            try:
+                return await next_events(stream, 5 - last_event_id)
+            finally:
+                await stream.aclose()
+
+        eventos = asyncio.run(leer(0))
+        assert [e["event"] for e in eventos] == ["creada"] * 3 + ["modificada", "eliminada"]
+        assert [e["id"] for e in eventos] == ["1", "2", "3", "4", "5"]
+        assert eventos[0]["data"]["precio"] == 1500.0
+        assert eventos[1]["data"] == eventos[4]["data"] == {"id": ventas[1]["id"]}
+        assert [e["id"] for e in asyncio.run(leer(3))] == ["4", "5"]
+
+    def test_live_events(self, client: TestClient, feed: cambios.ChangeFeed):
+        """Test: Un cliente conectado recibe las altas que se confirman después."""
+        auto_id = client.post("/autos/", json={"marca": "Fiat", "modelo": "Uno", "año": 2010}).json()["id"]
+
+        async def escuchar():
+            stream = feed.events()
+            try:
+                await stream.__anext__()
+                await run_in_threadpool(client.post, "/ventas/", json=self._venta(auto_id, "Ana"))
+                return await next_events(stream, 1)
+            finally:
+                await stream.aclose()
+
+        (evento,) = asyncio.run(escuchar())
+        assert evento["event"] == "creada" and evento["data"]["nombre_comprador"] == "Ana"
+
+    def test_slow_subscriber_catches_up(self, client: TestClient, session: Session):
+        """Test: Si se desborda la cola de un cliente, se pone al día leyendo el registro, sin perder eventos."""
+        auto_id = client.post("/autos/", json={"marca": "Fiat", "modelo": "Uno", "año": 2010}).json()["id"]
+        client.post("/ventas/batch/", json=[self._venta(auto_id, f"C{i}") for i in range(2)])
+        broker = cambios.ChangeBroker(maxsize=2)
+        feed = cambios.ChangeFeed(lambda: Session(session.get_bind()), broker=broker, keepalive=0.05)
+
+        async def escuchar():
+            stream = feed.events()
+            try:
+                await stream.__anext__()
+                await asyncio.wait_for(stream.__anext__(), 5)  # primer keepalive: ya está suscripto
+                await run_in_threadpool(client.post, "/ventas/batch/",
+                                        json=[self._venta(auto_id, f"D{i}") for i in range(5)])
+                broker.publish([(event_id, 0, cambios.CREADA) for event_id in range(3, 8)])
+                return await next_events(stream, 5)
+            finally:
+                await stream.aclose()
+
+        eventos = asyncio.run(escuchar())
+        assert [e["data"]["nombre_comprador"] for e in eventos] == [f"D{i}" for i in range(5)]
+
+    def test_pruned_history_requests_reset(self, client: TestClient, session: Session, feed: cambios.ChangeFeed):
+        """Test: Si los eventos posteriores a Last-Event-ID ya se podaron, se avisa con `reinicio`."""
+        auto_id = client.post("/autos/", json={"marca": "Fiat", "modelo": "Uno", "año": 2010}).json()["id"]
+        client.post("/ventas/batch/", json=[self._venta(auto_id, f"C{i}") for i in range(3)])
+        assert cambios.prune(session, horas=-1) == 3
+        session.commit()
+        client.post("/ventas/", json=self._venta(auto_id, "Ana"))
+
+        async def leer():
+            stream = feed.events(1)
+            try:
+                return await next_events(stream, 2)
+            finally:
+                await stream.aclose()
+
+        reinicio, evento = asyncio.run(leer())
+        assert reinicio["event"] == "reinicio"
+        assert evento["id"] == "4" and evento["data"]["nombre_comprador"] == "Ana"
+
+
+class TestParticiones:
+    """Tests del particionado mensual de ventas (la conversión en sí requiere PostgreSQL)."""
+
+    def test_partition_ranges(self):
+        """Test: Nombres y rangos de las particiones mensuales."""
+        assert particiones.add_months(date(2024, 11, 1), 3) == date(2025, 2, 1)
+        assert particiones.partition_name(date(2025, 2, 1)) == "venta_p2025_02"
+        assert particiones.partition_month("venta_p2025_02") == date(2025, 2, 1)
+        assert particiones.partition_month(particiones.DEFAULT_PARTITION) is None
+        assert particiones.partition_ddl(date(2024, 12, 1)) == (
+            "CREATE TABLE IF NOT EXISTS venta_p2024_12 PARTITION OF venta "
+            "FOR VALUES FROM ('2024-12-01') TO ('2025-01-01')"
+        )
+
+    def test_move_from_default_partition(self):
+        """Test: Un mes con ventas en venta_default se crea separando, moviendo y readjuntando la default."""
+        assert particiones.move_from_default_ddl(date(2025, 3, 1)) == [
+            "ALTER TABLE venta DETACH PARTITION venta_default",
+            particiones.partition_ddl(date(2025, 3, 1)),
+            "INSERT INTO venta SELECT * FROM venta_default "
+            "WHERE fecha_venta >= '2025-03-01' AND fecha_venta < '2025-04-01'",
+            "DELETE FROM venta_default WHERE fecha_venta >= '2025-03-01' AND fecha_venta < '2025-04-01'",
+            "ALTER TABLE venta ATTACH PARTITION venta_default DEFAULT",
+        ]
+
+    def test_cli_requires_postgresql(self, tmp_path):
+        """Test: Los comandos de particiones fallan con un mensaje claro fuera de PostgreSQL."""
+        with pytest.raises(SystemExit, match="PostgreSQL"):
+            cli.main(["crear-particiones"])
+        with pytest.raises(SystemExit):
+            cli.main(["archivar-particiones", "--antes", "2024-13"])
+
+
+class TestChasis:
+    """Tests del asignador de números de chasis."""
+
+    def test_vin_check_digit(self):
+        """Test: Dígito verificador ISO 3779 y VINs generados válidos."""
+        assert is_valid_vin("1M8GDM9AXKP042788")
+        assert not is_valid_vin("1M8GDM9A1KP042788")
+        vin = build_vin(123456, 2024)
+        assert is_valid_vin(vin) and vin[9] == "R"
+        assert build_vin(123457, 2024) != vin
+
+    def test_create_auto_without_chasis_lookup(self, client: TestClient, query_counter):
+        """Test: El alta genera un VIN válido sin consultar si el chasis existe."""
+        response = client.post("/autos/", json={"marca": "Fiat", "modelo": "Cronos", "año": 2022})
+        assert response.status_code == 201
+        assert is_valid_vin(response.json()["numero_chasis"])
+        assert not [q for q in query_counter if q.lstrip().upper().startswith("SELECT")]
+
+    def test_collision_retries_with_new_block(self, client: TestClient, session: Session):
+        """Test: Si la secuencia quedó atrás de los datos, el índice único rechaza el chasis y se reintenta."""
+        primero = client.post("/autos/", json={"marca": "Fiat", "modelo": "Uno", "año": 2010}).json()
+        session.get(ChasisSecuencia, "auto").siguiente = 1
+        session.commit()
+        chasis_allocator.discard()
+
+        response = client.post("/autos/", json={"marca": "Fiat", "modelo": "Palio", "año": 2010})
+        assert response.status_code == 201
+        assert response.json()["numero_chasis"] != primero["numero_chasis"]
+        assert len(client.get("/autos/").json()) == 2
+
+    def test_copy_collision_retries_with_new_block(self, monkeypatch):
+        """Test: Con COPY (psycopg2) la colisión de chasis llega como IntegrityError y también se reintenta."""
+
+        class Error(Exception):
+            pass
+
+        class IntegrityError(Error):
+            pass
+
+        class UniqueViolation(IntegrityError):
+            pass
+
+        copias, eventos = [], []
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc_info):
+                return False
+
+            def copy_expert(self, sql, buffer):
+                copias.append(buffer.read())
+                if len(copias) == 1:
+                    raise UniqueViolation('duplicate key value violates unique constraint "ix_auto_numero_chasis"')
+
+        dialect = SimpleNamespace(
+            driver="psycopg2", dbapi=SimpleNamespace(Error=Error), dbapi_exception_translation_map={},
+            identifier_preparer=SimpleNamespace(quote=lambda name: f'"{name}"'),
+        )
+        session = SimpleNamespace(
+            get_bind=lambda: SimpleNamespace(dialect=dialect),
+            connection=lambda: SimpleNamespace(connection=SimpleNamespace(cursor=Cursor)),
+            commit=lambda: eventos.append("commit"),
+            rollback=lambda: eventos.append("rollback"),
+        )
+        numeros = iter(range(1, 100))
+        monkeypatch.setattr(chasis_allocator, "allocate", lambda session, años: [build_vin(next(numeros), a) for a in años])
+        monkeypatch.setattr(chasis_allocator, "discard", lambda: eventos.append("discard"))
+
+        AutoRepository(session).bulk_load([AutoCreate(marca="Fiat", modelo="Uno", año=2010)])
+        assert eventos == ["rollback", "discard", "commit"]
+        assert build_vin(1, 2010) in copias[0] and build_vin(2, 2010) in copias[1]
+
+    def test_allocators_share_sequence(self, session: Session):
+        """Test: Dos procesos (asignadores) reservan bloques distintos y no repiten números."""
+        a, b = ChasisAllocator(block_size=10), ChasisAllocator(block_size=10)
+        numeros = []
+        for _ in range(5):
+            numeros += a.allocate(session, [2020] * 7) + b.allocate(session, [2021] * 7)
+        assert len(set(numeros)) == 70
+        assert all(is_valid_vin(numero) for numero in numeros)
+
+
+class TestValidation:
+    """Tests de la validación de lotes completos."""
+
+    def test_validate_batch_collects_all_errors(self):
+        """Test: Todos los ítems inválidos se informan en una pasada, con su índice."""
+        items = [{"marca": "Fiat", "modelo": f"Uno{i}", "año": 2010} for i in range(5)]
+        items[1]["año"] = 1800
+        items[3] = {"marca": "Fiat"}
+        validos, errores = validate_batch(AutoCreate, items)
+        assert [indice for indice, _ in validos] == [0, 2, 4]
+        assert all(isinstance(auto, AutoCreate) for _, auto in validos)
+        assert sorted(errores) == [1, 3]
+        assert {e["loc"][1] for e in errores[3]} == {"modelo", "año"}
+
+    def test_context_now_is_shared(self):
+        """Test: Los validadores usan el "ahora" del contexto y no la hora de cada ítem."""
+        item = {"nombre_comprador": "Pérez", "precio": 100, "fecha_venta": "2020-06-01T10:00:00", "auto_id": 1}
+        antes = validation_context(datetime(2020, 5, 1).astimezone())
+        validos, errores = validate_batch(VentaCreate, [item], antes)
+        assert not validos and list(errores) == [0]
+        validos, errores = validate_batch(VentaCreate, [item])
+        assert [indice for indice, _ in validos] == [0] and not errores
+
+    def test_batch_endpoint_reports_every_item(self, client: TestClient):
+        """Test: El alta masiva rechaza el lote con los errores de todos los ítems."""
+        payload = [
+            {"marca": "VW", "modelo": "Gol", "año": 2015},
+            {"marca": "VW", "modelo": "Up", "año": 3000},
+            {"marca": "VW", "año": 2015},
+        ]
+        response = client.post("/autos/batch/", json=payload)
+        assert response.status_code == 422
+        assert [e["loc"][:2] for e in response.json()["detail"]] == [["body", 1], ["body", 2]]
+        assert client.get("/autos/").json() == []
+
+        response = client.post("/autos/batch/?parcial=true", json=payload)
+        assert response.status_code == 201
+        data = response.json()
+        assert [auto["modelo"] for auto in data["creados"]] == ["Gol"]
+        assert [error["indice"] for error in data["errores"]] == [1, 2]
+        assert data["errores"][1]["detalle"].startswith("modelo:")
+
+    def test_ventas_batch_merges_validation_and_auto_errors(self, client: TestClient):
+        """Test: Con `parcial`, los errores de validación y los autos inexistentes salen ordenados por índice."""
+        auto_id = client.post("/autos/", json={"marca": "Kia", "modelo": "Rio", "año": 2018}).json()["id"]
+        ayer = (datetime.now() - timedelta(days=1)).isoformat()
+        payload = [
+            {"nombre_comprador": "Pérez", "precio": 100, "fecha_venta": ayer, "auto_id": 999},
+            {"nombre_comprador": "Gómez", "precio": -1, "fecha_venta": ayer, "auto_id": auto_id},
+            {"nombre_comprador": "López", "precio": 100, "fecha_venta": ayer, "auto_id": auto_id},
+        ]
+        response = client.post("/ventas/batch/?parcial=true", json=payload)
+        assert response.status_code == 201
+        data = response.json()
+        assert [venta["nombre_comprador"] for venta in data["creadas"]] == ["López"]
+        assert [error["indice"] for error in data["errores"]] == [0, 1]
+
+        assert client.post("/ventas/batch/?async=true&parcial=true", json=payload).status_code == 422
+
+    def test_import_reports_line_numbers(self, client: TestClient):
+        """Test: El import valida cada bloque como lote y reporta las filas inválidas por número de línea."""
+        contenido = "\n".join(json.dumps(item) for item in [
+            {"marca": "Ford", "modelo": "Ka", "año": 2012},
+            {"marca": "Ford", "modelo": "Fiesta", "año": 1800},
+            {"marca": "Ford", "modelo": "Focus", "año": 2014},
+        ])
+        data = client.post("/autos/import", content=contenido.encode()).json()
+        assert data["filas_insertadas"] == 2
+        assert [error["linea"] for error in data["errores"]] == [2]